@@ -1,32 +1,18 @@
-import numpy as np
 import matplotlib.pyplot as plt
 from reader import extract
+from graphic.framebuffer import FrameBuffer
+from graphic.multiview import render_views
 from graphic.visualization import Visualization
 from spaces.local_space import LocalSpace
 from spaces.world_space import WorldSpace, Camera
 from PIL import Image
-from time import time
+from stats import profiler
 import os
-
-
-def render_with_shaders(world_space, visual_model, img):
-    buffer = np.array(np.ones((visual_model.height, visual_model.width)) * -np.inf)
-    for obj in world_space.objs:
-        model_view = world_space.model_matrix()
-        if world_space.camera.type_camera == 0:
-            camera_matrix = world_space.orthographic_matrix()
-        else:
-            camera_matrix = world_space.perspective_matrix()
-        obj.data['old_vertexes'] = np.zeros((len(obj.data['vertexes']), 4))
-        data_face = {}
-        for i in range(len(obj.data['edges'])):
-            print(i)
-            data_face['new_vertexes'], data_face['new_normals'], data_face['vertexes_before_ndc'] \
-                = world_space.vertex_shader(obj, model_view, camera_matrix, i)
-            visual_model.fill_triangle(obj, data_face, i, buffer, img)
+import sys
 
 
 if __name__ == '__main__':
+    profiler.enable()  # замеры этапов конвейера, начиная с загрузки моделей
     size = (512, 512)
     path = '../models'
     b = os.path.join(path,'floor.obj')
@@ -39,7 +25,6 @@ if __name__ == '__main__':
     floor_tex = Image.open('../models/floor_diffuse.tga')
     yoda = 'yoda.obj'
     name_file = a
-    img = np.zeros(shape=(size[0] + 1, size[1] + 1, 3)).astype(np.uint8)
     face = LocalSpace(a, size=200, position=[0, 270, 0])
     floor = LocalSpace(b, size=200, position=[0, 100, 0])
     eye = LocalSpace(d, size=200, position=[0, 300, 0])
@@ -59,12 +44,21 @@ if __name__ == '__main__':
     objs = [stormtrooper]
     colors = [storm_tex]
     cam = camera
-    WS = WorldSpace(objs, cam)
-    s = time()
+    WS = WorldSpace(objs, cam, size)
+    frame = FrameBuffer(WS.buffer_size)
     # WS.pipeline_for_obj()
-    vis = Visualization(img, objs, colors, cam.camera_position, type_shadows=0, type_model=1)
-    render_with_shaders(WS, vis, img)
+    vis = Visualization(frame.image, objs, colors, cam.camera_position, type_shadows=0, type_model=1)
+    if len(sys.argv) > 1:
+        # python main.py <папка>: сцена рисуется со всех камер параллельно, каждый вид сразу пишется в файл
+        views = {'camera': camera, 'front': cam_front, 'top': cam_top, 'bot': cam_bot, 'right': cam_right,
+                 'left': cam_left, 'back': cam_back, 'orth': cam_orth}
+        render_views(WS, vis, list(views.values()), os.path.join(sys.argv[1], '{name}.png'), names=list(views),
+                     callback=lambda name, file_path: print(name, '->', file_path))
+        sys.exit()
+    # кадр очищается на месте; вершинный этап берется из кэша WorldSpace, треугольники растеризуются группами
+    vis.render(WS, frame)
     # vis.show()
-    print(time() - s)
-    plt.imshow(np.rot90(img), cmap="gray", interpolation="none")
+    # render сам завершает кадр профилирования: времена этапов, счетчики и перерисовка
+    print(profiler.PROFILER.to_json(profiler.PROFILER.frames[-1]))
+    plt.imshow(frame.pixels, cmap="gray", interpolation="none")
     plt.show()
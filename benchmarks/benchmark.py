@@ -0,0 +1,263 @@
+"""
+Замеры производительности конвейера на моделях из models и на сгенерированных сферах разного размера.
+
+Запуск из корня репозитория:
+    python benchmarks/benchmark.py --save benchmarks/baseline.json
+    python benchmarks/benchmark.py --baseline benchmarks/baseline.json --tolerance 0.25
+Во втором случае результаты сравниваются с сохраненными, и при замедлении больше допуска скрипт завершается
+с кодом 1.
+    python benchmarks/benchmark.py --check-backends --quick --size 128 128
+рисует замеры и сцену из нескольких экземпляров модели обоими backend и завершается с кодом 1, если изображения
+различаются.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tracemalloc
+from itertools import product
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from PIL import Image
+from graphic.framebuffer import FrameBuffer
+from graphic.visualization import Visualization
+from spaces.local_space import LocalSpace
+from spaces.mesh import Mesh
+from spaces.world_space import WorldSpace, Camera
+from stats import profiler
+
+MODELS = {'face': ('face.obj', 'african_head_diffuse.tga'), 'storm': ('BRBC.obj', 'BRBC_tex.PNG'),
+          'eye': ('eye_model.obj', 'eye_tex.tga'), 'floor': ('floor.obj', 'floor_diffuse.tga')}
+# количество параллелей сгенерированных сфер (треугольников примерно 4 * rings^2)
+SPHERE_RINGS = (16, 32, 64, 128, 256)
+POSITION = (0, 300, 0)
+
+
+def sphere_mesh(rings):
+    """
+    Данная функция строит UV-сферу единичного радиуса с rings параллелями и 2 * rings меридианами
+    :return: объект Mesh
+    """
+    theta = np.linspace(0, np.pi, rings + 1)
+    phi = np.linspace(0, 2 * np.pi, 2 * rings + 1)
+    t, p = np.meshgrid(theta, phi, indexing='ij')
+    vertexes = np.stack([np.sin(t) * np.cos(p), np.cos(t), np.sin(t) * np.sin(p)], axis=-1).reshape(-1, 3)
+    textures = np.stack([p / (2 * np.pi), 1 - t / np.pi], axis=-1).reshape(-1, 2)
+    index = np.arange((rings + 1) * (2 * rings + 1)).reshape(rings + 1, 2 * rings + 1)
+    a, b = index[:-1, :-1].ravel(), index[:-1, 1:].ravel()
+    c, d = index[1:, :-1].ravel(), index[1:, 1:].ravel()
+    edges = np.concatenate([np.stack([a, c, b], axis=1), np.stack([b, c, d], axis=1)])
+    return Mesh(vertexes, textures, vertexes, edges, edges, edges)
+
+
+def cameras(target):
+    """
+    Данная функция возвращает перспективную и ортографическую камеры, смотрящие на target
+    """
+    position = np.array(target) + [0, 30, 500]
+    return {'persp': Camera(position, target),
+            'orth': Camera(position, target, type_camera=0, width_view=(250, -250), height_view=(250, -250))}
+
+
+def measure(obj, texture, camera, settings, size, repeats):
+    """
+    Данная функция замеряет отрисовку одного объекта. В каждом кадре объект немного поворачивается, поэтому
+    вершинный этап и отсечение выполняются заново, как при анимации. Время кадра - лучшее из repeats замеров,
+    оно меньше всего зависит от других процессов.
+    :param settings: параметры Visualization
+    :return: словарь с результатами
+    """
+    world = WorldSpace([obj], camera, size)
+    frame = FrameBuffer(world.buffer_size)
+    vis = Visualization(frame.image, [obj], [texture], camera.camera_position, **settings)
+
+    def render(step):
+        obj.rotate_y(1e-3 if step % 2 else -1e-3)
+        vis.render(world, frame)
+
+    render(0)  # прогрев: кэши моделей, BVH, текстуры
+    profiler.enable(history=1)
+    render(1)
+    counters = profiler.PROFILER.frames[-1]['counters']
+    profiler.disable()
+
+    times = []
+    for step in range(repeats):
+        start = perf_counter()
+        render(step)
+        times.append(perf_counter() - start)
+    seconds = min(times)
+
+    tracemalloc.start()
+    render(0)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'ms_per_frame': seconds * 1e3,
+            'triangles': counters.get('triangles_rasterized', 0),
+            'fragments': counters.get('fragments_tested', 0),
+            'triangles_per_s': counters.get('triangles_rasterized', 0) / seconds,
+            'fragments_per_s': counters.get('fragments_tested', 0) / seconds,
+            'peak_memory_mb': peak / 2 ** 20}
+
+
+def cases(quick):
+    """
+    Данная функция перечисляет замеры: (имя, функция создания объекта и текстуры, камера, параметры Visualization)
+    """
+    models = os.path.join(ROOT, 'models')
+    loaded = {}
+
+    def model(name):
+        def create():
+            if name not in loaded:
+                file_name, texture = MODELS[name]
+                loaded[name] = (Mesh.from_file(os.path.join(models, file_name)),
+                                Image.open(os.path.join(models, texture)))
+            mesh, texture = loaded[name]
+            return LocalSpace(mesh, size=200, position=POSITION), texture
+        return create
+
+    type_models = (2,) if quick else (0, 1, 2)
+    type_shadows = (1,) if quick else (0, 1, 2)
+    for name, tm, ts, camera, texture in product(MODELS, type_models, type_shadows, ('persp', 'orth'), (True, False)):
+        settings = {'type_model': tm, 'type_shadows': ts, 'texture': texture}
+        yield '%s/model%d/shadows%d/%s/%s' % (name, tm, ts, camera, 'tex' if texture else 'notex'), \
+            model(name), camera, settings
+
+    for rings in SPHERE_RINGS[:3] if quick else SPHERE_RINGS:
+        def create(rings=rings):
+            return LocalSpace(sphere_mesh(rings), size=150, position=POSITION), None
+        yield 'sphere%d/model2/shadows1/persp/notex' % (4 * rings * rings), create, 'persp', \
+            {'type_model': 2, 'type_shadows': 1, 'texture': False}
+
+
+def run(quick=False, size=(512, 512), repeats=7, select=None, backend='numpy'):
+    """
+    Данная функция выполняет все замеры
+    :param select: подстрока имени замера, по которой выбираются замеры
+    :param backend: backend Visualization ('numpy', 'numba', 'auto')
+    :return: словарь с описанием окружения и результатами
+    """
+    results = {}
+    for name, create, camera, settings in cases(quick):
+        if select and select not in name:
+            continue
+        obj, texture = create()
+        results[name] = measure(obj, texture, cameras(POSITION)[camera], dict(settings, backend=backend), size,
+                                repeats)
+        print('%-45s %9.1f ms %12.0f tri/s %14.0f frag/s %8.1f MB' % (
+            name, results[name]['ms_per_frame'], results[name]['triangles_per_s'],
+            results[name]['fragments_per_s'], results[name]['peak_memory_mb']))
+    meta = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'processor': platform.processor(), 'size': list(size), 'repeats': repeats,
+            'backend': backend}
+    return {'meta': meta, 'results': results}
+
+
+def check_backends(quick=False, size=(512, 512), select=None):
+    """
+    Данная функция рисует каждый замер и сцену из трех экземпляров модели на полу backend 'numpy' и 'numba'
+    и сравнивает изображения, которые должны совпадать до пикселя. Без numba ядра выполняются как обычные
+    функции Python (медленно, но с тем же результатом), поэтому проверку можно запускать и без неё.
+    :param select: подстрока имени замера, по которой выбираются замеры
+    :return: список строк с описанием расхождений
+    """
+    models = os.path.join(ROOT, 'models')
+    storm = Mesh.from_file(os.path.join(models, MODELS['storm'][0]))
+    storm_texture = Image.open(os.path.join(models, MODELS['storm'][1]))
+
+    def instances():
+        objs = [LocalSpace(storm, size=120, position=(x, 300, -abs(x)), rot_y=x / 5) for x in (-150, 0, 150)]
+        objs.append(LocalSpace(os.path.join(models, MODELS['floor'][0]), size=300, position=(0, 180, 0)))
+        return objs, [storm_texture] * 3 + [Image.open(os.path.join(models, MODELS['floor'][1]))]
+
+    scenes = [(name, lambda create=create: tuple([item] for item in create()), camera, settings)
+              for name, create, camera, settings in cases(quick)]
+    for tm, ts, texture in product((2,) if quick else (0, 1, 2), (0, 1, 2), (True, False)):
+        scenes.append(('instances/model%d/shadows%d/persp/%s' % (tm, ts, 'tex' if texture else 'notex'), instances,
+                       'persp', {'type_model': tm, 'type_shadows': ts, 'texture': texture}))
+    mismatches = []
+    for name, create, camera, settings in scenes:
+        if select and select not in name:
+            continue
+        objs, textures = create()
+        camera = cameras(POSITION)[camera]
+        images = []
+        for backend in ('numpy', 'numba'):
+            world = WorldSpace(objs, camera, size)
+            frame = FrameBuffer(world.buffer_size)
+            vis = Visualization(frame.image, objs, textures, camera.camera_position, **settings)
+            vis.backend = backend  # без numba ядра выполняются как функции Python
+            vis.render(world, frame)
+            images.append(frame.pixels.copy())
+        differ = (images[0] != images[1]).any(axis=2)
+        print('%-45s %s' % (name, 'ok' if not differ.any() else '%d pixels differ' % differ.sum()))
+        if differ.any():
+            diff = np.abs(images[0].astype(int) - images[1]).max()
+            mismatches.append('%s: %d pixels, max channel diff %d' % (name, differ.sum(), diff))
+    return mismatches
+
+
+def compare(current, baseline, tolerance):
+    """
+    Данная функция сравнивает замеры с сохраненными: замер считается ухудшением, если время кадра или пиковая
+    память выросли больше чем в (1 + tolerance) раз
+    :return: список строк с описанием ухудшений
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        for key in ('ms_per_frame', 'peak_memory_mb'):
+            ratio = result[key] / old[key] if old[key] else 1.
+            if ratio > 1 + tolerance:
+                regressions.append('%s: %s %.2f -> %.2f (x%.2f)' % (name, key, old[key], result[key], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры производительности отрисовки')
+    parser.add_argument('--save', help='сохранить результаты в JSON')
+    parser.add_argument('--baseline', help='сравнить с результатами из JSON')
+    parser.add_argument('--tolerance', type=float, default=.25, help='допустимое относительное замедление')
+    parser.add_argument('--quick', action='store_true', help='сокращенный набор замеров')
+    parser.add_argument('--repeats', type=int, default=7, help='количество замеряемых кадров')
+    parser.add_argument('--select', help='подстрока имени замера')
+    parser.add_argument('--size', type=int, nargs=2, default=(512, 512), help='размеры экрана')
+    parser.add_argument('--backend', default='numpy', choices=('numpy', 'numba', 'auto'), help='backend отрисовки')
+    parser.add_argument('--check-backends', action='store_true',
+                        help='сравнить изображения backend numpy и numba вместо замеров')
+    args = parser.parse_args()
+
+    if args.check_backends:
+        mismatches = check_backends(args.quick, tuple(args.size), args.select)
+        for line in mismatches:
+            print('MISMATCH', line)
+        if mismatches:
+            sys.exit(1)
+        print('backends match')
+        return
+
+    current = run(args.quick, tuple(args.size), args.repeats, args.select, args.backend)
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(current, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(current, baseline, args.tolerance)
+        for line in regressions:
+            print('REGRESSION', line)
+        if regressions:
+            sys.exit(1)
+        print('no regressions (tolerance %.0f%%)' % (args.tolerance * 100))
+
+
+if __name__ == '__main__':
+    main()
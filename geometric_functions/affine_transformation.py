@@ -1,3 +1,4 @@
+import itertools
 import numpy as np
 
 
@@ -5,70 +6,193 @@ def vertexes_to_projective(vertexes):
     return np.concatenate([vertexes.copy(), np.ones(vertexes.shape[0]).reshape(-1, 1)], axis=1)
 
 
-def parallel_translation(coord_matrix, t, for_normal=False):
-    shift_matrix = np.array([
+def translation_matrix(t):
+    return np.array([
         [1, 0, 0, t[0]],
         [0, 1, 0, t[1]],
         [0, 0, 1, t[2]],
         [0, 0, 0, 1]
-    ])
-    if for_normal:
-        return np.dot(np.linalg.inv(shift_matrix).T, coord_matrix.T).T
-    else:
-        return np.dot(shift_matrix, coord_matrix.T).T
-
-
-def rotate_z(alpha, coord_matrix, for_normal=False):
-    turn_matrix = np.array([[np.cos(2*np.pi - alpha), -np.sin(2*np.pi - alpha), 0, 0],
-                            [np.sin(2*np.pi - alpha), np.cos(2*np.pi - alpha), 0, 0],
-                            [0, 0, 1, 0],
-                            [0, 0, 0, 1]
-                            ])
+    ], dtype=np.float64)
 
-    if for_normal:
-        return np.dot(np.linalg.inv(turn_matrix).T, coord_matrix.T).T
-    else:
-        return np.dot(turn_matrix, coord_matrix.T).T
 
+def rotation_z_matrix(alpha):
+    return np.array([[np.cos(2*np.pi - alpha), -np.sin(2*np.pi - alpha), 0, 0],
+                     [np.sin(2*np.pi - alpha), np.cos(2*np.pi - alpha), 0, 0],
+                     [0, 0, 1, 0],
+                     [0, 0, 0, 1]
+                     ])
 
-def rotate_y(alpha, coord_matrix, for_normal=False):
-    turn_matrix = np.array([[np.cos(2*np.pi - alpha), 0, np.sin(2*np.pi - alpha), 0],
-                            [0, 1, 0, 0],
-                            [-np.sin(2*np.pi - alpha), 0, np.cos(2*np.pi - alpha), 0],
-                            [0, 0, 0, 1]
-                            ])
 
-    if for_normal:
-        return np.dot(np.linalg.inv(turn_matrix).T, coord_matrix.T).T
-    else:
-        return np.dot(turn_matrix, coord_matrix.T).T
+def rotation_y_matrix(alpha):
+    return np.array([[np.cos(2*np.pi - alpha), 0, np.sin(2*np.pi - alpha), 0],
+                     [0, 1, 0, 0],
+                     [-np.sin(2*np.pi - alpha), 0, np.cos(2*np.pi - alpha), 0],
+                     [0, 0, 0, 1]
+                     ])
 
 
-def rotate_x(alpha, coord_matrix, for_normal=False):
-    turn_matrix = np.array([[1, 0, 0, 0],
-                            [0, np.cos(2*np.pi - alpha), -np.sin(2*np.pi - alpha), 0],
-                            [0, np.sin(2*np.pi - alpha), np.cos(2*np.pi - alpha), 0],
-                            [0, 0, 0, 1]
-                            ])
+def rotation_x_matrix(alpha):
+    return np.array([[1, 0, 0, 0],
+                     [0, np.cos(2*np.pi - alpha), -np.sin(2*np.pi - alpha), 0],
+                     [0, np.sin(2*np.pi - alpha), np.cos(2*np.pi - alpha), 0],
+                     [0, 0, 0, 1]
+                     ])
 
-    if for_normal:
-        return np.dot(np.linalg.inv(turn_matrix).T, coord_matrix.T).T
-    else:
-        return np.dot(turn_matrix, coord_matrix.T).T
 
-
-def scaling(coord_matrix, size, for_normal=False):
-    scal_matrix = np.array([
+def scaling_matrix(size):
+    return np.array([
         [size[0], 0, 0, 0],
         [0, size[1], 0, 0],
         [0, 0, size[2], 0],
         [0, 0, 0, 1]
-    ])
-    if for_normal:
-        return np.dot(np.linalg.inv(scal_matrix).T, coord_matrix.T).T
-    else:
+    ], dtype=np.float64)
+
+
+class Transform:
+    # общий счетчик версий: любое изменение любого преобразования дает новую версию
+    __versions = itertools.count()
+
+    def __init__(self, position=(0, 0, 0), rotation=(0, 0, 0), scale=(1, 1, 1), pivot=(0, 0, 0)):
+        """
+        Данный класс хранит перенос, поворот и масштаб объекта и лениво собирает из них одну матрицу модели
+        model = W * T(position) * Rz * Ry * Rx * S * T(-pivot), а также матрицу для нормалей (обратную
+        транспонированную). W - преобразования в мировых координатах, добавленные функцией compose (повороты
+        и масштаб относительно начала координат, переносы), они применяются по порядку вызовов.
+        Обе матрицы (и матрица T * R * S без W) кэшируются до изменения любого из параметров, при изменении
+        увеличивается version, по которой WorldSpace понимает, что матрицы объекта нужно пересчитать.
+        :param position: тройка чисел, куда переносится точка pivot
+        :param rotation: углы поворота относительно осей X, Y, Z в радианах
+        :param scale: число или тройка чисел, которые говорят во сколько раз увеличить
+        :param pivot: точка объекта, относительно которой выполняются масштаб и поворот
+        """
+        self.__local = None
+        self.__model = None
+        self.__normal = None
+        self.__world = np.eye(4)  # W для вершин
+        self.__world_normals = np.eye(4)  # W для нормалей (только преобразования, добавленные с with_normals)
+        self.__normals_differ = False  # True, если W для нормалей не совпадает с W для вершин
+        self.position = position
+        self.rotation = rotation
+        self.scale = scale
+        self.pivot = pivot
+
+    @property
+    def position(self):
+        return self.__position
+
+    @position.setter
+    def position(self, value):
+        self.__position = np.array(value, dtype=np.float64)
+        self.__reset()
+
+    @property
+    def rotation(self):
+        return self.__rotation
+
+    @rotation.setter
+    def rotation(self, value):
+        self.__rotation = np.array(value, dtype=np.float64)
+        self.__reset()
+
+    @property
+    def scale(self):
+        return self.__scale
+
+    @scale.setter
+    def scale(self, value):
+        self.__scale = np.array(value if np.ndim(value) else [value, value, value], dtype=np.float64)
+        self.__reset()
+
+    @property
+    def pivot(self):
+        return self.__pivot
+
+    @pivot.setter
+    def pivot(self, value):
+        self.__pivot = np.array(value, dtype=np.float64)
+        self.__reset()
+
+    def __reset(self):
+        self.__local = None
+        self.__model = None
+        self.__normal = None
+        self.version = next(Transform.__versions)
+
+    def compose(self, matrix, with_normals=True):
+        """
+        Данная функция добавляет преобразование в мировых координатах после всех предыдущих: повторные вызовы
+        складываются так же, как последовательные умножения вершин на матрицы
+        :param matrix: матрица (4, 4) преобразования
+        :param with_normals: True - преобразование применяется также к нормалям
+        """
+        self.__world = matrix @ self.__world
+        if with_normals:
+            self.__world_normals = matrix @ self.__world_normals
+        else:
+            self.__normals_differ = True
+        self.__reset()
+
+    def __local_matrix(self):
+        if self.__local is None:
+            self.__local = translation_matrix(self.position) @ rotation_z_matrix(self.rotation[2]) \
+                @ rotation_y_matrix(self.rotation[1]) @ rotation_x_matrix(self.rotation[0]) \
+                @ scaling_matrix(self.scale) @ translation_matrix(-self.pivot)
+        return self.__local
+
+    def model_matrix(self):
+        """
+        Данная функция возвращает матрицу модели (собирается один раз до изменения параметров)
+        """
+        if self.__model is None:
+            self.__model = self.__world @ self.__local_matrix()
+        return self.__model
+
+    def normal_matrix(self):
+        """
+        Данная функция возвращает обратную транспонированную матрицу модели для преобразования нормалей
+        (без преобразований, добавленных функцией compose с with_normals=False); собирается из кэшированной
+        матрицы модели той же версии
+        """
+        if self.__normal is None:
+            model = self.__world_normals @ self.__local_matrix() if self.__normals_differ else self.model_matrix()
+            self.__normal = np.linalg.inv(model).T
+        return self.__normal
+
+    def apply(self, coord_matrix):
+        """
+        Данная функция переводит массив вершин в проективных координатах за одно умножение
+        """
+        return np.dot(self.model_matrix(), coord_matrix.T).T
+
+    def apply_normals(self, coord_matrix):
+        """
+        Данная функция переводит массив нормалей в проективных координатах за одно умножение
+        """
+        return np.dot(self.normal_matrix(), coord_matrix.T).T
+
+
+def _transform(transform, coord_matrix, for_normal):
+    return transform.apply_normals(coord_matrix) if for_normal else transform.apply(coord_matrix)
+
+
+def parallel_translation(coord_matrix, t, for_normal=False):
+    return _transform(Transform(position=t), coord_matrix, for_normal)
 
-        return np.dot(scal_matrix, coord_matrix.T).T
+
+def rotate_z(alpha, coord_matrix, for_normal=False):
+    return _transform(Transform(rotation=(0, 0, alpha)), coord_matrix, for_normal)
+
+
+def rotate_y(alpha, coord_matrix, for_normal=False):
+    return _transform(Transform(rotation=(0, alpha, 0)), coord_matrix, for_normal)
+
+
+def rotate_x(alpha, coord_matrix, for_normal=False):
+    return _transform(Transform(rotation=(alpha, 0, 0)), coord_matrix, for_normal)
+
+
+def scaling(coord_matrix, size, for_normal=False):
+    return _transform(Transform(scale=size), coord_matrix, for_normal)
 
 
 if __name__ == '__main__':
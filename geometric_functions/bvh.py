@@ -0,0 +1,182 @@
+import numpy as np
+
+
+class BVH:
+    def __init__(self, vertexes, edges, leaf_size=8):
+        """
+        Данный класс строит иерархию ограничивающих объемов (BVH) по треугольникам модели. Дерево полное бинарное
+        и хранится в плоских массивах: у узла k дети 2k + 1 и 2k + 2, узлы последнего уровня - листья. Каждый узел
+        разбивается по медиане центров треугольников вдоль самой длинной оси, все узлы одного уровня разбиваются
+        одной векторной сортировкой. Дерево строится один раз в локальных координатах модели, а запросы в других
+        системах координат делаются переводом плоскостей или лучей в локальную систему.
+        :param vertexes: массив (n, 3) или (n, 4) вершин
+        :param edges: массив (f, 3) индексов вершин треугольников
+        :param leaf_size: наибольшее количество треугольников в листе
+        """
+        self.vertexes = np.asarray(vertexes, dtype=np.float64)[:, :3]
+        self.edges = np.asarray(edges)
+        count = len(self.edges)
+        triangles = self.vertexes[self.edges]  # (f, 3, 3)
+        centroids = triangles.mean(axis=1)
+        # глубина выбирается так, чтобы в листе было не больше leaf_size треугольников и ни один лист не был пустым
+        self.depth = 0
+        while count > 2 ** self.depth * leaf_size and 2 ** (self.depth + 1) <= count:
+            self.depth += 1
+
+        order = np.arange(count)
+        for level in range(self.depth):
+            starts = self.__level_starts(level, count)
+            node = np.repeat(np.arange(2 ** level), np.diff(starts))
+            points = centroids[order]
+            extent = np.maximum.reduceat(points, starts[:-1]) - np.minimum.reduceat(points, starts[:-1])
+            axis = np.argmax(extent, axis=1)
+            # внутри каждого узла треугольники сортируются по оси узла, узлы остаются на своих местах
+            order = order[np.lexsort((points[np.arange(count), axis[node]], node))]
+        self.faces = order  # номера треугольников в порядке листьев
+
+        # границы треугольников в порядке листьев и границы узлов снизу вверх
+        self.face_min = triangles[order].min(axis=1)
+        self.face_max = triangles[order].max(axis=1)
+        nodes = 2 ** (self.depth + 1) - 1
+        self.node_min = np.empty((nodes, 3))
+        self.node_max = np.empty((nodes, 3))
+        self.start = np.empty(nodes, dtype=np.int64)
+        self.end = np.empty(nodes, dtype=np.int64)
+        for level in range(self.depth, -1, -1):
+            first = 2 ** level - 1
+            starts = self.__level_starts(level, count)
+            self.start[first:2 * first + 1] = starts[:-1]
+            self.end[first:2 * first + 1] = starts[1:]
+            if count == 0:
+                self.node_min[first:2 * first + 1] = np.inf
+                self.node_max[first:2 * first + 1] = -np.inf
+            elif level == self.depth:
+                self.node_min[first:] = np.minimum.reduceat(self.face_min, starts[:-1])
+                self.node_max[first:] = np.maximum.reduceat(self.face_max, starts[:-1])
+            else:
+                left = np.arange(first, 2 * first + 1) * 2 + 1
+                self.node_min[first:2 * first + 1] = np.minimum(self.node_min[left], self.node_min[left + 1])
+                self.node_max[first:2 * first + 1] = np.maximum(self.node_max[left], self.node_max[left + 1])
+
+    @staticmethod
+    def __level_starts(level, count):
+        """
+        Данная функция возвращает границы диапазонов треугольников всех узлов уровня level
+        """
+        return np.arange(2 ** level + 1) * count // 2 ** level
+
+    def query_planes(self, planes):
+        """
+        Данная функция возвращает треугольники, ограничивающие параллелепипеды которых не лежат целиком снаружи
+        ни одной из плоскостей. Поддеревья целиком снаружи пропускаются, целиком внутри берутся без обхода.
+        :param planes: массив (p, 4) плоскостей в локальных координатах модели, внутренняя сторона dot(plane, p) >= 0
+        :return: отсортированный массив номеров треугольников
+        """
+        planes = np.asarray(planes, dtype=np.float64).reshape(-1, 4)
+        normals = planes[:, :3]
+
+        def classify(box_min, box_max):
+            positive = normals >= 0
+            # самая дальняя и самая ближняя вдоль нормали плоскости вершины параллелепипеда
+            far = np.where(positive, box_max[:, None], box_min[:, None])
+            near = np.where(positive, box_min[:, None], box_max[:, None])
+            outside = np.any(np.sum(far * normals, axis=2) + planes[:, 3] < 0, axis=1)
+            inside = np.all(np.sum(near * normals, axis=2) + planes[:, 3] >= 0, axis=1)
+            return outside, inside
+
+        return self.__traverse(classify)
+
+    def query_aabb(self, box_min, box_max):
+        """
+        Данная функция возвращает треугольники, ограничивающие параллелепипеды которых пересекаются с заданным
+        :param box_min: тройка чисел - минимальный угол параллелепипеда в локальных координатах модели
+        :param box_max: тройка чисел - максимальный угол параллелепипеда
+        :return: отсортированный массив номеров треугольников
+        """
+        box_min = np.asarray(box_min, dtype=np.float64)
+        box_max = np.asarray(box_max, dtype=np.float64)
+
+        def classify(node_min, node_max):
+            outside = np.any((node_min > box_max) | (node_max < box_min), axis=1)
+            inside = np.all((node_min >= box_min) & (node_max <= box_max), axis=1)
+            return outside, inside
+
+        return self.__traverse(classify)
+
+    def ray(self, origin, direction):
+        """
+        Данная функция находит ближайшее пересечение луча с треугольниками модели
+        :param origin: начало луча в локальных координатах модели
+        :param direction: направление луча
+        :return: (номер треугольника, параметр t точки origin + t * direction) или None, если пересечения нет
+        """
+        origin = np.asarray(origin, dtype=np.float64)[:3]
+        direction = np.asarray(direction, dtype=np.float64)[:3]
+        with np.errstate(divide='ignore'):
+            inverse = 1 / direction
+
+        def classify(box_min, box_max):
+            # пересечение луча с параллелепипедом методом плит
+            with np.errstate(invalid='ignore'):
+                t1 = (box_min - origin) * inverse
+                t2 = (box_max - origin) * inverse
+            t1 = np.where(np.isnan(t1), -np.inf, t1)  # луч лежит в плоскости грани параллелепипеда
+            t2 = np.where(np.isnan(t2), np.inf, t2)
+            t_near = np.minimum(t1, t2).max(axis=1)
+            t_far = np.maximum(t1, t2).min(axis=1)
+            outside = (t_near > t_far) | (t_far < 0)
+            return outside, np.zeros(len(box_min), dtype=bool)
+
+        faces = self.__traverse(classify)
+        if len(faces) == 0:
+            return None
+        # пересечение с треугольниками кандидатами методом Моллера-Трумбора
+        a, b, c = np.moveaxis(self.vertexes[self.edges[faces]], 1, 0)
+        e1, e2 = b - a, c - a
+        p = np.cross(direction, e2)
+        det = np.sum(e1 * p, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv_det = 1 / det
+            s = origin - a
+            u = np.sum(s * p, axis=1) * inv_det
+            q = np.cross(s, e1)
+            v = np.dot(q, direction) * inv_det
+            t = np.sum(e2 * q, axis=1) * inv_det
+        hit = (det != 0) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0)
+        if not hit.any():
+            return None
+        best = np.argmin(np.where(hit, t, np.inf))
+        return int(faces[best]), float(t[best])
+
+    def __traverse(self, classify):
+        """
+        Данная функция обходит дерево по уровням: на каждом шаге все узлы текущего уровня проверяются одной векторной
+        операцией. В листьях проверяются границы отдельных треугольников.
+        :param classify: функция (минимумы, максимумы) -> (маска целиком снаружи, маска целиком внутри)
+        :return: отсортированный массив номеров треугольников
+        """
+        if len(self.faces) == 0:
+            return np.zeros(0, dtype=np.int64)
+        first_leaf = 2 ** self.depth - 1
+        nodes = np.zeros(1, dtype=np.int64)
+        whole, leaves = [], []
+        while len(nodes):
+            outside, inside = classify(self.node_min[nodes], self.node_max[nodes])
+            whole.append(nodes[~outside & inside])
+            nodes = nodes[~outside & ~inside]
+            leaves.append(nodes[nodes >= first_leaf])
+            nodes = nodes[nodes < first_leaf]
+            nodes = np.stack([2 * nodes + 1, 2 * nodes + 2], axis=1).ravel()
+        result = [self.__ranges(np.concatenate(whole))]
+        candidates = self.__ranges(np.concatenate(leaves))
+        outside, _ = classify(self.face_min[candidates], self.face_max[candidates])
+        result.append(candidates[~outside])
+        return np.sort(self.faces[np.concatenate(result)])
+
+    def __ranges(self, nodes):
+        """
+        Данная функция возвращает позиции (в порядке листьев) всех треугольников переданных узлов
+        """
+        lengths = self.end[nodes] - self.start[nodes]
+        offsets = np.repeat(self.start[nodes] - np.cumsum(lengths) + lengths, lengths)
+        return np.arange(lengths.sum()) + offsets
@@ -0,0 +1,114 @@
+import numpy as np
+
+
+def frustum_planes(camera_matrix, type_camera, size, scale, near, far=None):
+    """
+    Данная функция строит плоскости пирамиды видимости в lookAt системе. Точка p = (x, y, z, 1) видима,
+    если для всех плоскостей dot(plane, p) >= 0. Боковые плоскости соответствуют краям экрана (с запасом в
+    полпикселя, чтобы не отбросить то, что после округления попадет на край), первая плоскость - ближняя.
+    :param camera_matrix: матрица проекции камеры
+    :param type_camera: 1 - перспективная проекция; 0 - ортографическая проекция
+    :param size: размеры экрана (ширина, высота)
+    :param scale: коэффициенты, на которые умножаются экранные x и y для сохранения пропорций
+    :param near: координата z ближней плоскости в lookAt системе (камера смотрит вдоль -z)
+    :param far: координата z дальней плоскости или None, если дальняя плоскость не используется
+    :return: массив (p, 4) плоскостей
+    """
+    # для перспективной проекции x_ndc = -x_clip / w, для ортографической x_ndc = x_clip
+    sign = -1 if type_camera == 1 else 1
+    planes = [np.array([0, 0, -1, near], dtype=np.float64)]
+    for axis in range(2):
+        lo = -1 - 1 / (size[axis] * scale[axis])
+        hi = (2 * size[axis] + 1) / (size[axis] * scale[axis]) - 1
+        row = np.zeros(4)
+        row[axis] = sign
+        w = np.array([0, 0, 0, 1.])
+        # плоскости в координатах отсечения переводятся в lookAt систему умножением на матрицу проекции
+        planes.append(np.dot(row - lo * w, camera_matrix))
+        planes.append(np.dot(hi * w - row, camera_matrix))
+    if far is not None:
+        planes.append(np.array([0, 0, 1, -far], dtype=np.float64))
+    return np.array(planes)
+
+
+def sphere_outside(center, radius, planes):
+    """
+    Данная функция проверяет, лежит ли шар целиком снаружи хотя бы одной плоскости
+    :param center: центр шара в lookAt системе (3 числа)
+    :param radius: радиус шара
+    :param planes: массив (p, 4) плоскостей
+    """
+    distance = (np.dot(planes[:, :3], center) + planes[:, 3]) / np.linalg.norm(planes[:, :3], axis=1)
+    return bool(np.any(distance < -radius))
+
+
+def clip_triangles(view, normals, textures, edges, edges_normals, edges_textures, planes):
+    """
+    Данная функция отбрасывает треугольники, которые целиком лежат снаружи хотя бы одной плоскости, и разрезает
+    ближней плоскостью (planes[0]) треугольники, которые ее пересекают. Новые вершины, нормали и текстурные координаты
+    получаются линейной интерполяцией вдоль ребер и дописываются в конец массивов.
+    :return: view, normals, textures, edges, edges_normals, edges_textures и face_ids - номер исходного
+    треугольника для каждого треугольника результата
+    """
+    distance = np.dot(view, planes.T)
+    face_distance = distance[edges]  # (f, 3, p)
+    keep = ~np.any(np.all(face_distance < 0, axis=1), axis=1)
+    inside = face_distance[:, :, 0] >= 0
+    whole = keep & inside.all(axis=1)
+    face_ids = [np.flatnonzero(whole)]
+    result_edges = [edges[whole]]
+    result_normals = [edges_normals[whole]]
+    result_textures = [edges_textures[whole]]
+    views, norms, uvs = [view], [normals], [textures]
+    counts = [len(view), len(normals), len(textures)]
+
+    def add(index, a, b, t):
+        """
+        Добавляет вершины на ребре (a, b) с параметром t для треугольников index, возвращает их индексы
+        """
+        result = []
+        for arrays, faces, i in ((views, edges, 0), (norms, edges_normals, 1), (uvs, edges_textures, 2)):
+            source = arrays[0]
+            if len(source) == 0:  # у объекта нет нормалей или текстурных координат
+                result.append(np.full(len(index), -1))
+                continue
+            start = faces[index, a]
+            end = faces[index, b]
+            arrays.append(source[start] + t[:, None] * (source[end] - source[start]))
+            result.append(np.arange(counts[i], counts[i] + len(index)))
+            counts[i] += len(index)
+        return result
+
+    near = face_distance[:, :, 0]
+    count_inside = inside.sum(axis=1)
+    for k in (1, 2):
+        index = np.flatnonzero(keep & (count_inside == k))
+        if len(index) == 0:
+            continue
+        # поворачиваем вершины по кругу (сохраняя обход), чтобы особая вершина была первой
+        first = np.argmax(inside[index], axis=1) if k == 1 else np.argmin(inside[index], axis=1)
+        order = (first[:, None] + np.arange(3)) % 3
+        d = near[index[:, None], order]
+        a, b, c = order[:, 0], order[:, 1], order[:, 2]
+        if k == 1:
+            # внутри только вершина a: остается треугольник (a, ab, ac)
+            ab = add(index, a, b, d[:, 0] / (d[:, 0] - d[:, 1]))
+            ac = add(index, a, c, d[:, 0] / (d[:, 0] - d[:, 2]))
+            for faces, out, i in ((edges, result_edges, 0), (edges_normals, result_normals, 1),
+                                  (edges_textures, result_textures, 2)):
+                out.append(np.stack([faces[index, a], ab[i], ac[i]], axis=1))
+            face_ids.append(index)
+        else:
+            # снаружи только вершина a: остается четырехугольник (b, c, ca, ab), он делится на два треугольника
+            ca = add(index, c, a, d[:, 2] / (d[:, 2] - d[:, 0]))
+            ab = add(index, b, a, d[:, 1] / (d[:, 1] - d[:, 0]))
+            for faces, out, i in ((edges, result_edges, 0), (edges_normals, result_normals, 1),
+                                  (edges_textures, result_textures, 2)):
+                out.append(np.stack([faces[index, b], faces[index, c], ca[i]], axis=1))
+                out.append(np.stack([faces[index, b], ca[i], ab[i]], axis=1))
+            face_ids.extend([index, index])
+    face_ids = np.concatenate(face_ids)
+    order = np.argsort(face_ids, kind='stable')  # сохраняем исходный порядок треугольников
+    return np.concatenate(views), np.concatenate(norms), np.concatenate(uvs), \
+        np.concatenate(result_edges)[order], np.concatenate(result_normals)[order], \
+        np.concatenate(result_textures)[order], face_ids[order]
@@ -74,3 +74,18 @@ def get_barr_coords(x, y, a, b, c):
     else:
         return np.array([-1, -1, -1])
 
+
+def unique_edges(edges):
+    """
+    Данная функция находит ребра треугольников без повторов: общее ребро соседних треугольников берется один раз
+    :param edges: массив (f, 3) индексов вершин треугольников
+    :return: массив (e, 2) пар индексов вершин (меньший индекс первым) и массив (f, 3) номеров ребер треугольников
+    """
+    edges = np.asarray(edges)
+    pairs = np.stack([edges[:, [0, 1]], edges[:, [1, 2]], edges[:, [0, 2]]], axis=1).reshape(-1, 2)
+    pairs = np.sort(pairs, axis=1)
+    # пара индексов кодируется одним числом, чтобы не сортировать строки
+    count = int(edges.max()) + 1 if edges.size else 1
+    keys, inverse = np.unique(pairs[:, 0].astype(np.int64) * count + pairs[:, 1], return_inverse=True)
+    lines = np.stack([keys // count, keys % count], axis=1)
+    return lines, np.reshape(inverse, (-1, 3))
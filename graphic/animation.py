@@ -0,0 +1,202 @@
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from geometric_functions import affine_transformation as at
+from graphic.framebuffer import FrameBuffer
+from spaces.world_space import Camera
+
+# состояние процесса пула: сцена, настройки отрисовки, путь камеры, изменения объектов и кадры в общей памяти
+_worker = {}
+
+
+class Turntable:
+    def __init__(self, camera, frames, turns=1):
+        """
+        Данный класс задает путь камеры по кругу вокруг её точки наблюдения (поворот вокруг вертикальной оси):
+        turntable(index) возвращает камеру кадра index. Радиус, высота и границы обзора берутся у camera.
+        :param camera: объект Camera первого кадра
+        :param frames: количество кадров на turns оборотов
+        :param turns: количество оборотов
+        """
+        self.camera = camera
+        self.frames = frames
+        self.turns = turns
+
+    def __call__(self, index):
+        angle = 2 * np.pi * self.turns * index / self.frames
+        offset = np.append(self.camera.camera_position - self.camera.observation_point, 1)
+        position = self.camera.observation_point + np.dot(at.rotation_y_matrix(angle), offset)[:3]
+        return Camera(position, self.camera.observation_point, self.camera.type_camera, self.camera.depth_view,
+                      self.camera.width_view, self.camera.height_view)
+
+
+class Spin:
+    def __init__(self, objects, frames, turns=1, axis=1):
+        """
+        Данный класс поворачивает объекты сцены вокруг их середины: spin(objs, index) задает поворот кадра index.
+        Поворот задается от исходного, а не добавляется к предыдущему, поэтому кадры можно рисовать в любом
+        порядке и в разных процессах.
+        :param objects: номера объектов в WorldSpace.objs
+        :param frames: количество кадров на turns оборотов
+        :param turns: количество оборотов
+        :param axis: ось поворота: 0 - X, 1 - Y, 2 - Z
+        """
+        self.objects = objects
+        self.frames = frames
+        self.turns = turns
+        self.axis = axis
+        self.rotations = None  # исходные повороты объектов, запоминаются при первом вызове
+
+    def __call__(self, objs, index):
+        if self.rotations is None:
+            self.rotations = {i: np.array(objs[i].transform.rotation) for i in self.objects}
+        for i in self.objects:
+            rotation = self.rotations[i].copy()
+            rotation[self.axis] += 2 * np.pi * self.turns * index / self.frames
+            objs[i].transform.rotation = rotation
+
+
+class PngSequence:
+    def __init__(self, pattern):
+        """
+        Данный класс записывает кадры в последовательность файлов
+        :param pattern: шаблон пути с номером кадра, например 'frames/%04d.png' (формат - как у FrameBuffer.save)
+        """
+        self.pattern = pattern
+
+    def write(self, index, frame):
+        frame.save(self.pattern % index)
+
+    def close(self):
+        pass
+
+
+class EncoderPipe:
+    def __init__(self, command):
+        """
+        Данный класс передает байты кадров (RGB или RGBA построчно сверху вниз) во внешний кодировщик через stdin
+        :param command: команда кодировщика (например, результат ffmpeg_command)
+        """
+        self.command = command
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, index, frame):
+        self.process.stdin.write(frame.memoryview())
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError('Кодировщик %s завершился с кодом %d' % (self.command[0], self.process.returncode))
+
+
+def ffmpeg_command(path, size, fps=30, alpha=False):
+    """
+    Данная функция собирает команду ffmpeg, которая кодирует кадры из stdin в видеофайл
+    :param path: путь до видеофайла
+    :param size: размеры кадра (количество x, количество y), как у WorldSpace.buffer_size
+    :param fps: количество кадров в секунду
+    :param alpha: True - кадры с каналом прозрачности
+    """
+    return ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgba' if alpha else 'rgb24',
+            '-s', '%dx%d' % tuple(size), '-r', str(fps), '-i', '-', '-pix_fmt', 'yuv420p', path]
+
+
+def render_frames(world_space, vis, count, camera_path=None, update=None, workers=1, ahead=None, alpha=False):
+    """
+    Данная функция по одному возвращает кадры анимации. Геометрия моделей, BVH и текстуры загружаются один раз,
+    матрицы объектов пересчитываются только для объектов, преобразование которых изменилось.
+    При workers > 1 кадры рисуются заранее процессами пула в кольцо из ahead кадров в общей памяти: пока
+    вызывающий обрабатывает (например, кодирует) кадр, следующие уже рисуются. Память не зависит от количества
+    кадров: кадр занимает место в кольце, пока вызывающий не запросит следующий.
+    :param world_space: объект WorldSpace со сценой
+    :param vis: объект Visualization с настройками отрисовки (в процессах пула рисует без своего пула процессов)
+    :param count: количество кадров
+    :param camera_path: None (камера WorldSpace), функция номер кадра -> Camera (например, Turntable)
+    или список камер
+    :param update: None или функция update(objs, index), которая задает преобразования объектов кадра index
+    (например, Spin); при workers > 1 кадры рисуются в разных процессах, поэтому преобразования задаются
+    от исходных, а не добавляются к предыдущему кадру
+    :param workers: количество процессов
+    :param ahead: количество кадров в кольце (по умолчанию 2 * workers)
+    :param alpha: True - кадры с каналом прозрачности
+    :return: генератор пар (номер кадра, FrameBuffer); кадр действителен до запроса следующего
+    """
+    if workers <= 1:
+        state = {'world_space': world_space, 'vis': vis, 'camera_path': camera_path, 'update': update}
+        frame = FrameBuffer(world_space.buffer_size, alpha)
+        for index in range(count):
+            _draw(state, index, frame)
+            yield index, frame
+        return
+
+    ring = [FrameBuffer(world_space.buffer_size, alpha, shared=True) for _ in range(ahead or 2 * workers)]
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(world_space, vis, camera_path, update,
+                                           [frame.layout() for frame in ring])) as executor:
+            pending = deque()
+            for index in range(min(len(ring), count)):
+                pending.append((index, index, executor.submit(_render_frame, (index, index))))
+            following = len(pending)
+            while pending:
+                index, slot, future = pending.popleft()
+                future.result()
+                yield index, ring[slot]
+                # вызывающий закончил с кадром, место в кольце занимает следующий кадр
+                if following < count:
+                    pending.append((following, slot, executor.submit(_render_frame, (following, slot))))
+                    following += 1
+    finally:
+        for frame in ring:
+            frame.close(unlink=True)
+
+
+def stream(frames, sink):
+    """
+    Данная функция записывает кадры в приемник (PngSequence, EncoderPipe) по мере их готовности
+    :param frames: генератор пар (номер кадра, FrameBuffer), например render_frames
+    :param sink: объект с функциями write(index, frame) и close()
+    :return: количество записанных кадров
+    """
+    written = 0
+    try:
+        for index, frame in frames:
+            sink.write(index, frame)
+            written += 1
+    finally:
+        sink.close()
+    return written
+
+
+def _init_worker(world_space, vis, camera_path, update, layouts):
+    """
+    Данная функция выполняется один раз при запуске процесса пула: сохраняет сцену и подключает кадры кольца
+    """
+    vis.workers = 1  # кадры уже рисуются параллельно
+    _worker.update(world_space=world_space, vis=vis, camera_path=camera_path, update=update,
+                   frames=[FrameBuffer.attach(layout) for layout in layouts])
+
+
+def _render_frame(task):
+    """
+    Данная функция рисует кадр анимации в процессе пула
+    :param task: пара (номер кадра, номер кадра в кольце)
+    """
+    index, slot = task
+    _draw(_worker, index, _worker['frames'][slot])
+
+
+def _draw(state, index, frame):
+    """
+    Данная функция задает камеру и преобразования объектов кадра index и рисует его в frame
+    :param state: словарь со сценой, настройками отрисовки, путем камеры и функцией изменения объектов
+    """
+    world_space, vis, camera_path = state['world_space'], state['vis'], state['camera_path']
+    if camera_path is not None:
+        camera = camera_path(index) if callable(camera_path) else camera_path[index]
+        world_space.set_camera(camera)
+        vis.camera_point = camera.camera_position
+    if state['update'] is not None:
+        state['update'](world_space.objs, index)
+    vis.render(world_space, frame)
@@ -1,4 +1,6 @@
 import numpy as np
+from geometric_functions.geometry_calculations import unique_edges
+from graphic.wireframe import draw_lines
 
 
 
@@ -12,15 +14,7 @@ def draw_vertexes(img, data_vertex):
 
 def draw_edges(img, data_vertex, data_edges):
     """
-    This function draws the edges
+    This function draws the edges, an edge shared by two faces is drawn once
     """
-    i = 0
-    for v1, v2, v3 in data_edges:  # get the numbers of string
-        # # v1, v2, v3 = v1 - 1, v2 - 1, v3 - 1  # change the numbering
-        # print(v1,v2,v3)
-        img = draw_line(img, data_vertex, v1, v2)
-        img = draw_line(img, data_vertex, v1, v3)
-        img = draw_line(img, data_vertex, v2, v3)
-        i += 1
-        # print(i)
-    return img
\ No newline at end of file
+    lines, _ = unique_edges(data_edges)
+    return draw_lines(img, data_vertex, lines)
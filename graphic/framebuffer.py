@@ -0,0 +1,118 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+
+class FrameBuffer:
+    def __init__(self, size, alpha=False, depth_dtype=np.float32, background=(0, 0, 0), shared=False, layout=None):
+        """
+        Данный класс хранит кадр: плоскость цвета uint8 (высота, ширина, 3 или 4) и плоскость глубины в итоговой
+        ориентации изображения (строка 0 - верх кадра), поэтому кадр выводится и сохраняется без поворота и копии.
+        Растеризатор пишет в те же данные через представления image и depth, индексируемые [x, y].
+        Плоскости выделяются один раз, между кадрами они очищаются на месте функцией clear.
+        :param size: размеры буфера (количество x, количество y), как у WorldSpace.buffer_size
+        :param alpha: True - хранить канал прозрачности (непрозрачны пиксели, в которые что-то нарисовано)
+        :param depth_dtype: тип глубины (float32 - вдвое меньше памяти, чем float64)
+        :param background: цвет фона
+        :param shared: True - плоскости лежат в общей памяти и могут быть подключены в другом процессе функцией
+        attach по результату layout
+        :param layout: описание общей памяти (используется attach)
+        """
+        self.size = tuple(size)
+        self.alpha = alpha
+        self.background = background
+        channels = 4 if alpha else 3
+        shapes = [((self.size[1], self.size[0], channels), np.dtype(np.uint8)),
+                  ((self.size[1], self.size[0]), np.dtype(depth_dtype))]
+        self.memories = []
+        if layout is not None:
+            self.memories = [shared_memory.SharedMemory(name=name) for name, _, _ in layout]
+        elif shared:
+            self.memories = [shared_memory.SharedMemory(create=True,
+                                                        size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+                             for shape, dtype in shapes]
+        if self.memories:
+            self.pixels, self.depth_plane = [np.ndarray(shape, dtype, buffer=memory.buf)
+                                             for (shape, dtype), memory in zip(shapes, self.memories)]
+        else:
+            self.pixels, self.depth_plane = [np.empty(shape, dtype) for shape, dtype in shapes]
+        # представления [x, y] для растеризатора: x - столбец, y - строка снизу вверх
+        self.image = self.pixels[::-1, :, :3].swapaxes(0, 1)
+        self.depth = self.depth_plane[::-1].swapaxes(0, 1)
+        if layout is None:
+            self.clear()
+
+    def clear(self):
+        """
+        Данная функция очищает кадр на месте: глубина -inf, цвет фона, канал прозрачности 0
+        """
+        self.depth_plane.fill(-np.inf)
+        self.pixels[:, :, :3] = self.background
+        if self.alpha:
+            self.pixels[:, :, 3] = 0
+
+    def update_alpha(self):
+        """
+        Данная функция делает непрозрачными пиксели, в которые что-то нарисовано (глубина больше -inf)
+        """
+        if self.alpha:
+            self.pixels[:, :, 3] = np.where(self.depth_plane > -np.inf, 255, 0)
+
+    def memoryview(self):
+        """
+        Данная функция возвращает memoryview плоскости цвета без копирования (строки сверху вниз, пиксели RGB(A))
+        """
+        return memoryview(self.pixels)
+
+    def to_pil(self):
+        """
+        Данная функция возвращает изображение PIL над плоскостью цвета. Для RGBA память общая с кадром,
+        для RGB PIL сам переводит пиксели в свой 4-байтовый формат.
+        """
+        from PIL import Image
+        mode = 'RGBA' if self.alpha else 'RGB'
+        return Image.frombuffer(mode, self.size, self.pixels, 'raw', mode, 0, 1)
+
+    def save(self, path, format=None):
+        """
+        Данная функция сохраняет кадр в файл: .npy и .raw (байты RGB(A) построчно) пишутся прямо из памяти кадра,
+        остальные форматы кодируются через PIL
+        :param path: путь до файла
+        :param format: формат для PIL (по умолчанию определяется по расширению)
+        """
+        if path.endswith('.npy'):
+            np.save(path, self.pixels)
+        elif path.endswith('.raw'):
+            with open(path, 'wb') as file:
+                file.write(self.memoryview())
+        else:
+            self.to_pil().save(path, format)
+
+    def layout(self):
+        """
+        Данная функция возвращает описание общей памяти кадра для подключения в другом процессе
+        """
+        if not self.memories:
+            raise ValueError('Кадр создан без shared=True')
+        return [(memory.name, array.shape, array.dtype.str)
+                for memory, array in zip(self.memories, (self.pixels, self.depth_plane))]
+
+    @classmethod
+    def attach(cls, layout, background=(0, 0, 0)):
+        """
+        Данная функция подключает кадр, созданный в другом процессе с shared=True, без копирования
+        :param layout: результат FrameBuffer.layout()
+        """
+        (_, shape, _), (_, _, depth_dtype) = layout
+        return cls((shape[1], shape[0]), shape[2] == 4, np.dtype(depth_dtype), background, layout=layout)
+
+    def close(self, unlink=False):
+        """
+        Данная функция отключает общую память кадра
+        :param unlink: True - освободить общую память (делает процесс, который создал кадр)
+        """
+        self.image = self.depth = self.pixels = self.depth_plane = None
+        for memory in self.memories:
+            memory.close()
+            if unlink:
+                memory.unlink()
+        self.memories = []
@@ -0,0 +1,61 @@
+import numpy as np
+
+
+class GBuffer:
+    def __init__(self, size, attributes=False):
+        """
+        Данный класс хранит результат первого прохода отложенного освещения (G-buffer): для каждого пикселя глубину,
+        номер объекта, номер треугольника и перспективно-корректные барицентрические координаты видимого фрагмента.
+        Все массивы индексируются [x, y], как и матрица отображения.
+        :param size: размеры буфера (количество x, количество y)
+        :param attributes: True - при закраске сохранять также интерполированные нормали и текстурные координаты
+        """
+        self.size = tuple(size)
+        self.attributes = attributes
+        self.depth = np.full(self.size, -np.inf)  # z-buffer
+        self.object = np.full(self.size, -1, dtype=np.int32)  # -1 - пиксель фона
+        self.face = np.full(self.size, -1, dtype=np.int64)
+        self.barr = np.zeros(self.size + (3,))
+        self.normal = np.zeros(self.size + (3,)) if attributes else None
+        self.uv = np.zeros(self.size + (2,)) if attributes else None
+
+    def clear(self):
+        """
+        Данная функция очищает буфер для следующего кадра без выделения памяти
+        """
+        self.depth.fill(-np.inf)
+        self.object.fill(-1)
+        self.face.fill(-1)
+        self.barr.fill(0)
+        if self.attributes:
+            self.normal.fill(0)
+            self.uv.fill(0)
+
+    def write(self, index, face, x, y, barr):
+        """
+        Данная функция записывает фрагменты, прошедшие тест глубины, поверх прежних
+        :param index: номер объекта
+        :param face: массив номеров треугольников
+        :param x: массив координат x
+        :param y: массив координат y
+        :param barr: массив (k, 3) барицентрических координат
+        """
+        self.object[x, y] = index
+        self.face[x, y] = face
+        self.barr[x, y] = barr
+
+    def samples(self):
+        """
+        Данная функция возвращает видимые пиксели кадра, сгруппированные по объектам
+        :return: словарь номер объекта -> (x, y, номера треугольников, барицентрические координаты (k, 3))
+        """
+        x, y = np.nonzero(self.object >= 0)
+        index = self.object[x, y]
+        order = np.argsort(index, kind='stable')
+        x, y, index = x[order], y[order], index[order]
+        objects, starts = np.unique(index, return_index=True)
+        result = {}
+        for i, start, end in zip(objects, starts, np.append(starts[1:], len(index))):
+            px, py = x[start:end], y[start:end]
+            result[int(i)] = (px, py, self.face[px, py], self.barr[px, py])
+        return result
@@ -0,0 +1,107 @@
+import numpy as np
+from graphic import rasterizer
+
+
+class HiZ:
+    def __init__(self, buffer, origin=(0, 0)):
+        """
+        Данный класс хранит иерархический z-buffer (Hi-Z): пирамиду, в которой каждый элемент уровня k равен
+        наименьшему z (самой дальней глубине) блока 2^k x 2^k пикселей z-buffer. Треугольник, ближайшая точка
+        которого не ближе самой дальней глубины буфера в его ограничивающем прямоугольнике, не пройдет тест
+        buffer[x, y] < z ни в одном пикселе и отбрасывается без растеризации.
+        Пирамида обновляется по прямоугольникам пикселей, в которые была запись.
+        :param buffer: z-buffer, индексируется [x, y]; нулевой уровень пирамиды - сам буфер (без копии)
+        :param origin: экранные координаты пикселя buffer[0, 0]
+        """
+        self.buffer = buffer
+        self.origin = origin
+        self.levels = [buffer]
+        shape = buffer.shape
+        while shape[0] > 1 or shape[1] > 1:
+            shape = ((shape[0] + 1) // 2, (shape[1] + 1) // 2)
+            self.levels.append(np.empty(shape))
+        self.tested_triangles = 0
+        self.culled_triangles = 0
+        self.tested_objects = 0
+        self.culled_objects = 0
+        self.update(0, buffer.shape[0] - 1, 0, buffer.shape[1] - 1)
+
+    def update(self, x0, x1, y0, y1):
+        """
+        Данная функция пересчитывает уровни пирамиды над прямоугольником z-buffer x0 <= x <= x1, y0 <= y <= y1
+        """
+        for k in range(1, len(self.levels)):
+            child, level = self.levels[k - 1], self.levels[k]
+            x0, x1, y0, y1 = x0 // 2, x1 // 2, y0 // 2, y1 // 2
+            block = child[2 * x0:2 * x1 + 2, 2 * y0:2 * y1 + 2]
+            # у нечетного края блок дополняется +inf, который не влияет на минимум
+            padded = np.full((2 * (x1 - x0 + 1), 2 * (y1 - y0 + 1)), np.inf)
+            padded[:block.shape[0], :block.shape[1]] = block
+            level[x0:x1 + 1, y0:y1 + 1] = padded.reshape(x1 - x0 + 1, 2, y1 - y0 + 1, 2).min(axis=(1, 3))
+
+    def farthest(self, x0, x1, y0, y1):
+        """
+        Данная функция возвращает самую дальнюю глубину буфера в прямоугольниках (границы включаются, координаты
+        экранные). Берется уровень, на котором прямоугольник покрывает не больше 2 x 2 элементов.
+        :return: массив наименьших z (для пустых прямоугольников -inf, такие треугольники не отбрасываются)
+        """
+        x0, x1 = x0 - self.origin[0], x1 - self.origin[0]
+        y0, y1 = y0 - self.origin[1], y1 - self.origin[1]
+        result = np.full(len(x0), -np.inf)
+        valid = (x0 <= x1) & (y0 <= y1)
+        span = np.maximum(x1 - x0, y1 - y0) + 1
+        level = np.zeros(len(x0), dtype=np.int64)
+        level[valid] = np.minimum(np.ceil(np.log2(span[valid])).astype(np.int64), len(self.levels) - 1)
+        for k in np.unique(level[valid]):
+            index = np.flatnonzero(valid & (level == k))
+            data = self.levels[k]
+            bx0, bx1, by0, by1 = x0[index] >> k, x1[index] >> k, y0[index] >> k, y1[index] >> k
+            result[index] = np.minimum(np.minimum(data[bx0, by0], data[bx1, by0]),
+                                       np.minimum(data[bx0, by1], data[bx1, by1]))
+        return result
+
+    def cull_triangles(self, stage, faces, rect):
+        """
+        Данная функция отбрасывает треугольники, закрытые уже нарисованным
+        :param stage: результат вершинного этапа объекта
+        :param faces: номера треугольников
+        :param rect: часть экрана (x0, y0, x1, y1), которой ограничивается отрисовка
+        :return: номера треугольников, которые нужно растеризовать
+        """
+        edges = stage['edges'][faces]
+        x_min, x_max, y_min, y_max = rasterizer.bounding_boxes(stage['screen'], edges, None, rect)
+        nearest = stage['view'][edges, 2].max(axis=1)
+        hidden = nearest < self.farthest(x_min, x_max, y_min, y_max)
+        self.tested_triangles += len(faces)
+        self.culled_triangles += int(hidden.sum())
+        return faces[~hidden]
+
+    def cull_object(self, stage, rect):
+        """
+        Данная функция проверяет, закрыт ли уже нарисованным весь объект
+        :param stage: результат вершинного этапа объекта
+        :param rect: часть экрана (x0, y0, x1, y1), которой ограничивается отрисовка
+        :return: True, если объект можно не рисовать
+        """
+        self.tested_objects += 1
+        if len(stage['edges']) == 0:
+            return False
+        used = stage['edges'].ravel()
+        x_min, x_max, y_min, y_max = rasterizer.bounding_boxes(stage['screen'], used[None, :], None, rect)
+        hidden = stage['view'][used, 2].max() < self.farthest(x_min, x_max, y_min, y_max)[0]
+        self.culled_objects += int(hidden)
+        return bool(hidden)
+
+    def written(self, x, y):
+        """
+        Данная функция обновляет пирамиду после записи в пиксели (x, y) буфера
+        """
+        if len(x):
+            self.update(x.min(), x.max(), y.min(), y.max())
+
+    def stats(self):
+        """
+        Данная функция возвращает количество проверенных и отброшенных треугольников и объектов
+        """
+        return {'tested_triangles': self.tested_triangles, 'culled_triangles': self.culled_triangles,
+                'tested_objects': self.tested_objects, 'culled_objects': self.culled_objects}
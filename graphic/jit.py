@@ -0,0 +1,300 @@
+import math
+import numpy as np
+from graphic import parallel
+from graphic.lighting import DirectionalLight, PointLight
+from stats import profiler
+
+try:
+    import numba
+    from numba import prange
+except ImportError:  # без numba ядра остаются обычными функциями Python, а Visualization использует NumPy
+    numba = None
+    prange = range
+
+# True, если ядра компилируются numba
+AVAILABLE = numba is not None
+# сторона плитки, по плиткам ядро растеризации работает параллельно
+TILE_SIZE = 32
+# количество пикселей, которые ядро закраски обрабатывает с одними временными векторами
+SHADE_CHUNK = 4096
+
+
+def _jit(function):
+    """
+    Данная функция компилирует ядро numba (nopython, параллельно по prange), если numba установлена.
+    error_model='numpy' - деление на ноль дает inf/nan, как в NumPy, а не исключение.
+    """
+    if numba is None:
+        return function
+    return numba.njit(parallel=True, cache=True, error_model='numpy')(function)
+
+
+def _jit_helper(function):
+    """
+    Данная функция компилирует вспомогательную функцию, которую вызывают ядра (без prange)
+    """
+    if numba is None:
+        return function
+    return numba.njit(cache=True, error_model='numpy')(function)
+
+
+def supported(vis, texture):
+    """
+    Данная функция проверяет, умеют ли ядра рисовать объект с данными настройками; иначе используется путь NumPy
+    (выключенный z-buffer, билинейная фильтрация, mipmap, источники света других типов)
+    :param vis: объект Visualization
+    :param texture: объект Texture объекта или None
+    """
+    if not vis.z_buffer:
+        return False
+    if vis.texture and texture is not None and (vis.texture_filter != 'nearest' or len(texture.levels) > 1):
+        return False
+    return all(isinstance(light, (PointLight, DirectionalLight)) for light in vis.lights)
+
+
+@_jit
+def _raster_tiles(screen, view_z, edges, rects, starts, tile_faces, buffer, face_buffer, barr_buffer, tested,
+                  origin_x, origin_y):
+    """
+    Ядро растеризации: для каждой плитки (параллельно) треугольники проходятся по порядку, для каждого пикселя
+    ограничивающего прямоугольника считаются функции ребер, перспективно-корректные барицентрические координаты
+    и z, затем проводится тест глубины buffer[x, y] < z. В face_buffer и barr_buffer остается победивший фрагмент,
+    в tested[tile] - количество фрагментов плитки (пикселей внутри треугольников), как fragments_tested пути NumPy.
+    z считается через np.dot так же, как rasterizer.interpolate в пути NumPy, поэтому тест глубины дает тот же
+    результат и при почти равных z.
+    """
+    for tile in prange(len(rects)):
+        tx0, ty0, tx1, ty1 = rects[tile, 0], rects[tile, 1], rects[tile, 2], rects[tile, 3]
+        weights, corner_z = np.empty(3), np.empty(3)
+        for k in range(starts[tile], starts[tile + 1]):
+            face = tile_faces[k]
+            a, b, c = edges[face, 0], edges[face, 1], edges[face, 2]
+            ax, ay, bx, by, cx, cy = screen[a, 0], screen[a, 1], screen[b, 0], screen[b, 1], screen[c, 0], screen[c, 1]
+            ab_x, ab_y, ac_x, ac_y = bx - ax, by - ay, cx - ax, cy - ay
+            cross_2 = ab_x * ac_y - ac_x * ab_y
+            if cross_2 == 0:  # вырожденный треугольник
+                continue
+            x_min, x_max = max(min(ax, bx, cx), tx0), min(max(ax, bx, cx), tx1 - 1)
+            y_min, y_max = max(min(ay, by, cy), ty0), min(max(ay, by, cy), ty1 - 1)
+            wa, wb, wc = screen[a, 3], screen[b, 3], screen[c, 3]
+            corner_z[0], corner_z[1], corner_z[2] = view_z[a], view_z[b], view_z[c]
+            for x in range(x_min, x_max + 1):
+                pa_x = ax - x
+                for y in range(y_min, y_max + 1):
+                    pa_y = ay - y
+                    u = (ac_x * pa_y - pa_x * ac_y) / cross_2
+                    v = (pa_x * ab_y - ab_x * pa_y) / cross_2
+                    w = 1 - u - v
+                    if w < 0 or u < 0 or v < 0:
+                        continue
+                    tested[tile] += 1
+                    s0, s1, s2 = w / wa, u / wb, v / wc
+                    inverse = 1 / (s0 + s1 + s2)
+                    weights[0], weights[1], weights[2] = s0 * inverse, s1 * inverse, s2 * inverse
+                    z = np.dot(weights, corner_z)
+                    px, py = x - origin_x, y - origin_y
+                    if buffer[px, py] < z:
+                        buffer[px, py] = z
+                        face_buffer[px, py] = face
+                        barr_buffer[px, py, 0] = weights[0]
+                        barr_buffer[px, py, 1] = weights[1]
+                        barr_buffer[px, py, 2] = weights[2]
+
+
+@_jit_helper
+def _power(base, exponent, shininess):
+    """
+    Данная функция возводит base в степень блика так же, как lighting.specular_power: целая неотрицательная
+    степень exponent считается умножениями, иначе (exponent < 0) - base ** shininess
+    """
+    if exponent < 0:
+        return base ** shininess
+    result = 1.
+    started = False
+    while exponent:
+        if exponent & 1:
+            result = result * base if started else base
+            started = True
+        exponent >>= 1
+        if exponent:
+            base = base * base
+    return result
+
+
+@_jit
+def _shade_pixels(xs, ys, faces, barr, img, screen_scale, origin_x, origin_y, view_z, edges, normals,
+                  edges_normals, uv, edges_textures, texture, has_texture, shadows, levels, type_model, ambient,
+                  material, exponent, camera, lights, light_kinds, light_power, wrap):
+    """
+    Ядро закраски: для каждого пикселя (параллельно по частям из SHADE_CHUNK пикселей) выбирается цвет текстуры
+    (ближайший тексель) и считается освещение в том же порядке операций, что и lighting.light_levels.
+    Скалярные произведения векторов из трех чисел считаются через np.dot, как rasterizer.dot, поэтому
+    округление совпадает с путем NumPy.
+    :param shadows: 0 - flat shading (levels[f, 0]), 1 - по Фонгу, 2 - по Гуро (интерполяция levels[f])
+    :param material: ambient, diffuse, specular, shininess
+    :param exponent: целая степень блика или -1, если shininess не целое (см. _power)
+    :param light_kinds: 0 - точечный источник (lights - позиция), 1 - удаленный (lights - направление на источник)
+    :param light_power: (l, 2) сила дифузного и зеркального освещения
+    """
+    height, width = texture.shape[0], texture.shape[1]
+    for chunk in prange((len(xs) + SHADE_CHUNK - 1) // SHADE_CHUNK):
+        weights, corner, normal, point = np.empty(3), np.empty(3), np.empty(3), np.empty(3)
+        view_dir, light_dir, direction = np.empty(3), np.empty(3), np.empty(3)
+        for i in range(chunk * SHADE_CHUNK, min((chunk + 1) * SHADE_CHUNK, len(xs))):
+            x, y, face = xs[i], ys[i], faces[i]
+            weights[0], weights[1], weights[2] = barr[i, 0], barr[i, 1], barr[i, 2]
+            if has_texture:
+                t0, t1, t2 = edges_textures[face, 0], edges_textures[face, 1], edges_textures[face, 2]
+                corner[0], corner[1], corner[2] = uv[t0, 0], uv[t1, 0], uv[t2, 0]
+                u = np.dot(weights, corner)
+                corner[0], corner[1], corner[2] = uv[t0, 1], uv[t1, 1], uv[t2, 1]
+                v = np.dot(weights, corner)
+                tx = int(math.trunc(u * width - 1)) % width
+                ty = int(math.trunc(height - 1 - v * height)) % height
+                red, green, blue = float(texture[ty, tx, 0]), float(texture[ty, tx, 1]), float(texture[ty, tx, 2])
+            else:
+                red, green, blue = 127., 127., 127.
+
+            if shadows == 0:
+                light = levels[face, 0]
+            elif shadows == 2:
+                corner[0], corner[1], corner[2] = levels[face, 0], levels[face, 1], levels[face, 2]
+                light = np.dot(weights, corner)
+            elif type_model == 0:
+                light = 1.
+            else:
+                n0, n1, n2 = edges_normals[face, 0], edges_normals[face, 1], edges_normals[face, 2]
+                for axis in range(3):
+                    corner[0], corner[1], corner[2] = normals[n0, axis], normals[n1, axis], normals[n2, axis]
+                    normal[axis] = np.dot(weights, corner)
+                length = math.sqrt(np.dot(normal, normal))
+                for axis in range(3):
+                    normal[axis] = normal[axis] / length
+                # точка освещения: экранные x, y (в масштабе матрицы отображения) и z
+                a, b, c = edges[face, 0], edges[face, 1], edges[face, 2]
+                corner[0], corner[1], corner[2] = view_z[a], view_z[b], view_z[c]
+                point[0], point[1] = (x + origin_x) / screen_scale, (y + origin_y) / screen_scale
+                point[2] = np.dot(weights, corner)
+                light = ambient * material[0]
+                if type_model == 2:
+                    for axis in range(3):
+                        view_dir[axis] = camera[axis] - point[axis]
+                    length = math.sqrt(np.dot(view_dir, view_dir))
+                    for axis in range(3):
+                        view_dir[axis] = view_dir[axis] / length
+                for k in range(len(lights)):
+                    for axis in range(3):
+                        light_dir[axis] = lights[k, axis] - point[axis] if light_kinds[k] == 0 else lights[k, axis]
+                    length = math.sqrt(np.dot(light_dir, light_dir))
+                    for axis in range(3):
+                        direction[axis] = light_dir[axis] / length
+                    light = light + max(np.dot(normal, direction), 0.) * light_power[k, 0] * material[1]
+                    if type_model == 2:
+                        for axis in range(3):
+                            direction[axis] = -light_dir[axis]
+                        d = np.dot(direction, normal)
+                        # отраженный луч
+                        for axis in range(3):
+                            direction[axis] = -(2 * normal[axis] * d + light_dir[axis])
+                        length = math.sqrt(np.dot(direction, direction))
+                        for axis in range(3):
+                            direction[axis] = direction[axis] / length
+                        cosine = max(np.dot(direction, view_dir), 0.)
+                        light = light + light_power[k, 1] * material[2] * _power(cosine, exponent, material[3])
+            red, green, blue = np.rint(light * red), np.rint(light * green), np.rint(light * blue)
+            if wrap:  # как при записи float в uint8 в NumPy
+                img[x, y, 0], img[x, y, 1], img[x, y, 2] = int(red) & 255, int(green) & 255, int(blue) & 255
+            else:
+                img[x, y, 0], img[x, y, 1], img[x, y, 2] = red, green, blue
+
+
+def _fragment_buffers(vis, size):
+    """
+    Данная функция возвращает буферы победивших фрагментов размера size, которые хранятся в vis.jit_buffers и
+    переиспользуются между объектами, полосами суперсэмплинга и кадрами (память выделяется только при смене размера)
+    :param vis: объект Visualization
+    :param size: размеры z-buffer
+    :return: face_buffer (номера полигонов, -1 - пиксель не записан) и barr_buffer (барицентрические координаты)
+    """
+    if vis.jit_buffers is None or vis.jit_buffers[0].shape != size:
+        vis.jit_buffers = np.full(size, -1, dtype=np.int64), np.zeros(size + (3,))
+    return vis.jit_buffers
+
+
+def draw(vis, stage, buffer, img, faces, rect, origin, scale, prepared, texture, material):
+    """
+    Данная функция рисует треугольники объекта ядрами: растеризация с тестом глубины по плиткам, затем закраска
+    пикселей, в которых победил объект. Операции выполняются в том же порядке, что и в пути NumPy, поэтому
+    изображение совпадает с ним до пикселя (кроме дробного material.shininess: ядро возводит в степень через pow
+    из libm, NumPy - своей векторной реализацией).
+    :param vis: объект Visualization с настройками отрисовки
+    :param prepared: результат подготовки освещения (уровни полигонов или вершин) или None
+    :param texture: объект Texture или None
+    :param material: объект Material
+    :return: индексы буфера x, y пикселей, в которые была запись
+    """
+    screen = np.ascontiguousarray(stage['screen'], dtype=np.int64)
+    edges = np.ascontiguousarray(stage['edges'], dtype=np.int64)
+    view_z = np.ascontiguousarray(stage['view'][:, 2], dtype=np.float64)
+    size = buffer.shape
+    with profiler.stage('raster'):
+        bins = parallel.bin_triangles(screen, edges, faces, (rect[2], rect[3]), TILE_SIZE, rect)
+        keys = list(bins)
+        rects = np.array([(tx * TILE_SIZE, ty * TILE_SIZE, (tx + 1) * TILE_SIZE, (ty + 1) * TILE_SIZE)
+                          for tx, ty in keys], dtype=np.int64).reshape(-1, 4)
+        rects[:, :2] = np.maximum(rects[:, :2], rect[:2])
+        rects[:, 2:] = np.minimum(rects[:, 2:], rect[2:])
+        lists = [bins[key] for key in keys]
+        starts = np.zeros(len(lists) + 1, dtype=np.int64)
+        starts[1:] = np.cumsum([len(tile) for tile in lists])
+        tile_faces = np.concatenate(lists).astype(np.int64) if lists else np.zeros(0, dtype=np.int64)
+        face_buffer, barr_buffer = _fragment_buffers(vis, size)
+        tested = np.zeros(len(rects), dtype=np.int64)  # у каждой плитки свой счетчик, плитки рисуются параллельно
+        depth = buffer if buffer.dtype == np.float64 and buffer.flags.c_contiguous else np.ascontiguousarray(
+            buffer, dtype=np.float64)
+        _raster_tiles(screen, view_z, edges, rects, starts, tile_faces, depth, face_buffer, barr_buffer, tested,
+                      origin[0], origin[1])
+        if depth is not buffer:
+            buffer[:] = depth
+        # записанные пиксели ищутся только в прямоугольнике плиток с треугольниками, а не во всем буфере
+        x0 = y0 = x1 = y1 = 0
+        if len(rects):
+            x0, y0 = rects[:, :2].min(axis=0) - origin
+            x1, y1 = rects[:, 2:].max(axis=0) - origin
+        xs, ys = np.nonzero(face_buffer[x0:x1, y0:y1] >= 0)
+        xs, ys = xs + x0, ys + y0
+        face_ids, barr = face_buffer[xs, ys], barr_buffer[xs, ys]
+        # буферы остаются у vis для следующего вызова: сбрасываются только записанные пиксели
+        face_buffer[xs, ys] = -1
+        profiler.count('triangles_rasterized', len(faces))
+        profiler.count('fragments_tested', int(tested.sum()))
+        profiler.count('fragments_written', len(xs))
+
+    with profiler.stage('shading'):
+        has_texture = bool(vis.texture and texture is not None and len(stage['textures']))
+        pixels = texture.levels[0] if has_texture else np.zeros((1, 1, 3), dtype=np.uint8)
+        uv = np.ascontiguousarray(stage['textures'], dtype=np.float64).reshape(len(stage['textures']), -1)
+        if not has_texture:
+            uv = np.zeros((1, 2))
+        normals = np.ascontiguousarray(stage['normals'], dtype=np.float64).reshape(len(stage['normals']), -1)
+        if len(normals) == 0:
+            normals = np.zeros((1, 3))
+        if prepared is None:
+            levels = np.zeros((1, 3))
+        else:
+            levels = np.ascontiguousarray(np.reshape(prepared, (len(prepared), -1)), dtype=np.float64)
+        lights = np.array([light.position if isinstance(light, PointLight) else light.to_light
+                           for light in vis.lights], dtype=np.float64).reshape(-1, 3)
+        kinds = np.array([0 if isinstance(light, PointLight) else 1 for light in vis.lights], dtype=np.int64)
+        power = np.array([(light.diffuse, light.specular) for light in vis.lights], dtype=np.float64).reshape(-1, 2)
+        camera = np.zeros(3) if vis.camera_point is None else np.asarray(vis.camera_point, dtype=np.float64)
+        integer = float(material.shininess).is_integer() and material.shininess >= 0
+        _shade_pixels(xs, ys, face_ids, barr, img, float(scale), origin[0], origin[1],
+                      view_z, edges, normals, np.ascontiguousarray(stage['edges_normals'], dtype=np.int64),
+                      uv, np.ascontiguousarray(stage['edges_textures'], dtype=np.int64), pixels, has_texture,
+                      vis.type_shadows, levels, vis.type_model, float(vis.ambient_strength),
+                      np.array([material.ambient, material.diffuse, material.specular, material.shininess],
+                               dtype=np.float64),
+                      int(material.shininess) if integer else -1, camera, lights, kinds, power, img.dtype == np.uint8)
+        profiler.count('fragments_shaded', len(xs))
+    return xs, ys
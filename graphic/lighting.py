@@ -0,0 +1,109 @@
+import numpy as np
+from graphic.rasterizer import dot, normalize
+
+
+class PointLight:
+    def __init__(self, position, diffuse=1, specular=.3):
+        """
+        Данный класс описывает точечный источник света
+        :param position: координаты источника
+        :param diffuse: сила дифузного освещения
+        :param specular: сила зеркального освещения
+        """
+        self.position = np.array(position)
+        self.diffuse = diffuse
+        self.specular = specular
+
+    def directions(self, points):
+        """
+        Данная функция возвращает направления от точек на источник (не нормированные)
+        :param points: массив (k, 3) точек
+        """
+        return self.position - points
+
+
+class DirectionalLight:
+    def __init__(self, direction, diffuse=1, specular=.3):
+        """
+        Данный класс описывает удаленный источник света (например, солнце), лучи которого параллельны.
+        Направление на источник нормируется один раз, а не для каждой точки.
+        :param direction: направление, в котором идут лучи света
+        :param diffuse: сила дифузного освещения
+        :param specular: сила зеркального освещения
+        """
+        direction = np.asarray(direction, dtype=np.float64)
+        self.direction = direction / np.linalg.norm(direction)
+        self.to_light = -self.direction
+        self.diffuse = diffuse
+        self.specular = specular
+
+    def directions(self, points):
+        """
+        Данная функция возвращает направления от точек на источник (одинаковые для всех точек)
+        :param points: массив (k, 3) точек
+        """
+        return np.broadcast_to(self.to_light, np.shape(points))
+
+
+class Material:
+    def __init__(self, ambient=1, diffuse=1, specular=1, shininess=2):
+        """
+        Данный класс хранит свойства материала объекта для освещения
+        :param ambient: свойство материала для фонового освещения
+        :param diffuse: свойство материала для дифузного освещения
+        :param specular: свойство материала для зеркального освещения
+        :param shininess: параметр площади блика (чем больше, тем меньше блик)
+        """
+        self.ambient = ambient
+        self.diffuse = diffuse
+        self.specular = specular
+        self.shininess = shininess
+
+
+def light_levels(normals, points, camera_point, lights, material, type_model=2, ambient=.1):
+    """
+    Данная функция считает уровень освещенности сразу для массива точек и нескольких источников
+    :param normals: массив (k, 3) единичных нормалей
+    :param points: массив (k, 3) точек
+    :param camera_point: точка расположения наблюдателя
+    :param lights: список источников (PointLight, DirectionalLight)
+    :param material: объект Material
+    :param type_model: 0 - без освещения, 1 - по Ламберту (фоновое + дифузное), 2 - по Фонгу (+ зеркальное)
+    :param ambient: сила фонового освещения
+    :return: массив (k,) уровней освещенности (или 1 без освещения)
+    """
+    if type_model == 0:  # если освещение выключено
+        return 1
+    result = ambient * material.ambient
+    if type_model == 2:
+        view_dir = normalize(camera_point - points)  # направление на наблюдателя
+    for light in lights:
+        light_dir = light.directions(points)  # направления лучей света
+        # неотрицательный косинус между нормалью и направлением на источник
+        result = result + np.maximum(dot(normals, normalize(light_dir)), 0) * light.diffuse * material.diffuse
+        if type_model == 2:
+            reflect = -(2 * normals * dot(-light_dir, normals)[..., None] + light_dir)  # отраженный луч
+            result = result + light.specular * material.specular * \
+                specular_power(np.maximum(dot(normalize(reflect), view_dir), 0), material.shininess)
+    return result
+
+
+def specular_power(cosine, shininess):
+    """
+    Данная функция возводит косинусы в степень блика. Целая неотрицательная степень считается умножениями
+    (возведением в квадрат), так же как в ядрах jit, поэтому результат не зависит от реализации pow;
+    для shininess = 2 это cosine * cosine, как и cosine ** 2 в NumPy
+    :param cosine: массив неотрицательных косинусов
+    :param shininess: степень блика
+    """
+    if not float(shininess).is_integer() or shininess < 0:
+        return cosine ** shininess
+    exponent = int(shininess)
+    result = None
+    while exponent:
+        if exponent & 1:
+            result = cosine if result is None else result * cosine
+        exponent >>= 1
+        if exponent:
+            cosine = cosine * cosine
+    return np.ones_like(cosine) if result is None else result
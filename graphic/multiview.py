@@ -0,0 +1,81 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from graphic.framebuffer import FrameBuffer
+
+# состояние процесса пула: сцена, настройки отрисовки и кадр, который переиспользуется между видами
+_worker = {}
+
+
+def render_views(world_space, vis, cameras, path, names=None, workers=None, callback=None):
+    """
+    Данная функция рисует сцену с нескольких камер. Модели загружаются и текстуры декодируются один раз:
+    процессы пула получают готовые WorldSpace и Visualization и для каждого вида меняют только камеру. Каждое изображение записывается в файл процессом, который его нарисовал, сразу
+    после отрисовки.
+    :param world_space: объект WorldSpace со сценой (его камера не меняется)
+    :param vis: объект Visualization с настройками отрисовки (в процессах пула рисует без своего пула процессов)
+    :param cameras: список объектов Camera
+    :param path: шаблон пути файла с полем {name}, например 'views/{name}.png' (формат - как у FrameBuffer.save)
+    :param names: имена видов для шаблона (по умолчанию view0, view1, ...)
+    :param workers: количество процессов (по умолчанию - количество ядер); при workers = 1 виды рисуются
+    по очереди в текущем процессе
+    :param callback: функция callback(name, file_path), которая вызывается в текущем процессе, как только
+    изображение вида записано
+    :return: словарь имя вида -> путь файла
+    """
+    names = ['view%d' % i for i in range(len(cameras))] if names is None else list(names)
+    if len(names) != len(cameras):
+        raise ValueError('Количество имен видов (%d) не совпадает с количеством камер (%d)'
+                         % (len(names), len(cameras)))
+    tasks = [(name, camera, path.format(name=name)) for name, camera in zip(names, cameras)]
+    workers = min((os.cpu_count() or 1) if workers is None else workers, len(tasks))
+    result = {}
+    if workers <= 1:
+        # виды рисуются объектами вызывающего, после отрисовки их камера и буферы возвращаются
+        saved = world_space.camera, vis.camera_point, vis.img, vis.buffer, vis.workers
+        _init_worker(world_space, vis)
+        try:
+            for task in tasks:
+                name, file_path = _render_view(task)
+                result[name] = file_path
+                if callback is not None:
+                    callback(name, file_path)
+        finally:
+            _worker.clear()
+            world_space.set_camera(saved[0])
+            vis.camera_point, vis.img, vis.buffer, vis.workers = saved[1:]
+        return result
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(world_space, vis)) as executor:
+        for future in as_completed([executor.submit(_render_view, task) for task in tasks]):
+            name, file_path = future.result()
+            result[name] = file_path
+            if callback is not None:
+                callback(name, file_path)
+    return result
+
+
+def _init_worker(world_space, vis):
+    """
+    Данная функция выполняется один раз при запуске процесса пула: сохраняет сцену и создает кадр
+    """
+    _worker['world_space'] = world_space
+    _worker['vis'] = vis
+    _worker['frame'] = FrameBuffer(world_space.buffer_size)
+    vis.workers = 1  # виды уже рисуются параллельно
+
+
+def _render_view(task):
+    """
+    Данная функция рисует один вид и записывает изображение в файл
+    :param task: тройка (имя вида, камера, путь файла)
+    :return: имя вида и путь файла
+    """
+    name, camera, file_path = task
+    world_space, vis, frame = _worker['world_space'], _worker['vis'], _worker['frame']
+    world_space.set_camera(camera)
+    vis.camera_point = camera.camera_position
+    vis.render(world_space, frame)
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    frame.save(file_path)
+    return name, file_path
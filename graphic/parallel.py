@@ -0,0 +1,192 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from graphic import rasterizer
+
+# состояние процесса пула: Visualization, результаты вершинного этапа и буферы в общей памяти
+_worker = {}
+
+
+def bin_triangles(screen, edges, faces, size, tile_size, rect=None):
+    """
+    Данная функция распределяет треугольники по квадратным плиткам экрана, которые пересекают их ограничивающие
+    прямоугольники. Внутри плитки треугольники идут в исходном порядке.
+    :param screen: массив (n, 4) целых экранных координат
+    :param edges: массив (f, 3) индексов вершин треугольников
+    :param faces: номера треугольников, которые нужно распределить
+    :param size: размеры буфера (количество x, количество y)
+    :param tile_size: сторона плитки в пикселях
+    :param rect: None или часть экрана (x0, y0, x1, y1), за пределами которой треугольники не распределяются
+    :return: словарь (номер плитки по x, номер плитки по y) -> массив номеров треугольников
+    """
+    x_min, x_max, y_min, y_max = rasterizer.bounding_boxes(screen, edges[faces], size, rect)
+    visible = (x_min <= x_max) & (y_min <= y_max)  # треугольники целиком за краем экрана не попадают никуда
+    faces = faces[visible]
+    tx0, tx1 = x_min[visible] // tile_size, x_max[visible] // tile_size
+    ty0, ty1 = y_min[visible] // tile_size, y_max[visible] // tile_size
+    columns = ty1 - ty0 + 1
+    count = (tx1 - tx0 + 1) * columns
+    # пары (треугольник, плитка) для всех плиток, которые пересекает прямоугольник треугольника
+    pair = np.repeat(np.arange(len(faces)), count)
+    local = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    tile_x = tx0[pair] + local // columns[pair]
+    tile_y = ty0[pair] + local % columns[pair]
+    tiles_y = (size[1] + tile_size - 1) // tile_size
+    tile = tile_x * tiles_y + tile_y
+    order = np.argsort(tile, kind='stable')  # устойчивая сортировка сохраняет порядок треугольников
+    tile, pair = tile[order], pair[order]
+    keys, starts = np.unique(tile, return_index=True)
+    ends = np.append(starts[1:], len(tile))
+    return {(int(key // tiles_y), int(key % tiles_y)): faces[pair[start:end]]
+            for key, start, end in zip(keys, starts, ends)}
+
+
+def render_tiles(vis, stages, buffer, img, workers, tile_size):
+    """
+    Данная функция делит экран на плитки и растеризует их в пуле процессов. Матрица отображения и z-buffer лежат
+    в общей памяти, каждый процесс пишет только в пиксели своих плиток, поэтому результат совпадает с отрисовкой
+    в одном процессе, а обратно в основной процесс ничего не передается.
+    :param vis: объект Visualization с настройками отрисовки
+    :param stages: список пар (объект, результат вершинного этапа)
+    :param buffer: z-buffer
+    :param img: матрица отображения
+    :param workers: количество процессов
+    :param tile_size: сторона плитки в пикселях
+    """
+    size = buffer.shape
+    tiles = {}
+    for index, (obj, stage) in enumerate(stages):
+        faces = np.flatnonzero(stage['front']) if vis.back_face_culling else np.arange(len(stage['edges']))
+        for key, tile_faces in bin_triangles(stage['screen'], stage['edges'], faces, size, tile_size).items():
+            tiles.setdefault(key, []).append((index, tile_faces))
+    tasks = [((tx * tile_size, ty * tile_size, min((tx + 1) * tile_size, size[0]),
+               min((ty + 1) * tile_size, size[1])), items) for (tx, ty), items in tiles.items()]
+
+    shared = [shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1)) for array in (img, buffer)]
+    try:
+        views = [np.ndarray(array.shape, array.dtype, buffer=memory.buf) for array, memory in zip((img, buffer), shared)]
+        views[0][:] = img
+        views[1][:] = buffer
+        layout = [(memory.name, array.shape, array.dtype.str) for array, memory in zip((img, buffer), shared)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(vis, stages, layout)) as executor:
+            list(executor.map(_draw_tile, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+        img[:] = views[0]
+        buffer[:] = views[1]
+        del views
+    finally:
+        for memory in shared:
+            memory.close()
+            memory.unlink()
+
+
+def split_triangles(vis, stages, size, chunks):
+    """
+    Данная функция делит последовательность треугольников всех объектов на chunks подряд идущих частей примерно
+    одинаковой площади ограничивающих прямоугольников (объекты целиком попадают в одну часть, если помещаются)
+    :param vis: объект Visualization с настройками отрисовки
+    :param stages: список пар (объект, результат вершинного этапа)
+    :param size: размеры буфера
+    :param chunks: количество частей
+    :return: список частей, каждая - список пар (номер объекта, номера треугольников)
+    """
+    indexes, faces, weights = [], [], []
+    for index, (obj, stage) in enumerate(stages):
+        obj_faces = np.flatnonzero(stage['front']) if vis.back_face_culling else np.arange(len(stage['edges']))
+        x_min, x_max, y_min, y_max = rasterizer.bounding_boxes(stage['screen'], stage['edges'][obj_faces], size)
+        indexes.append(np.full(len(obj_faces), index))
+        faces.append(obj_faces)
+        weights.append(np.maximum(x_max - x_min + 1, 0) * np.maximum(y_max - y_min + 1, 0) + 1)
+    if not faces:
+        return []
+    indexes, faces, weights = np.concatenate(indexes), np.concatenate(faces), np.cumsum(np.concatenate(weights))
+    bounds = np.searchsorted(weights, weights[-1] * np.arange(1, chunks) / chunks)
+    result = []
+    for start, end in zip(np.append(0, bounds), np.append(bounds, len(faces))):
+        items = []
+        for index in np.unique(indexes[start:end]):
+            chunk_faces = faces[start:end][indexes[start:end] == index]
+            items.append((int(index), chunk_faces))
+        if items:
+            result.append(items)
+    return result
+
+
+def composite(images, depths):
+    """
+    Данная функция собирает кадр из частичных изображений: в каждом пикселе берется изображение с наибольшим z,
+    при равенстве - с меньшим номером (как при отрисовке частей по очереди с проверкой buffer[x, y] < z)
+    :param images: массив (k, x, y, 3) изображений
+    :param depths: массив (k, x, y) z-буферов
+    :return: изображение и z-buffer
+    """
+    best = np.argmax(depths, axis=0)[None]
+    return np.take_along_axis(images, best[..., None], axis=0)[0], np.take_along_axis(depths, best, axis=0)[0]
+
+
+def render_sort_last(vis, stages, buffer, img, workers):
+    """
+    Данная функция делит треугольники (и целые объекты) на части, каждую часть процесс пула растеризует в свои
+    матрицу отображения и z-buffer в общей памяти, после чего части собираются по глубине функцией composite.
+    Работа делится по количеству треугольников, а не по площади экрана.
+    :param vis: объект Visualization с настройками отрисовки
+    :param stages: список пар (объект, результат вершинного этапа)
+    :param buffer: z-buffer
+    :param img: матрица отображения
+    :param workers: количество процессов
+    """
+    chunks = split_triangles(vis, stages, buffer.shape, workers)
+    if not chunks:
+        return
+    arrays = [np.empty((len(chunks),) + img.shape, img.dtype), np.empty((len(chunks),) + buffer.shape, buffer.dtype)]
+    shared = [shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1)) for array in arrays]
+    try:
+        views = [np.ndarray(array.shape, array.dtype, buffer=memory.buf) for array, memory in zip(arrays, shared)]
+        views[0][:] = img  # каждая часть рисуется поверх текущего содержимого буферов
+        views[1][:] = buffer
+        layout = [(memory.name, array.shape, array.dtype.str) for array, memory in zip(arrays, shared)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(vis, stages, layout)) as executor:
+            list(executor.map(_draw_chunk, enumerate(chunks)))
+        img[:], buffer[:] = composite(views[0], views[1])
+        del views
+    finally:
+        for memory in shared:
+            memory.close()
+            memory.unlink()
+
+
+def _init_worker(vis, stages, layout):
+    """
+    Данная функция выполняется один раз при запуске процесса пула: подключает общую память и сохраняет настройки
+    """
+    memories = [shared_memory.SharedMemory(name=name) for name, _, _ in layout]
+    _worker['memories'] = memories  # ссылки нужны, пока процесс работает с буферами
+    _worker['img'], _worker['buffer'] = [np.ndarray(shape, np.dtype(dtype), buffer=memory.buf)
+                                         for memory, (_, shape, dtype) in zip(memories, layout)]
+    _worker['vis'] = vis
+    _worker['stages'] = stages
+
+
+def _draw_tile(task):
+    """
+    Данная функция растеризует одну плитку прямо в общую память
+    :param task: пара (границы плитки (x0, y0, x1, y1), список пар (номер объекта, номера треугольников))
+    """
+    rect, items = task
+    vis = _worker['vis']
+    for index, faces in items:
+        obj, stage = _worker['stages'][index]
+        vis.draw(obj, stage, _worker['buffer'], _worker['img'], faces=faces, rect=rect)
+
+
+def _draw_chunk(task):
+    """
+    Данная функция растеризует часть треугольников в свои буферы в общей памяти
+    :param task: пара (номер части, список пар (номер объекта, номера треугольников))
+    """
+    chunk, items = task
+    vis = _worker['vis']
+    for index, faces in items:
+        obj, stage = _worker['stages'][index]
+        vis.draw(obj, stage, _worker['buffer'][chunk], _worker['img'][chunk], faces=faces)
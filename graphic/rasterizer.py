@@ -0,0 +1,147 @@
+import numpy as np
+
+# наибольшее количество пикселей ограничивающих прямоугольников, которые обрабатываются за один раз
+BATCH_PIXELS = 2 ** 19
+
+
+def bounding_boxes(screen, edges, size, rect=None):
+    """
+    Данная функция возвращает ограничивающие прямоугольники треугольников, обрезанные по границам экрана
+    :param screen: массив (n, 4) целых экранных координат
+    :param edges: массив (f, 3) индексов вершин треугольников
+    :param size: размеры буфера (количество x, количество y)
+    :param rect: None или (x0, y0, x1, y1) - часть экрана x0 <= x < x1, y0 <= y < y1, которой ограничивается отрисовка
+    :return: x_min, x_max, y_min, y_max - массивы длины f (границы включаются)
+    """
+    if rect is None:
+        rect = (0, 0, size[0], size[1])
+    xy = screen[edges, :2]  # (f, 3, 2)
+    low = np.maximum(xy.min(axis=1), rect[:2])
+    high = np.minimum(xy.max(axis=1), np.array(rect[2:]) - 1)
+    return low[:, 0], high[:, 0], low[:, 1], high[:, 1]
+
+
+def batches(screen, edges, size, rect=None, batch_pixels=BATCH_PIXELS):
+    """
+    Данная функция делит треугольники на группы подряд идущих треугольников так, чтобы суммарная площадь их
+    ограничивающих прямоугольников была не больше batch_pixels (треугольник больше этого идет отдельной группой)
+    :return: список пар (начало, конец) в номерах треугольников
+    """
+    x_min, x_max, y_min, y_max = bounding_boxes(screen, edges, size, rect)
+    area = np.maximum(x_max - x_min + 1, 0) * np.maximum(y_max - y_min + 1, 0)
+    total = np.cumsum(area)
+    bounds = []
+    start = 0
+    while start < len(edges):
+        end = np.searchsorted(total, total[start] - area[start] + batch_pixels, side='right')
+        end = max(end, start + 1)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def fragments(screen, edges, size, rect=None):
+    """
+    Данная функция находит все пиксели, которые покрывают треугольники, одной векторной операцией для всех
+    прямоугольников. Барицентрические координаты считаются так же, как в get_barr_coords, а затем переводятся
+    в перспективно-корректные делением на w вершин.
+    :param screen: массив (n, 4) целых экранных координат (четвертая координата - w)
+    :param edges: массив (f, 3) индексов вершин треугольников
+    :param size: размеры буфера (количество x, количество y)
+    :param rect: None или часть экрана (x0, y0, x1, y1), за пределами которой фрагменты не создаются
+    :return: словарь с массивами фрагментов в порядке обхода треугольников (по треугольникам, затем по x и y)
+        face - номер треугольника в edges,
+        x, y - экранные координаты,
+        barr - (k, 3) барицентрические координаты в экранном пространстве,
+        barr_clip - (k, 3) перспективно-корректные барицентрические координаты
+    """
+    x_min, x_max, y_min, y_max = bounding_boxes(screen, edges, size, rect)
+    width = np.maximum(x_max - x_min + 1, 0)
+    height = np.maximum(y_max - y_min + 1, 0)
+    count = width * height
+    face = np.repeat(np.arange(len(edges)), count)
+    local = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    x = x_min[face] + local // height[face]
+    y = y_min[face] + local % height[face]
+
+    a, b, c = (screen[edges[face, i]] for i in range(3))
+    ab_x, ab_y = b[:, 0] - a[:, 0], b[:, 1] - a[:, 1]
+    ac_x, ac_y = c[:, 0] - a[:, 0], c[:, 1] - a[:, 1]
+    pa_x, pa_y = a[:, 0] - x, a[:, 1] - y
+    # векторное произведение векторов [ab_x, ac_x, pa_x] и [ab_y, ac_y, pa_y]
+    cross_0 = ac_x * pa_y - pa_x * ac_y
+    cross_1 = pa_x * ab_y - ab_x * pa_y
+    cross_2 = ab_x * ac_y - ac_x * ab_y
+    valid = cross_2 != 0  # вырожденный треугольник не закрашивает ни одного пикселя
+    with np.errstate(divide='ignore', invalid='ignore'):
+        u = cross_0 / cross_2
+        v = cross_1 / cross_2
+        w = 1 - u - v
+    inside = valid & (w >= 0) & (u >= 0) & (v >= 0)
+
+    barr = np.stack([w[inside], u[inside], v[inside]], axis=1)
+    clip_w = np.stack([a[inside, 3], b[inside, 3], c[inside, 3]], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = barr / clip_w
+        barr_clip = s * (1 / (s[:, 0] + s[:, 1] + s[:, 2]))[:, None]
+    return {'face': face[inside], 'x': x[inside], 'y': y[inside], 'barr': barr, 'barr_clip': barr_clip}
+
+
+def dot(a, b):
+    """
+    Данная функция считает скалярные произведения по последней оси. Произведения считаются через np.matmul, поэтому
+    результат до последнего бита совпадает с np.dot для отдельных векторов (а значит и с попиксельной отрисовкой)
+    :param a: массив (..., d)
+    :param b: массив (..., d)
+    :return: массив (...)
+    """
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64))
+    return np.matmul(a[..., None, :], b[..., :, None])[..., 0, 0]
+
+
+def normalize(vectors):
+    """
+    Данная функция нормирует векторы по последней оси так же, как v / np.linalg.norm(v) для отдельного вектора
+    """
+    return vectors / np.sqrt(dot(vectors, vectors))[..., None]
+
+
+def interpolate(barr, values):
+    """
+    Данная функция интерполирует значения в вершинах треугольников
+    :param barr: массив (k, 3) барицентрических координат
+    :param values: массив (k, 3) или (k, 3, d) значений в вершинах
+    :return: массив (k,) или (k, d)
+    """
+    if values.ndim == 2:
+        return dot(barr, values)
+    return dot(barr[:, None, :], np.swapaxes(values, 1, 2))
+
+
+def depth_test(buffer, x, y, z, z_buffer=True):
+    """
+    Данная функция проводит тест глубины для массива фрагментов так же, как если бы они проверялись по одному
+    в переданном порядке условием buffer[x, y] < z: в каждом пикселе побеждает первый фрагмент с наибольшим z,
+    если он больше значения в буфере. Буфер обновляется.
+    :param buffer: z-buffer, индексируется [x, y]
+    :param z_buffer: False - тест не проводится, в каждом пикселе остается последний фрагмент
+    :return: маска фрагментов, которые нужно закрасить
+    """
+    pixel = x * buffer.shape[1] + y
+    sequence = np.arange(len(z))
+    winners = np.zeros(len(z), dtype=bool)
+    if not z_buffer:
+        order = np.lexsort((-sequence, pixel))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pixel[order][1:] != pixel[order][:-1]
+        winners[order[first]] = True
+        return winners
+    finite = np.flatnonzero(~np.isnan(z))
+    order = finite[np.lexsort((sequence[finite], -z[finite], pixel[finite]))]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = pixel[order][1:] != pixel[order][:-1]
+    best = order[first]
+    best = best[buffer[x[best], y[best]] < z[best]]
+    buffer[x[best], y[best]] = z[best]
+    winners[best] = True
+    return winners
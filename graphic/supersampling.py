@@ -0,0 +1,94 @@
+import numpy as np
+from graphic.hiz import HiZ
+from stats import profiler
+
+# наибольшее количество отсчетов (с учетом суперсэмплинга) в одной полосе экрана
+STRIP_SAMPLES = 2 ** 21
+
+
+def filter_weights(factor, kind='box'):
+    """
+    Данная функция возвращает одномерный фильтр для уменьшения изображения в factor раз. Пикселю p соответствует
+    отсчет p * factor, фильтр берет отсчеты p * factor + offset.
+    :param factor: коэффициент суперсэмплинга (количество отсчетов на пиксель по каждой оси)
+    :param kind: 'box' - среднее factor отсчетов вокруг пикселя, 'tent' - треугольный фильтр шириной 2 * factor - 1
+    :return: массив смещений и массив весов (сумма весов равна 1)
+    """
+    if kind == 'box':
+        offsets = np.arange(factor) - factor // 2
+        weights = np.ones(factor)
+    elif kind == 'tent':
+        offsets = np.arange(1 - factor, factor)
+        weights = 1 - np.abs(offsets) / factor
+    else:
+        raise ValueError("Неизвестный фильтр '%s', доступны 'box' и 'tent'" % kind)
+    return offsets, weights / weights.sum()
+
+
+def downsample(samples, factor, start, count, first=0, kind='box', axis=0):
+    """
+    Данная функция уменьшает массив отсчетов вдоль одной оси: пиксели start, ..., start + count - 1 получаются
+    взвешенной суммой отсчетов. У края изображения недостающие отсчеты не учитываются, а веса перенормируются.
+    :param samples: массив отсчетов, вдоль оси axis лежат отсчеты first, first + 1, ...
+    :param factor: коэффициент суперсэмплинга
+    :param start: номер первого пикселя результата
+    :param count: количество пикселей результата
+    :param first: номер отсчета, с которого начинается samples
+    :param kind: фильтр ('box' или 'tent')
+    :param axis: ось, вдоль которой уменьшается массив
+    :return: массив с count элементами вдоль оси axis
+    """
+    offsets, weights = filter_weights(factor, kind)
+    samples = np.moveaxis(samples, axis, 0)
+    result = np.zeros((count,) + samples.shape[1:])
+    norm = np.zeros(count)
+    centers = np.arange(start, start + count) * factor - first
+    for offset, weight in zip(offsets, weights):
+        index = centers + offset
+        valid = (index >= 0) & (index < len(samples))
+        result[valid] += weight * samples[index[valid]]
+        norm[valid] += weight
+    result /= norm.reshape((-1,) + (1,) * (result.ndim - 1))
+    return np.moveaxis(result, 0, axis)
+
+
+def render(vis, world_space, factor, kind='box', strip_samples=STRIP_SAMPLES):
+    """
+    Данная функция рисует кадр с суперсэмплингом (SSAA): вершинный этап считается для экрана в factor раз больше,
+    кадр растеризуется вертикальными полосами (по x), и каждая полоса сразу уменьшается до размера матрицы
+    отображения. Увеличенный кадр целиком не хранится, поэтому память ограничена размером полосы, а не размером
+    изображения.
+    :param vis: объект Visualization с настройками отрисовки и матрицей отображения vis.img
+    :param world_space: объект WorldSpace, размер экрана которого совпадает с размером vis.img
+    :param factor: коэффициент суперсэмплинга
+    :param kind: фильтр уменьшения ('box' или 'tent')
+    :param strip_samples: наибольшее количество отсчетов в одной полосе
+    :return: z-buffer размера матрицы отображения (глубина центрального отсчета каждого пикселя)
+    """
+    width, height = world_space.width * factor, world_space.height * factor
+    size = (width + 1, height + 1)
+    out_x, out_y = world_space.buffer_size
+    stages = list(zip(world_space.objs, world_space.vertex_stages(size=(width, height))))
+    stages = [(obj, stage) for obj, stage in stages if stage is not None]
+    offsets, _ = filter_weights(factor, kind)
+    strip = max(1, strip_samples // (size[1] * factor))  # количество столбцов матрицы отображения в полосе
+    # фон полосы - ближайшие пиксели матрицы отображения
+    rows = np.minimum(np.rint(np.arange(size[1]) / factor).astype(int), out_y - 1)
+    depth = np.full((out_x, out_y), -np.inf)
+    for start in range(0, out_x, strip):
+        end = min(start + strip, out_x)
+        # отсчеты, которые нужны фильтру для пикселей start, ..., end - 1
+        first = max(start * factor + offsets[0], 0)
+        last = min((end - 1) * factor + offsets[-1] + 1, size[0])
+        columns = np.minimum(np.rint(np.arange(first, last) / factor).astype(int), out_x - 1)
+        img = vis.img[columns][:, rows]
+        buffer = np.full((last - first, size[1]), -np.inf)
+        hiz = HiZ(buffer, (first, 0)) if vis.occlusion_culling and vis.z_buffer else None
+        for obj, stage in stages:
+            vis.draw(obj, stage, buffer, img, rect=(first, 0, last, size[1]), origin=(first, 0), scale=factor,
+                     hiz=hiz)
+        with profiler.stage('resample'):
+            color = downsample(img, factor, start, end - start, first, kind, axis=0)
+            vis.img[start:end] = np.rint(downsample(color, factor, 0, out_y, 0, kind, axis=1))
+            depth[start:end] = buffer[np.arange(start, end) * factor - first][:, ::factor]
+    return depth
@@ -0,0 +1,104 @@
+import numpy as np
+
+
+class Texture:
+    def __init__(self, image, mipmaps=False):
+        """
+        Данный класс хранит текстуру, один раз декодированную в непрерывный массив uint8 (высота, ширина, 3),
+        и выбирает из неё цвета сразу для массива текстурных координат.
+        :param image: изображение PIL или массив (высота, ширина, 3)
+        :param mipmaps: True - построить уровни mipmap для выборки с учетом производных текстурных координат
+        """
+        if isinstance(image, np.ndarray):
+            level = np.ascontiguousarray(image[:, :, :3], dtype=np.uint8)
+        else:
+            level = np.ascontiguousarray(np.asarray(image.convert('RGB'), dtype=np.uint8))
+        self.levels = [level]
+        if mipmaps:
+            self.__build_mipmaps()
+        self.size = (level.shape[1], level.shape[0])  # как у изображения PIL: (ширина, высота)
+
+    def __build_mipmaps(self):
+        """
+        Данная функция строит уровни mipmap, усредняя блоки 2x2 предыдущего уровня, пока размер больше 1x1
+        """
+        level = self.levels[0]
+        while level.shape[0] > 1 or level.shape[1] > 1:
+            # при нечетном размере последняя строка/столбец дублируются
+            h, w = level.shape[0] + level.shape[0] % 2, level.shape[1] + level.shape[1] % 2
+            padded = np.pad(level, ((0, h - level.shape[0]), (0, w - level.shape[1]), (0, 0)), mode='edge')
+            blocks = padded.reshape(h // 2, 2, w // 2, 2, 3).astype(np.uint16).sum(axis=(1, 3))
+            level = np.ascontiguousarray(((blocks + 2) // 4).astype(np.uint8))
+            self.levels.append(level)
+
+    def sample(self, u, v, mode='nearest', lod=None):
+        """
+        Данная функция возвращает цвета текстуры для массивов текстурных координат
+        :param u: массив координат u
+        :param v: массив координат v
+        :param mode: 'nearest' - ближайший тексель, 'bilinear' - билинейная интерполяция
+        :param lod: None или массив уровней mipmap (например, из функции lod)
+        :return: массив (n, 3) цветов: uint8 для 'nearest', float для 'bilinear'
+        """
+        u = np.asarray(u, dtype=np.float64)
+        v = np.asarray(v, dtype=np.float64)
+        if lod is None or len(self.levels) == 1:
+            return self.__sample_level(0, u, v, mode)
+        level = np.clip(np.rint(lod), 0, len(self.levels) - 1).astype(int)
+        result = np.empty(u.shape + (3,), dtype=np.uint8 if mode == 'nearest' else np.float64)
+        # выборка группами по уровню mipmap
+        for i in np.unique(level):
+            mask = level == i
+            result[mask] = self.__sample_level(i, u[mask], v[mask], mode)
+        return result
+
+    def lod(self, du_dx, dv_dx, du_dy, dv_dy):
+        """
+        Данная функция выбирает уровень mipmap по экранным производным текстурных координат
+        :return: массив уровней (с плавающей точкой) той же формы, что и производные
+        """
+        w, h = self.size
+        rho = np.maximum(np.hypot(du_dx * w, dv_dx * h), np.hypot(du_dy * w, dv_dy * h))
+        return np.log2(np.maximum(rho, 1))
+
+    def __sample_level(self, index, u, v, mode):
+        level = self.levels[index]
+        h, w = level.shape[:2]
+        if mode == 'nearest':
+            # та же адресация, что и у Image.getpixel((u * w - 1, h - 1 - v * h)) с переходом через край
+            x = np.trunc(u * w - 1).astype(int) % w
+            y = np.trunc(h - 1 - v * h).astype(int) % h
+            return level[y, x]
+        # билинейная интерполяция между центрами четырех соседних текселей
+        x = u * w - .5
+        y = (1 - v) * h - .5
+        x0 = np.floor(x)
+        y0 = np.floor(y)
+        fx = (x - x0)[..., None]
+        fy = (y - y0)[..., None]
+        x0 = x0.astype(int) % w
+        y0 = y0.astype(int) % h
+        x1 = (x0 + 1) % w
+        y1 = (y0 + 1) % h
+        top = level[y0, x0] * (1 - fx) + level[y0, x1] * fx
+        bottom = level[y1, x0] * (1 - fx) + level[y1, x1] * fx
+        return top * (1 - fy) + bottom * fy
+
+
+def triangle_uv_derivatives(screen, uv):
+    """
+    Данная функция считает экранные производные текстурных координат для каждого треугольника
+    :param screen: массив (n, 3, 2) экранных координат вершин треугольников
+    :param uv: массив (n, 3, 2) текстурных координат вершин треугольников
+    :return: du_dx, dv_dx, du_dy, dv_dy - массивы длины n
+    """
+    e1 = screen[:, 1] - screen[:, 0]
+    e2 = screen[:, 2] - screen[:, 0]
+    t1 = uv[:, 1] - uv[:, 0]
+    t2 = uv[:, 2] - uv[:, 0]
+    det = e1[:, 0] * e2[:, 1] - e2[:, 0] * e1[:, 1]
+    det = np.where(det == 0, np.inf, det)  # вырожденный треугольник считаем нулевой производной
+    # решение системы [e1; e2] * [d/dx, d/dy]^T = [t1; t2]
+    d_dx = (t1 * e2[:, 1, None] - t2 * e1[:, 1, None]) / det[:, None]
+    d_dy = (t2 * e1[:, 0, None] - t1 * e2[:, 0, None]) / det[:, None]
+    return d_dx[:, 0], d_dx[:, 1], d_dy[:, 0], d_dy[:, 1]
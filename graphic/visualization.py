@@ -1,24 +1,59 @@
 from random import randint
 import numpy as np
-from geometric_functions.geometry_calculations import equation_plane, get_barr_coords
+from graphic import jit, parallel, rasterizer, supersampling, wireframe
+from graphic.gbuffer import GBuffer
+from graphic.hiz import HiZ
+from graphic.lighting import Material, PointLight, light_levels
+from graphic.texture import Texture, triangle_uv_derivatives
+from stats import profiler
 
 
 class Visualization:
     def __init__(self, img, objs, color_maps=None, camera_p=None, light_p=None,z_buffer=True,
-                 back_face_culling=True, type_model=2, texture=True, type_shadows=1, size=(513, 513)):
+                 back_face_culling=True, type_model=2, texture=True, type_shadows=1, size=None,
+                 texture_filter='nearest', mipmaps=False, deferred=False, gbuffer_attributes=False, workers=1,
+                 tile_size=64, split='tiles', lights=None, materials=None, ssaa=1, ssaa_filter='box',
+                 occlusion_culling=False, backend='numpy'):
         """
         Данная функция растеризует объект.
         :param img: матрица отбражения
         :param objs: объекты отрисовки
-        :param color_maps: текстуры для объектов
+        :param color_maps: текстуры для объектов (по умолчанию - текстуры, привязанные к экземплярам LocalSpace)
         :param camera_p: точка расположения камеры
-        :param light_p: точка располжения света
+        :param light_p: точка располжения света (используется, если не переданы lights)
         :param z_buffer: True - z-buffer включен, False - z-buffer выключен
         :param back_face_culling: True - back-face culling включен, False - back-face culling  выключен
         :param type_model: 0 - объекты не освещяются, 1 - объекты освещяются по Ламберту, 2 - объекты освещяются по Фонгу
         :param texture: True - текстуры включены, False - текстуры выключены
-        :param type_shadows: 0 - затенение через flat shading, 1 - затенение по Фонгу
-        :param size: размеры экрана вывода для буфера
+        :param type_shadows: 0 - затенение через flat shading, 1 - затенение по Фонгу, 2 - затенение по Гуро
+        (освещение считается в вершинах и интерполируется)
+        :param size: размеры буфера (количество x, количество y), по умолчанию - размеры матрицы отображения
+        :param texture_filter: 'nearest' - ближайший тексель, 'bilinear' - билинейная фильтрация текстуры
+        :param mipmaps: True - строить уровни mipmap для текстур
+        :param deferred: True - отложенное освещение: сначала для всего кадра заполняется G-buffer, затем каждый
+        видимый пиксель закрашивается один раз (False - пиксель закрашивается сразу после теста глубины)
+        :param gbuffer_attributes: True - сохранять в G-buffer интерполированные нормали и текстурные координаты
+        :param workers: количество процессов; при workers > 1 работа делится между процессами пула с общей памятью
+        для матриц отображения и z-buffer (G-buffer при этом не используется)
+        :param tile_size: сторона плитки в пикселях
+        :param split: 'tiles' - экран делится на плитки, треугольники распределяются по плиткам;
+        'triangles' - треугольники и объекты делятся на части, которые рисуются в отдельные буферы и собираются
+        по глубине (без z-buffer всегда используются плитки)
+        :param lights: список источников света (PointLight, DirectionalLight), по умолчанию один точечный источник
+        в light_p
+        :param materials: материалы объектов (по умолчанию - материалы, привязанные к экземплярам LocalSpace
+        атрибутом material, или Material())
+        :param ssaa: коэффициент суперсэмплинга: при ssaa > 1 функция render рисует каждый пиксель по ssaa * ssaa
+        отсчетам и усредняет их (полосами, без хранения увеличенного кадра; workers и deferred при этом
+        не используются)
+        :param ssaa_filter: фильтр усреднения отсчетов: 'box' - среднее, 'tent' - треугольный фильтр
+        :param occlusion_culling: True - объекты и треугольники, закрытые уже нарисованным, отбрасываются
+        по иерархическому z-buffer без растеризации (только при включенном z-buffer и без пула процессов;
+        счетчики отброшенного последнего кадра без суперсэмплинга - в self.hiz.stats())
+        :param backend: 'numpy' - векторные операции NumPy, 'numba' - растеризация и закраска циклами,
+        скомпилированными numba (параллельно по плиткам), 'auto' - numba, если она установлена, иначе NumPy.
+        Ядра numba используются без G-buffer и для настроек, которые они поддерживают (jit.supported),
+        в остальных случаях объект рисуется через NumPy; изображения совпадают с точностью до округления
         """
         self.img = img
         self.objs = objs
@@ -26,356 +61,395 @@ class Visualization:
             self.light_point = np.array([0, 1000, 1000])
         else:
             self.light_point = np.array(light_p)
+        self.lights = [PointLight(self.light_point)] if lights is None else lights
         self.camera_point = camera_p
 
+        if size is None:
+            size = img.shape[:2]
         self.width = size[0]
         self.height = size[1]
 
         self.color_maps = color_maps
+        # текстуры декодируются один раз, объект находится по словарю, а не поиском по списку
+        # если color_maps не переданы, то используются текстуры экземпляров; одна текстура декодируется один раз
+        if color_maps is None:
+            color_maps = [getattr(obj, 'texture', None) for obj in objs]
+        decoded = {}
+        for m in color_maps:
+            if m is not None and id(m) not in decoded:
+                decoded[id(m)] = m if isinstance(m, Texture) else Texture(m, mipmaps)
+        self.textures = [decoded.get(id(m)) for m in color_maps]
+        self.texture_index = {id(obj): i for i, obj in enumerate(objs)}
+        if materials is None:
+            materials = [getattr(obj, 'material', None) for obj in objs]
+        self.materials = [Material() if m is None else m for m in materials]
+        self.texture_filter = texture_filter
         self.back_face_culling = back_face_culling
         self.type_model = type_model
         self.texture = texture
         self.type_shadows = type_shadows
         self.z_buffer = z_buffer
-
-        self.buffer = np.array(np.ones((self.height, self.width)) * -np.inf)
-        # коэффиценты для фонового освещения
+        self.deferred = deferred
+        self.gbuffer_attributes = gbuffer_attributes
+        self.gbuffer = None  # G-buffer последнего кадра в режиме deferred
+        self.workers = workers
+        self.tile_size = tile_size
+        self.split = split
+        self.ssaa = ssaa
+        self.ssaa_filter = ssaa_filter
+        self.occlusion_culling = occlusion_culling
+        self.hiz = None  # иерархический z-buffer последнего кадра
+        self.jit_buffers = None  # буферы номеров полигонов и барицентрических координат ядер numba (jit.draw)
+        if backend == 'auto':
+            backend = 'numba' if jit.AVAILABLE else 'numpy'
+        if backend == 'numba' and not jit.AVAILABLE:
+            raise ImportError('Для backend=\'numba\' нужен пакет numba')
+        if backend not in ('numpy', 'numba'):
+            raise ValueError('Неизвестный backend: %s' % backend)
+        self.backend = backend
+
+        self.buffer = np.full((self.width, self.height), -np.inf)
         self.ambient_strength = .1  # сила фонового освещения
-        self.ambient_k = 1  # свойство текстуры для фонового освещения
-
-        # коэффиценты для дифузного освещения
-        self.diffuse_strength = 1  # сила дифузного освещения
-        self.diffuse_k = 1  # свойство текстуры для дифузного освещения
 
-        # коэффиценты для зеркального освещения
-        self.specular_strength = .3  # сила зеркального освещения
-        self.specular_k = 1  # свойство текстуры для зеркального освещения
+    def __setstate__(self, state):
+        """
+        При передаче в другой процесс id объектов меняются, поэтому словарь поиска текстур собирается заново
+        """
+        self.__dict__.update(state)
+        self.texture_index = {id(obj): i for i, obj in enumerate(self.objs)}
 
     def show(self):
         """
-        Растеризация всех объектов
-        """
-        for obj in self.objs:  # цикл по всем объектам
-            # убираем четвертую координату
-            obj.data['original_vertexes'] = obj.data['vertexes'].copy()
-            obj.data['vertexes'] = obj.data['vertexes'][:, :3]
-            obj.data['old_vertexes'] = obj.data['old_vertexes'][:, :3]
-            for i in range(len(obj.data['edges'])):  # цикл по всем полигонам
-                # индексы вершин полигона
-                a = obj.data['edges'][i, 0]
-                b = obj.data['edges'][i, 1]
-                c = obj.data['edges'][i, 2]
-
-                # считаем нормаль к данному полигону и нормируем её
-                norm_face = np.cross(obj.data['old_vertexes'][c] - obj.data['old_vertexes'][a],
-                                     obj.data['old_vertexes'][c] - obj.data['old_vertexes'][b])
-                norm_face = norm_face / np.linalg.norm(norm_face)
-
-                print(i, [obj.data['vertexes'][a], obj.data['vertexes'][b], obj.data['vertexes'][c]])
-                # если back-face culling включен, то проверяем нужно ли оторбражать эту грань
-                # если он не включен или грань нужно оторбражать, то идём дальше
-                if self.back_face_culling:
-                    if np.dot(norm_face, np.array([0, 0, -1])) >= 0:
-                        continue
-                # создаем матрицу трех вершин и находим её минимумы и максимумы по каждой оси
-                vector = self.__get_vector(obj, a, b, c)
-                x_max, y_max = vector.max(axis=0)
-                x_min, y_min = vector.min(axis=0)
-                # проходимся по полученному прямоугольнику
-                for x in range(x_min, x_max + 1):
-                    for y in range(y_min, y_max + 1):
-                        if 0 <= x <= 512 and 0 <= y <= 512: # если x и y лежат внутри экрана оторбражения
-                            # считаем барицентрические координаты для заданной точкиэкранной проекции, после чего
-                            # получаем их для мировых координат
-                            barr_coords = get_barr_coords(x, y, obj.data['vertexes'][a],
-                                                          obj.data['vertexes'][b],
-                                                          obj.data['vertexes'][c])
-
-                            s = np.array([barr_coords[0] / obj.data['original_vertexes'][a][3],
-                                          barr_coords[1] / obj.data['original_vertexes'][b][3],
-                                          barr_coords[2] / obj.data['original_vertexes'][c][3]])
-                            p_z = 1 / s.sum()
-                            barr_clip = s * p_z
-                            # если точка лежит внутри треуголника
-                            if np.all(barr_coords >= 0):
-                                # путем интерполяции получаем z координату для данной точки
-                                z = np.dot(barr_clip, [obj.data['old_vertexes'][a][2],
-                                                         obj.data['old_vertexes'][b][2],
-                                                         obj.data['old_vertexes'][c][2]])
+        Растеризация всех объектов по результатам WorldSpace.pipeline_for_obj
+        """
+        # объект целиком вне пирамиды видимости имеет stage None
+        self.__count_submitted([(obj, obj.stage) for obj in self.objs])
+        self.__render([(obj, obj.stage) for obj in self.objs if obj.stage is not None], self.buffer)
+        self.__end_frame()
 
-                                # если z-buffer включен, то проверяем нужно ли рисовать данный пиксель
-                                # если он не включен или пиксель нужно отображать то идём дальше
-                                if self.z_buffer:
-                                    if self.buffer[x, y] < z:
-                                        self.buffer[x, y] = z
-                                    else:
-                                        continue
-                                # получаем цвет данного пикселя
-                                color = self.__get_color(obj, i, barr_clip)
+    def render(self, world_space, framebuffer=None):
+        """
+        Растеризация всех объектов сцены: вершинный этап берется из WorldSpace (из кэша, если ни объект, ни камера
+        не изменились), z-buffer очищается на месте
+        :param world_space: объект WorldSpace с объектами self.objs
+        :param framebuffer: объект FrameBuffer; если передан, то он очищается, и кадр рисуется в его плоскости
+        (они становятся матрицей отображения и z-buffer)
+        :return: матрица отображения (при включенном профилировании замеры кадра сохраняются в profiler)
+        """
+        if framebuffer is not None:
+            framebuffer.clear()
+            self.img, self.buffer = framebuffer.image, framebuffer.depth
+        if self.img.shape[:2] != world_space.buffer_size:
+            raise ValueError('Размеры матрицы отображения %s не совпадают с размерами экрана WorldSpace %s'
+                             % (self.img.shape[:2], world_space.buffer_size))
+        if self.buffer.shape != self.img.shape[:2]:
+            self.buffer = np.full(self.img.shape[:2], -np.inf)
+        if self.ssaa > 1:
+            self.buffer[:] = supersampling.render(self, world_space, self.ssaa, self.ssaa_filter)
+        else:
+            self.buffer.fill(-np.inf)
+            stages = list(zip(world_space.objs, world_space.vertex_stages()))
+            self.__count_submitted(stages)
+            # объект целиком вне пирамиды видимости имеет stage None
+            self.__render([(obj, stage) for obj, stage in stages if stage is not None], self.buffer)
+        if framebuffer is not None:
+            framebuffer.update_alpha()
+        self.__end_frame()
+        return self.img
 
-                                if self.type_shadows == 0:  # если затенение через flat shading
-                                    # получаем середину данного полигона
-                                    point = np.array(([obj.data['old_vertexes'][a],
-                                                       obj.data['old_vertexes'][b],
-                                                        obj.data['old_vertexes'][c]])).sum(axis=0) / 3
-                                    # получаем уровень освещения данного полигона
-                                    result_light = self.__get_light_lvl(norm_face, point)
-                                else: # если затенение по Фонгу
-                                    # считаем нормаль к данному пикселю путем интерполяции
-                                    n1 = obj.data['normals'][obj.data['edges_normals'][i, 0]]
-                                    n2 = obj.data['normals'][obj.data['edges_normals'][i, 1]]
-                                    n3 = obj.data['normals'][obj.data['edges_normals'][i, 2]]
-                                    n_x = np.dot(barr_clip, [n1[0], n2[0], n3[0]])
-                                    n_y = np.dot(barr_clip, [n1[1], n2[1], n3[1]])
-                                    n_z = np.dot(barr_clip, [n1[2], n2[2], n3[2]])
-                                    norm_pixel = np.array([n_x, n_y, n_z]) / np.linalg.norm(np.array([n_x, n_y, n_z]))
-                                    # получаем уровень освещения данного пикселя
-                                    result_light = self.__get_light_lvl(norm_pixel, [x, y, z])
-                                # умножаем уровень света на цвет после чего записываем в матрицу отображения
-                                self.img[x, y] = np.dot(result_light, color[:3])
+    @staticmethod
+    def __count_submitted(stages):
+        """
+        Данная функция считает треугольники объектов кадра и треугольники, отброшенные отсечением
+        :param stages: список пар (объект, результат вершинного этапа или None)
+        """
+        if not profiler.enabled():
+            return
+        for obj, stage in stages:
+            total = len(obj.data['edges'])
+            profiler.count('triangles_submitted', total)
+            kept = 0 if stage is None else len(np.unique(stage['face_ids']))
+            profiler.count('triangles_culled_frustum', total - kept)
+
+    def __end_frame(self):
+        """
+        Данная функция завершает кадр профилирования: считает закрашенные пиксели для оценки перерисовки
+        """
+        if profiler.enabled():
+            profiler.count('pixels_covered', np.count_nonzero(self.buffer > -np.inf))
+            profiler.end_frame()
 
-    def fragment_shader(self, obj, data, index, buffer, x, y):
+    def __render(self, stages, buffer):
+        """
+        Данная функция растеризует объекты сразу (закраска после теста глубины) или в два прохода через G-buffer
+        :param stages: список пар (объект, результат вершинного этапа)
+        :param buffer: z-buffer
+        """
+        if self.workers > 1 and self.split == 'triangles' and self.z_buffer:
+            # замеры процессов пула не собираются, время отрисовки считается целиком
+            with profiler.stage('raster'):
+                parallel.render_sort_last(self, stages, buffer, self.img, self.workers)
+            return
+        if self.workers > 1:
+            with profiler.stage('raster'):
+                parallel.render_tiles(self, stages, buffer, self.img, self.workers, self.tile_size)
+            return
+        if not self.deferred:
+            self.hiz = HiZ(buffer) if self.occlusion_culling and self.z_buffer else None
+            for obj, stage in stages:
+                self.draw(obj, stage, buffer, self.img, hiz=self.hiz)
+            return
+        if self.gbuffer is None or self.gbuffer.size != buffer.shape \
+                or self.gbuffer.attributes != self.gbuffer_attributes:
+            self.gbuffer = GBuffer(buffer.shape, self.gbuffer_attributes)
+        else:
+            self.gbuffer.clear()
+        self.gbuffer.depth[:] = buffer
+        self.hiz = HiZ(self.gbuffer.depth) if self.occlusion_culling and self.z_buffer else None
+        for index, (obj, stage) in enumerate(stages):
+            self.draw(obj, stage, self.gbuffer.depth, self.img, gbuffer=self.gbuffer, index=index, hiz=self.hiz)
+        buffer[:] = self.gbuffer.depth
+        self.resolve(self.gbuffer, stages, self.img)
+
+    def draw(self, obj, stage, buffer, img, faces=None, gbuffer=None, index=0, rect=None, origin=(0, 0), scale=1,
+             hiz=None):
         """
-        Фрагментный шейдер (закрашивает нужный пиксель)
+        Растеризация треугольников объекта группами: покрытие, тест глубины и закраска считаются векторными
+        операциями над всеми пикселями ограничивающих прямоугольников группы треугольников. Результат совпадает
+        с поочередной отрисовкой треугольников по пикселям.
         :param obj: объект визуализации
-        :param data: информация о вершинах, нормалях полигона
-        :param index: номер полигона
+        :param stage: результат WorldSpace.vertex_stage для объекта
         :param buffer: z-buffer для данного окна визуализации
-        :param x: координата x
-        :param y: координата y
-        :return: если пиксель не нужно оторбражать, то [-1, -1, -1], иначе цвет пикселя
-        """
-        # считаем барицентрические координаты для заданной точки экранной проекции, после чего
-        # получаем их для мировых координат
-        barr_coords = get_barr_coords(x, y, data['new_vertexes'][0],
-                                      data['new_vertexes'][1],
-                                      data['new_vertexes'][2])
-        s = np.array([barr_coords[0] / data['original_vertexes'][0],
-                      barr_coords[1] / data['original_vertexes'][1],
-                      barr_coords[2] / data['original_vertexes'][2]])
-        p_z = 1 / s.sum()
-        barr_clip = s * p_z
-        # если точка лежит внутри треуголника
-        if np.all(barr_coords >= 0):
-            # путем интерполяции получаем z координату для данной точки
-            z = np.dot(barr_clip, [data['vertexes_before_ndc'][0][2],
-                                  data['vertexes_before_ndc'][1][2],
-                                  data['vertexes_before_ndc'][2][2]])
-            # если z-buffer включен, то проверяем нужно ли рисовать данный пиксель
-            # если он не включен или пиксель нужно отображать то идём дальше
-            if self.z_buffer:
-                if buffer[x, y] < z:
-                    if buffer[x,y] != -np.inf:
-                        print(buffer[x,y], z)
-                    buffer[x, y] = z
-                else:
-                    return np.array([-1, -1, -1])
-            # получаем цвет данного пикселя
-            color = self.__get_color(obj, index, barr_clip)
+        :param img: матрица отображения
+        :param faces: номера треугольников для отрисовки (по умолчанию все, кроме отброшенных back-face culling)
+        :param gbuffer: объект GBuffer, если передан, то фрагменты, прошедшие тест глубины, не закрашиваются,
+        а записываются в него (закраска потом делается функцией resolve)
+        :param index: номер объекта, под которым он записывается в gbuffer
+        :param rect: None или часть экрана (x0, y0, x1, y1), за пределы которой отрисовка не выходит
+        :param origin: экранные координаты пикселя buffer[0, 0] (буферы могут хранить только часть экрана)
+        :param scale: во сколько раз экран больше матрицы отображения (при суперсэмплинге); точки для освещения
+        переводятся в масштаб матрицы отображения, чтобы освещение не зависело от количества отсчетов
+        :param hiz: объект HiZ для buffer; если передан, то закрытые объект и треугольники не растеризуются
+        """
+        submitted = len(stage['edges']) if faces is None else len(faces)
+        if faces is None:
+            faces = np.flatnonzero(stage['front']) if self.back_face_culling else np.arange(len(stage['edges']))
+        elif self.back_face_culling:
+            faces = faces[stage['front'][faces]]
+        profiler.count('triangles_culled_backface', submitted - len(faces))
+        screen, edges = stage['screen'], stage['edges']
+        size = buffer.shape
+        if rect is None:
+            rect = (origin[0], origin[1], origin[0] + size[0], origin[1] + size[1])
+        if hiz is not None and hiz.cull_object(stage, rect):
+            profiler.count('triangles_culled_occlusion', len(faces))
+            return
+        with profiler.stage('shading'):
+            prepared = self.__prepare_light(obj, stage, faces, scale) if gbuffer is None else None
+        number = self.texture_index.get(id(obj))
+        texture = None if number is None else self.textures[number]
+        if self.backend == 'numba' and gbuffer is None and jit.supported(self, texture):
+            if hiz is not None:
+                culled = len(faces)
+                faces = hiz.cull_triangles(stage, faces, rect)
+                profiler.count('triangles_culled_occlusion', culled - len(faces))
+            material = Material() if number is None else self.materials[number]
+            x, y = jit.draw(self, stage, buffer, img, faces, rect, origin, scale, prepared, texture, material)
+            if hiz is not None:
+                hiz.written(x, y)
+            return
+        for start, end in rasterizer.batches(screen, edges[faces], size, rect):
+            with profiler.stage('raster'):
+                batch = faces[start:end]
+                if hiz is not None:
+                    batch = hiz.cull_triangles(stage, batch, rect)
+                    profiler.count('triangles_culled_occlusion', end - start - len(batch))
+                fragments = rasterizer.fragments(screen, edges[batch], size, rect)
+                face = batch[fragments['face']]
+                z = rasterizer.interpolate(fragments['barr_clip'], stage['view'][edges[face], 2])
+                x, y = fragments['x'] - origin[0], fragments['y'] - origin[1]  # индексы в буферах
+                winners = rasterizer.depth_test(buffer, x, y, z, self.z_buffer)
+                face, x, y, z = face[winners], x[winners], y[winners], z[winners]
+                if hiz is not None:
+                    hiz.written(x, y)
+                profiler.count('triangles_rasterized', len(batch))
+                profiler.count('fragments_tested', len(winners))
+                profiler.count('fragments_written', len(face))
+                if gbuffer is not None:
+                    gbuffer.write(index, face, x, y, fragments['barr_clip'][winners])
+            if gbuffer is None:
+                with profiler.stage('shading'):
+                    img[x, y] = self.__shade(obj, stage, face, (x + origin[0]) / scale, (y + origin[1]) / scale, z,
+                                             fragments['barr_clip'][winners], prepared)
+
+    def resolve(self, gbuffer, stages, img):
+        """
+        Второй проход отложенного освещения: каждый видимый пиксель кадра закрашивается ровно один раз
+        :param gbuffer: заполненный объект GBuffer
+        :param stages: список пар (объект, результат вершинного этапа) в порядке номеров объектов в gbuffer
+        :param img: матрица отображения
+        """
+        with profiler.stage('shading'):
+            for index, (x, y, face, barr_clip) in gbuffer.samples().items():
+                obj, stage = stages[index]
+                z = rasterizer.interpolate(barr_clip, stage['view'][stage['edges'][face], 2])
+                prepared = self.__prepare_light(obj, stage, np.unique(face))
+                normal = uv = None
+                if gbuffer.attributes:
+                    # атрибуты записываются в G-buffer до закраски, и закраска берет их оттуда
+                    normal = rasterizer.interpolate(barr_clip, stage['normals'][stage['edges_normals'][face], :3])
+                    gbuffer.normal[x, y] = normal = rasterizer.normalize(normal)
+                    if len(stage['textures']):
+                        corners = stage['textures'][stage['edges_textures'][face], :2]
+                        gbuffer.uv[x, y, 0] = rasterizer.interpolate(barr_clip, corners[:, :, 0])
+                        gbuffer.uv[x, y, 1] = rasterizer.interpolate(barr_clip, corners[:, :, 1])
+                        uv = gbuffer.uv[x, y]
+                img[x, y] = self.__shade(obj, stage, face, x, y, z, barr_clip, prepared, normal, uv)
+
+    def __prepare_light(self, obj, stage, faces, scale=1):
+        """
+        Данная функция заранее считает освещение, которое не зависит от пикселя: для flat shading - уровень света
+        каждого полигона, для затенения по Гуро - уровень света каждой вершины (пары вершина-нормаль) один раз
+        :param obj: объект визуализации
+        :param stage: результат вершинного этапа объекта
+        :param faces: номера полигонов, которые будут рисоваться
+        :param scale: во сколько раз экран больше матрицы отображения
+        :return: None для затенения по Фонгу, иначе массив (f,) уровней полигонов или (f, 3) уровней их вершин
+        """
+        if self.type_shadows == 0:  # если затенение через flat shading
+            levels = np.zeros(len(stage['edges']))
+            # середина и нормаль полигона
+            triangles = stage['view'][stage['edges'][faces], :3]
+            point = (triangles[:, 0] + triangles[:, 1] + triangles[:, 2]) / 3
+            levels[faces] = self.__get_light_lvl(obj, self.__face_normal(triangles), point)
+            return levels
+        if self.type_shadows == 2:  # если затенение по Гуро
+            levels = np.zeros(stage['edges'].shape)
+            # вершина освещается по той же точке, что и пиксель при затенении по Фонгу: экранные x, y и z
+            corners = np.stack([stage['edges'][faces], stage['edges_normals'][faces]], axis=2).reshape(-1, 2)
+            unique, inverse = np.unique(corners, axis=0, return_inverse=True)
+            point = np.concatenate([stage['screen'][unique[:, 0], :2] / scale, stage['view'][unique[:, 0], 2:3]],
+                                   axis=1)
+            normal = rasterizer.normalize(stage['normals'][unique[:, 1], :3])
+            lights = np.broadcast_to(self.__get_light_lvl(obj, normal, point), len(unique))
+            levels[faces] = lights[np.reshape(inverse, -1)].reshape(-1, 3)
+            return levels
+        return None
+
+    def __shade(self, obj, stage, face, x, y, z, barr_clip, prepared=None, normal=None, uv=None):
+        """
+        Данная функция закрашивает фрагменты: цвет текстуры умножается на уровень освещения
+        :param prepared: результат __prepare_light для полигонов face
+        :param normal: None или массив (k, 3) единичных нормалей фрагментов (например, из G-buffer)
+        :param uv: None или массив (k, 2) текстурных координат фрагментов (например, из G-buffer)
+        :return: массив (k, 3) цветов, округленных до целых
+        """
+        profiler.count('fragments_shaded', len(face))
+        # получаем цвет пикселей
+        color = self.__get_color(obj, stage, face, barr_clip, uv)
+        if self.type_shadows == 0:  # если затенение через flat shading, то уровень света полигона
+            result_light = prepared[face]
+        elif self.type_shadows == 2:  # если затенение по Гуро, то интерполируем уровни света вершин
+            result_light = rasterizer.interpolate(barr_clip, prepared[face])
+        else:  # если затенение по Фонгу
+            if normal is None:
+                # считаем нормаль к пикселям путем интерполяции
+                normal = rasterizer.interpolate(barr_clip, stage['normals'][stage['edges_normals'][face], :3])
+                normal = rasterizer.normalize(normal)
+            result_light = self.__get_light_lvl(obj, normal, np.stack([x, y, z], axis=1))
+        # умножаем уровень света на цвет
+        return np.rint(np.reshape(result_light, (-1, 1)) * color[:, :3])
 
-            if self.type_shadows == 0: # если затенение через flat shading
-                # получаем середину данного полигона
-                point = np.array([data['vertexes_before_ndc'][0],
-                                  data['vertexes_before_ndc'][1],
-                                  data['vertexes_before_ndc'][2]]).sum(axis=0) / 3
-                # получаем уровень освещения данного полигона
-                result_light = self.__get_light_lvl(data['norm_face'], point)
-            else:  # если затенение по Фонгу
-                # считаем нормаль к данному пикселю путем интерполяции
-                n1 = data['new_normals'][0]
-                n2 = data['new_normals'][1]
-                n3 = data['new_normals'][2]
-                n_x = np.dot(barr_clip, [n1[0], n2[0], n3[0]])
-                n_y = np.dot(barr_clip, [n1[1], n2[1], n3[1]])
-                n_z = np.dot(barr_clip, [n1[2], n2[2], n3[2]])
-                norm_pixel = np.array([n_x, n_y, n_z]) / np.linalg.norm(np.array([n_x, n_y, n_z]))
-                # получаем уровень освещения данного пикселя
-                result_light = self.__get_light_lvl(norm_pixel, [x, y, z])
-            # умножаем уровень света на цвет после чего возвращеем его
-            return np.dot(result_light, color[:3])
-        else:
-            return np.array([-1, -1, -1])
-        
     def fill_triangle(self, obj, data, index, buffer, img):
         """
-        Функция отрисовка полигона, которая вызывает фрагментный шейдер
+        Функция отрисовка одного полигона
         :param obj: объект визуализации
         :param data: информация о вершинах, нормалях полигона
         :param index: номер полигона
         :param buffer: z-buffer для данного окна визуализации
         :param img: матрица отображения
         """
-        # убираем четвертую координату
-        data['original_vertexes'] = data['new_vertexes'][:, 3].copy()
-        data['new_vertexes'] = data['new_vertexes'][:, :3].copy()
-        data['vertexes_before_ndc'] = data['vertexes_before_ndc'][:, :3]
-
-        # считаем нормаль к данному полигону и нормируем её
-        norm_face = np.cross(data['vertexes_before_ndc'][2] - data['vertexes_before_ndc'][0],
-                             data['vertexes_before_ndc'][2] - data['vertexes_before_ndc'][1])
-        data['norm_face'] = norm_face / np.linalg.norm(norm_face)
-
-        # если back-face culling включен, то проверяем нужно ли оторбражать эту грань
-        # если он не включен или грань нужно оторбражать, то идём дальше
-        if self.back_face_culling:
-            if np.dot(norm_face, np.array([0, 0, -1])) >= 0:
-                return
-        x_max, y_max = np.max(data['new_vertexes'][:, :2], axis=0)
-        x_min, y_min = np.min(data['new_vertexes'][:, :2], axis=0)
-        # проходимся по полученному прямоугольнику
-        for x in range(x_min, x_max + 1):
-            for y in range(y_min, y_max + 1):
-                if 0 <= x <= 512 and 0 <= y <= 512: # если x и y лежат внутри экрана оторбражения
-                    # получаем цвет данного пикселя
-                    color = self.fragment_shader(obj, data, index, buffer, x, y)
-                    if np.all(color >= 0): # если функция вернула цвет пикселя, то рисуем его
-                        img[x, y] = np.rint(color)
-
-    def __get_color(self, obj,index,barr_coords):
-        """
-        Данная функция извелекает из текстуры цвет конкретной точки путем интерполяции
-        :param obj: объект визуализации
-        :param index: номер вершины
-        :param barr_coords: барицентрические координаты для этой точки
-        :return: цвет
-        """
-        if self.texture: # если оторбражение текстуры включенно
-            # получаем координты для получения цвета у вершин полигона
-            u1, v1 = obj.data['textures'][obj.data['edges_textures'][index, 0], :2]
-            u2, v2 = obj.data['textures'][obj.data['edges_textures'][index, 1], :2]
-            u3, v3 = obj.data['textures'][obj.data['edges_textures'][index, 2], :2]
-            # получаем координаты цвета нужной нам координты
-            u = np.dot(barr_coords, [u1, u2, u3])
-            v = np.dot(barr_coords, [v1, v2, v3])
-            # разрешения текстуры
-            w = self.color_maps[self.objs.index(obj)].size[0]
-            h = self.color_maps[self.objs.index(obj)].size[1]
-            # получаем цвет данного пикселя
-            color = self.color_maps[self.objs.index(obj)].getpixel((u * w - 1,
-                                             h - 1 - v *
-                                             h))
-        else:  # если текстура выключена, то используем стандартный цвет
-            color = np.array([127,127,127])
-        return color
-
-    def __get_light_lvl(self, normal, point):
+        textures = data.get('textures')
+        if textures is None:
+            textures = obj.data['textures'][obj.data['edges_textures'][index]]
+        view = np.asarray(data['vertexes_before_ndc'])
+        corners = np.array([[0, 1, 2]])
+        stage = {'screen': np.asarray(data['new_vertexes']), 'view': view, 'normals': np.asarray(data['new_normals']),
+                 'textures': np.asarray(textures), 'edges': corners, 'edges_normals': corners,
+                 'edges_textures': corners,
+                 'front': np.dot(self.__face_normal(view[None, :, :3]), np.array([0, 0, -1])) < 0}
+        self.draw(obj, stage, buffer, img, np.array([0]))
+
+    @staticmethod
+    def __face_normal(triangles):
         """
-        Данная функция возвращает уровень освещенность для переданной точки
-        :param normal: нормаль к это точки
-        :param point: точка для которой считаем освещенность
-        :return: уровень освещенности
+        Данная функция считает единичные нормали полигонов по их вершинам (f, 3, 3)
         """
-        if self.type_model == 0: # если освещение выключено
-            result_light = 1
-        elif self.type_model == 1: # если освещение по Ламберту
-            result_light = self.__ambient() + self.__diffuse(normal, point)
-        else:  # если освещение по Фонгу
-            result_light = self.__ambient() + self.__diffuse(normal, point) \
-                           + self.__specular(normal, point, 2)
-        return result_light
+        norm_face = np.cross(triangles[:, 2] - triangles[:, 0], triangles[:, 2] - triangles[:, 1])
+        return rasterizer.normalize(norm_face)
 
-    def __get_vector(self, obj, a, b, c):
+    def __get_color(self, obj, stage, face, barr_coords, pixel_uv=None):
         """
-        Данная функция создает матрицу для трех вершин
+        Данная функция извелекает из текстуры цвета пикселей путем интерполяции текстурных координат
+        :param obj: объект визуализации
+        :param stage: результат вершинного этапа объекта
+        :param face: массив номеров полигонов пикселей
+        :param barr_coords: массив (k, 3) барицентрических координат пикселей
+        :param pixel_uv: None или уже интерполированные текстурные координаты (k, 2)
+        :return: массив (k, 3) цветов
         """
-        vector = np.array([
-            [obj.data['vertexes'][a][0], obj.data['vertexes'][a][1]],
-            [obj.data['vertexes'][b][0], obj.data['vertexes'][b][1]],
-            [obj.data['vertexes'][c][0], obj.data['vertexes'][c][1]]
-        ]).astype(int)
-        return vector
-
-    # def __get_pixel_normal(self, obj,index, barr_coords):
-    #     n1 = obj.data['normals'][obj.data['edges_normals'][index, 0]]
-    #     n2 = obj.data['normals'][obj.data['edges_normals'][index, 1]]
-    #     n3 = obj.data['normals'][obj.data['edges_normals'][index, 2]]
-    #     n_x = np.dot(barr_coords, [n1[0], n2[0], n3[0]])
-    #     n_y = np.dot(barr_coords, [n1[1], n2[1], n3[1]])
-    #     n_z = np.dot(barr_coords, [n1[2], n2[2], n3[2]])
-    #     pixel_normal = np.array([n_x, n_y, n_z]) / np.linalg.norm(np.array([n_x, n_y, n_z]))
-    #     return pixel_normal
-
-    def __ambient(self):
+        texture = self.textures[self.texture_index[id(obj)]] if id(obj) in self.texture_index else None
+        if not self.texture or texture is None or len(stage['textures']) == 0:
+            # если текстура выключена, то используем стандартный цвет
+            return np.full((len(face), 3), 127)
+        # текстурные координаты вершин полигонов
+        uv = stage['textures'][stage['edges_textures'][face], :2]
+        if pixel_uv is None:
+            u = rasterizer.interpolate(barr_coords, uv[:, :, 0])
+            v = rasterizer.interpolate(barr_coords, uv[:, :, 1])
+        else:
+            u, v = pixel_uv[:, 0], pixel_uv[:, 1]
+        lod = None
+        if len(texture.levels) > 1:
+            # уровень mipmap по экранным производным текстурных координат полигона
+            screen = stage['screen'][stage['edges'][face], :2].astype(np.float64)
+            lod = texture.lod(*triangle_uv_derivatives(screen, uv))
+        return texture.sample(u, v, self.texture_filter, lod)
+
+    def __get_light_lvl(self, obj, normal, point):
         """
-        Данная функция считает фоновое освещение путем умножения силы данного освещения на свойство материала
+        Данная функция возвращает уровень освещенность для переданных точек объекта от всех источников света
+        :param obj: объект визуализации (по нему выбирается материал)
+        :param normal: массив (k, 3) нормалей к этим точкам
+        :param point: массив (k, 3) точек для которых считаем освещенность
+        :return: уровень освещенности
         """
-        return self.ambient_strength * self.ambient_k
+        material = self.materials[self.texture_index[id(obj)]] if id(obj) in self.texture_index else Material()
+        return light_levels(normal, point, self.camera_point, self.lights, material, self.type_model,
+                            self.ambient_strength)
 
-    def __diffuse(self, normal, point):
+    def draw_edges(self, stages=None, color=(255, 255, 255), hidden_lines=False, buffer=None):
         """
-        Данная функция считает диффузное освещение
-        :param normal: нормаль к точке
-        :param point: точка переданная для освещещения
-        :return неотрицательный косинус между нормалью и направлением луча света умноженного на силу данного типа света
-        и его свойство материала
+        Каркасная отрисовка: ребра всех объектов рисуются без повторов (общее ребро соседних треугольников - один
+        раз) векторными операциями над всеми отрезками
+        :param stages: список пар (объект, результат вершинного этапа), по умолчанию берутся obj.stage
+        :param color: цвет ребер
+        :param hidden_lines: True - удалять невидимые ребра тестом глубины
+        :param buffer: z-buffer для удаления невидимых ребер (например, после закраски кадра); если не передан,
+        то он заполняется треугольниками всех объектов без закраски
+        :return: матрица отображения
         """
-        light_dir = self.light_point - point  # направления луча света
-        return max(np.dot(normal, light_dir/np.linalg.norm(light_dir)), 0) *self.diffuse_strength*self.diffuse_k
-
-    def __specular(self, normal, point, alpha):
-        """
-        Данная функция считает зеркальное освещение
-        :param normal: нормаль к точке
-        :param point: точка переданная для освещещения
-        :param alpha: параметр площади блика
-        :return неотрицательный косинус между направлением на наблюдателя и направлением отраженного луча умноженного на
-        а силу данного типа света и его свойство материала
-        """
-        light_dir = self.light_point - point  # направления луча света
-        reflect = -(2 * normal * np.dot(-light_dir, normal) + light_dir) # направление отраженного луча
-        view_dir = self.camera_point - point  # направление на наблюдателя
-        return self.specular_strength * self.specular_k * \
-               max(np.dot(reflect/np.linalg.norm(reflect), view_dir/np.linalg.norm(view_dir)), 0) ** alpha
-
-
-    def draw_edges(self):
-        for v1, v2, v3 in self.objs[0].data['edges']:  # get the numbers of string
-            self.__draw_line(v1, v2)
-            self.__draw_line(v1, v3)
-            self.__draw_line(v2, v3)
-        return self.img
-
-
-
-    def __draw_line(self, start, end):
-        x0, y0 = self.objs[0].data['vertexes'][start][0], self.objs[0].data['vertexes'][start][1]
-        x1, y1 = self.objs[0].data['vertexes'][end][0], self.objs[0].data['vertexes'][end][1]
-
-        # get distance
-        dx = abs(x1 - x0)
-        dy = abs(y1 - y0)
-
-        # definition format of the line
-        steep = False
-        if dy > dx:  # to do the line more broad than long
-            x0, y0 = y0, x0
-            x1, y1 = y1, x1
-            dx, dy = dy, dx
-            steep = True
-        if x0 > x1:  # to do the line from left to right
-            x0, x1 = x1, x0
-            y0, y1 = y1, y0
-
-        err = 0
-        d_err = dy  # value of the slope
-        y = y0
-        # definition signum y
-        sgn_y = y1 - y0
-        sgn_y = 1 if sgn_y > 0 else -1
-
-        # to draw the line
-
-        for x in range(x0, x1 + 1):
-            if 0 <= x <= 512 and 0 <= y <= 512:
-                # draw the point
-                if steep:
-                    self.img[y, x] = [255, 255, 255]
-                else:
-                    self.img[x, y] = [255, 255, 255]
-                err += d_err  # increasing the error
-                # if the error has exceeded the allowable norm
-                if 2 * err >= dx:
-                    y += sgn_y
-                    err -= dx
+        if stages is None:
+            stages = [(obj, obj.stage) for obj in self.objs]
+        stages = [(obj, stage) for obj, stage in stages if stage is not None]
+        visible = [np.flatnonzero(stage['front']) if self.back_face_culling else np.arange(len(stage['edges']))
+                   for obj, stage in stages]
+        if hidden_lines and buffer is None:
+            buffer = np.full(self.img.shape[:2], -np.inf)
+            for (obj, stage), faces in zip(stages, visible):
+                wireframe.depth_pass(stage, faces, buffer)
+        for (obj, stage), faces in zip(stages, visible):
+            lines = wireframe.stage_edges(obj, stage, faces)
+            wireframe.draw_lines(self.img, stage['screen'], lines, color, stage['view'],
+                                 buffer if hidden_lines else None)
         return self.img
-
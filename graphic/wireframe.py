@@ -0,0 +1,129 @@
+import numpy as np
+from geometric_functions.geometry_calculations import unique_edges
+from graphic import rasterizer
+
+# относительный допуск теста глубины для ребер: ребро лежит на поверхности, и его глубина отличается от глубины
+# треугольников в том же пикселе только из-за округления экранных координат
+DEPTH_BIAS = 1e-2
+
+
+def stage_edges(obj, stage, faces):
+    """
+    Данная функция возвращает ребра треугольников faces результата вершинного этапа без повторов. Для треугольников,
+    которые не разрезались при отсечении, берутся ребра модели из кэша Mesh.wireframe, ребра разрезанных
+    треугольников (с новыми вершинами) находятся заново.
+    :param obj: экземпляр LocalSpace
+    :param stage: результат вершинного этапа объекта
+    :param faces: номера треугольников stage
+    :return: массив (e, 2) индексов вершин stage
+    """
+    edges = stage['edges'][faces]
+    original = obj.data['edges'][stage['face_ids'][faces]]
+    whole = np.all(edges == original, axis=1)
+    lines, face_edges = obj.mesh.wireframe()
+    result = lines[np.unique(face_edges[stage['face_ids'][faces][whole]])]
+    if whole.all():
+        return result
+    # ребро разрезанного треугольника может совпадать с ребром целого соседа
+    lines = np.concatenate([result, unique_edges(edges[~whole])[0]])
+    count = len(stage['view'])
+    keys = np.unique(lines[:, 0] * count + lines[:, 1])
+    return np.stack([keys // count, keys % count], axis=1)
+
+
+def line_fragments(screen, lines, size):
+    """
+    Данная функция находит пиксели отрезков одной векторной операцией для всех отрезков: отрезок обрезается
+    границами экрана и проходится с шагом в один пиксель по большей из разностей координат
+    :param screen: массив (n, 4) целых экранных координат (четвертая координата - w)
+    :param lines: массив (e, 2) индексов вершин отрезков
+    :param size: размеры буфера (количество x, количество y)
+    :return: словарь с массивами
+        line - номер отрезка в lines,
+        x, y - экранные координаты,
+        t - (k,) перспективно-корректный параметр точки на отрезке (0 - первая вершина, 1 - вторая)
+    """
+    a = screen[lines[:, 0]].astype(np.float64)
+    b = screen[lines[:, 1]].astype(np.float64)
+    delta = b[:, :2] - a[:, :2]
+    steps = np.abs(delta).max(axis=1)
+    # отсечение отрезков прямоугольником экрана (Лианг-Барски) в параметре t от 0 до 1
+    low, high = np.zeros(len(lines)), np.ones(len(lines))
+    for axis in range(2):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t1 = (0 - a[:, axis]) / delta[:, axis]
+            t2 = (size[axis] - 1 - a[:, axis]) / delta[:, axis]
+        parallel = delta[:, axis] == 0
+        inside = (a[:, axis] >= 0) & (a[:, axis] <= size[axis] - 1)
+        low = np.where(parallel, np.where(inside, low, 1), np.maximum(low, np.minimum(t1, t2)))
+        high = np.where(parallel, np.where(inside, high, 0), np.minimum(high, np.maximum(t1, t2)))
+    first = np.ceil(low * steps).astype(np.int64)
+    last = np.floor(high * steps).astype(np.int64)
+    count = np.maximum(last - first + 1, 0)
+
+    line = np.repeat(np.arange(len(lines)), count)
+    step = first[line] + np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    t = step / np.maximum(steps[line], 1)
+    x = np.rint(a[line, 0] + t * delta[line, 0]).astype(np.int64)
+    y = np.rint(a[line, 1] + t * delta[line, 1]).astype(np.int64)
+    inside = (x >= 0) & (x < size[0]) & (y >= 0) & (y < size[1])
+    line, t, x, y = line[inside], t[inside], x[inside], y[inside]
+    # перспективная коррекция так же, как для барицентрических координат треугольников
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s0, s1 = (1 - t) / a[line, 3], t / b[line, 3]
+        t = s1 / (s0 + s1)
+    return {'line': line, 'x': x, 'y': y, 't': t}
+
+
+def depth_pass(stage, faces, buffer):
+    """
+    Данная функция заполняет z-buffer треугольниками без закраски (для удаления невидимых ребер)
+    :param stage: результат вершинного этапа объекта
+    :param faces: номера треугольников
+    :param buffer: z-buffer
+    """
+    screen, edges = stage['screen'], stage['edges']
+    for start, end in rasterizer.batches(screen, edges[faces], buffer.shape):
+        batch = faces[start:end]
+        fragments = rasterizer.fragments(screen, edges[batch], buffer.shape)
+        face = batch[fragments['face']]
+        z = rasterizer.interpolate(fragments['barr_clip'], stage['view'][edges[face], 2])
+        rasterizer.depth_test(buffer, fragments['x'], fragments['y'], z)
+
+
+def draw_lines(img, screen, lines, color=(255, 255, 255), view=None, buffer=None, bias=DEPTH_BIAS,
+               batch_pixels=rasterizer.BATCH_PIXELS):
+    """
+    Данная функция рисует отрезки группами, количество пикселей в группе не больше batch_pixels
+    :param img: матрица отображения
+    :param screen: массив (n, 4) целых экранных координат (или (n, 2) - тогда w считается равным 1)
+    :param lines: массив (e, 2) индексов вершин отрезков
+    :param color: цвет отрезков
+    :param view: массив (n, 4) вершин в lookAt системе, нужен для теста глубины
+    :param buffer: z-buffer; если передан, то рисуются только пиксели, которые не закрыты треугольниками
+    :param bias: относительный допуск теста глубины
+    :return: матрица отображения
+    """
+    screen = np.asarray(screen)
+    if screen.shape[1] < 4:
+        screen = np.concatenate([screen[:, :2], np.zeros((len(screen), 1)), np.ones((len(screen), 1))], axis=1)
+    lines = np.asarray(lines).reshape(-1, 2)
+    if len(lines) == 0:
+        return img
+    size = img.shape[:2]
+    length = np.abs(screen[lines[:, 1], :2] - screen[lines[:, 0], :2]).max(axis=1) + 1
+    total = np.cumsum(np.minimum(length, size[0] + size[1]))  # длина видимой части не больше периметра экрана
+    start = 0
+    while start < len(lines):
+        offset = total[start - 1] if start else 0
+        end = max(np.searchsorted(total, offset + batch_pixels, side='right'), start + 1)
+        fragments = line_fragments(screen, lines[start:end], size)
+        x, y = fragments['x'], fragments['y']
+        if buffer is not None:
+            line = lines[start:end][fragments['line']]
+            z = view[line[:, 0], 2] + fragments['t'] * (view[line[:, 1], 2] - view[line[:, 0], 2])
+            visible = z >= buffer[x, y] - bias * np.abs(buffer[x, y])
+            x, y = x[visible], y[visible]
+        img[x, y] = color
+        start = end
+    return img
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from geometric_functions import affine_transformation as at
+from reader import extract
+
+# имена массивов в том порядке, в котором их возвращает extract.load_obj
+ARRAY_NAMES = ('vertexes', 'textures', 'normals', 'edges', 'edges_textures', 'edges_normals')
+# массивы, которые хранятся сразу в проективных координатах (n, 4) float64, как в Mesh, чтобы Mesh
+# использовал memory-map без копирования
+PROJECTIVE = ('vertexes', 'normals')
+# версия формата записей, записи другого формата пересобираются
+FORMAT = 2
+
+
+class MeshCache:
+    def __init__(self, cache_dir=None, max_size=512 * 2 ** 20):
+        """
+        Данный класс хранит уже разобранные obj-файлы в бинарном виде (.npy), чтобы при повторной загрузке не разбирать
+        текст заново. Записи ищутся по пути до файла и функции разбора и проверяются по размеру и времени
+        изменения файла, устаревшие записи пересобираются. Массивы загружаются через memory-map.
+        :param cache_dir: папка для хранения кэша, по умолчанию ~/.cache/RenderModel/meshes
+        :param max_size: максимальный размер кэша в байтах, при превышении удаляются давно не использованные записи
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'RenderModel', 'meshes')
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def load(self, name_file, loader=extract.load_obj):
+        """
+        Данная функция возвращает данные объекта из кэша, если запись актуальна, иначе разбирает файл и сохраняет его
+        :param name_file: путь до файла
+        :param loader: функция разбора файла, которая возвращает массивы в порядке ARRAY_NAMES
+        :return: кортеж массивов в порядке ARRAY_NAMES (только для чтения); вершины и нормали - в проективных
+        координатах (n, 4)
+        """
+        entry = self.__entry_path(name_file, loader)
+        key = self.__file_key(name_file, loader)
+        if self.__read_meta(entry) == key:
+            try:
+                arrays = tuple(np.load(os.path.join(entry, name + '.npy'), mmap_mode='r') for name in ARRAY_NAMES)
+            except (OSError, ValueError):  # запись повреждена, пересобираем её
+                pass
+            else:
+                os.utime(os.path.join(entry, 'meta.json'))  # отмечаем время последнего использования
+                return arrays
+        arrays = loader(name_file)
+        self.__store(entry, key, arrays)
+        self.__evict(keep=entry)
+        return tuple(np.load(os.path.join(entry, name + '.npy'), mmap_mode='r') for name in ARRAY_NAMES)
+
+    def size(self):
+        """
+        Данная функция возвращает суммарный размер всех записей кэша в байтах
+        """
+        return sum(self.__entry_size(entry) for entry in self.__entries())
+
+    def clear(self):
+        """
+        Данная функция удаляет все записи кэша
+        """
+        for entry in self.__entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def __entry_path(self, name_file, loader):
+        """
+        Данная функция возвращает папку записи для переданного файла и функции разбора
+        """
+        name = hashlib.sha1((os.path.abspath(name_file) + '\0' + _loader_name(loader)).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, name)
+
+    @staticmethod
+    def __file_key(name_file, loader):
+        """
+        Данная функция возвращает ключ актуальности записи: путь, размер и время изменения файла, функция разбора
+        и формат записи
+        """
+        stat = os.stat(name_file)
+        return {'path': os.path.abspath(name_file), 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                'loader': _loader_name(loader), 'format': FORMAT}
+
+    @staticmethod
+    def __read_meta(entry):
+        try:
+            with open(os.path.join(entry, 'meta.json'), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def __store(self, entry, key, arrays):
+        """
+        Данная функция записывает массивы во временную папку, после чего заменяет ею старую запись
+        """
+        temp = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp')
+        try:
+            for name, array in zip(ARRAY_NAMES, arrays):
+                if name in PROJECTIVE:
+                    array = at.vertexes_to_projective(np.asarray(array, dtype=np.float64).reshape(-1, 3))
+                np.save(os.path.join(temp, name + '.npy'), np.ascontiguousarray(array))
+            with open(os.path.join(temp, 'meta.json'), 'w') as f:
+                json.dump(key, f)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(temp, entry)
+        finally:
+            shutil.rmtree(temp, ignore_errors=True)
+
+    def __entries(self):
+        return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                if not name.startswith('.') and os.path.isdir(os.path.join(self.cache_dir, name))]
+
+    @staticmethod
+    def __entry_size(entry):
+        return sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+
+    def __evict(self, keep):
+        """
+        Данная функция удаляет давно не использованные записи, пока размер кэша больше max_size
+        :param keep: запись, которую удалять нельзя
+        """
+        entries = []
+        for entry in self.__entries():
+            meta = os.path.join(entry, 'meta.json')
+            last_used = os.path.getmtime(meta) if os.path.exists(meta) else 0
+            entries.append((last_used, entry, self.__entry_size(entry)))
+        total = sum(size for _, _, size in entries)
+        for _, entry, size in sorted(entries):
+            if total <= self.max_size:
+                break
+            if entry != keep:
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+
+
+def _loader_name(loader):
+    """
+    Данная функция возвращает полное имя функции разбора (модуль и имя), по которому различаются записи кэша
+    """
+    function = getattr(loader, 'func', loader)  # functools.partial
+    name = '%s.%s' % (getattr(function, '__module__', ''), getattr(function, '__qualname__', type(function).__name__))
+    if function is not loader:
+        name += repr((loader.args, sorted(loader.keywords.items())))
+    return name
@@ -1,29 +1,203 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
+# размер одного куска файла, который разбирается за раз
+CHUNK_SIZE = 16 * 2 ** 20
+
 
 def get_something(name_file, name_type):
-    name_type += ' '
-    f = open(name_file, 'r')
-    file = f.read()
-    part_file = file[file.find(name_type):]
-    part_file = part_file.split('\n')
-    vertexes = []
-    for i in range(len(part_file)):
-        if part_file[i].startswith(name_type):
-            vertexes.append([float(s) for s in part_file[i].split()[1:]])
-    return np.array(vertexes)
+    """
+    Данная функция возвращает вершины ('v'), текстурные координаты ('vt') или нормали ('vn') объекта
+    """
+    vertexes, textures, normals = load_obj(name_file)[:3]
+    return {'v': vertexes, 'vt': textures, 'vn': normals}[name_type]
 
 
 def get_faces(name_file):
-    f = open(name_file, 'r')
-    file = f.read()
-    part_file = file[file.find('f '):]
-    part_file = part_file.split('\n')
-    faces = [[], [], []]
-    for i in range(len(part_file)):
-        if part_file[i].startswith('f '):
-            line = part_file[i].split()[1:]
-            faces[0].append([int(s.split('/')[0]) - 1 for s in line])
-            faces[1].append([int(s.split('/')[1]) - 1 if s.split('/')[1] != '' else '' for s in line])
-            faces[2].append([int(s.split('/')[2]) - 1 if s.split('/')[2] != '' else '' for s in line])
-    return np.array(faces)
+    """
+    Данная функция возвращает индексы вершин, текстурных координат и нормалей всех треугольников объекта
+    """
+    return np.array(load_obj(name_file)[3:])
+
+
+def load_obj(name_file, workers=1, chunk_size=CHUNK_SIZE):
+    """
+    Данная функция считывает obj-файл за один проход и возвращает все данные об объекте.
+    Файл делится на куски по границам строк, каждый кусок разбирается векторно, а при workers > 1 куски
+    разбираются параллельно в пуле процессов. Многоугольники разбиваются на треугольники веером от первой вершины.
+    :param name_file: путь до файла
+    :param workers: количество процессов для разбора
+    :param chunk_size: размер одного куска в байтах
+    :return: vertexes (n, 3) float, textures (k, 2) float, normals (m, 3) float,
+    edges, edges_textures, edges_normals (f, 3) int; отсутствующие индексы vt/vn равны -1
+    """
+    bounds = _split_file(name_file, chunk_size)
+    names = [name_file] * len(bounds)
+    starts = [start for start, _ in bounds]
+    ends = [end for _, end in bounds]
+    if workers > 1 and len(bounds) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = list(executor.map(_parse_chunk, names, starts, ends))
+    else:
+        chunks = list(map(_parse_chunk, names, starts, ends))
+    return _merge_chunks(chunks)
+
+
+def _split_file(name_file, chunk_size):
+    """
+    Данная функция делит файл на куски примерно по chunk_size байт так, чтобы каждый кусок заканчивался концом строки
+    :return: список пар (начало, конец) в байтах
+    """
+    size = os.path.getsize(name_file)
+    bounds = []
+    start = 0
+    with open(name_file, 'rb') as f:
+        while start < size:
+            end = min(start + chunk_size, size)
+            if end < size:
+                # сдвигаем границу до ближайшего конца строки
+                f.seek(end)
+                tail = f.readline()
+                end += len(tail)
+            bounds.append((start, end))
+            start = end
+    return bounds
+
+
+def _parse_chunk(name_file, start, end):
+    """
+    Данная функция разбирает кусок файла [start, end), который начинается и заканчивается на границе строки
+    :return: словарь с массивами куска; индексы многоугольников локальны для куска
+    """
+    with open(name_file, 'rb') as f:
+        f.seek(start)
+        # табуляции приводятся к пробелам, а отступы в начале строк убираются, чтобы тип строки определялся
+        # по первому слову, как при split()
+        lines = [line.lstrip() for line in f.read(end - start).replace(b'\t', b' ').split(b'\n')]
+    # тип каждой строки по первым трем символам (слово типа и пробел после него)
+    kinds = np.array([line[:3] for line in lines], dtype='S3')
+    is_v, is_vt, is_vn, is_f = (np.char.startswith(kinds, prefix) for prefix in (b'v ', b'vt ', b'vn ', b'f '))
+    # количество вершин, текстурных координат и нормалей, прочитанных до каждой строки
+    counts = np.stack([np.cumsum(is_v), np.cumsum(is_vt), np.cumsum(is_vn)], axis=1)
+    f_lines = [lines[i][2:] for i in np.flatnonzero(is_f)]
+    return {
+        'vertexes': _parse_numbers([lines[i][2:] for i in np.flatnonzero(is_v)], 3),
+        'textures': _parse_numbers([lines[i][3:] for i in np.flatnonzero(is_vt)], 2),
+        'normals': _parse_numbers([lines[i][3:] for i in np.flatnonzero(is_vn)], 3),
+        'faces': _parse_faces(f_lines, counts[is_f]),
+        'counts': counts[-1] if len(counts) else np.zeros(3, dtype=np.int64)
+    }
+
+
+def _parse_numbers(lines, size):
+    """
+    Данная функция векторно переводит строки с числами в массив (n, size); лишние числа отбрасываются,
+    недостающие заполняются нулями
+    """
+    if not lines:
+        return np.zeros((0, size))
+    text = b'\n'.join(lines)
+    per_line, _ = _split_tokens(text, len(lines))
+    numbers = np.fromstring(text, dtype=np.float64, sep=' ')
+    if len(numbers) != per_line.sum():
+        raise ValueError('Некорректная строка с числами в obj-файле')
+    return _to_table(numbers, per_line, size, np.float64)
+
+
+def _parse_faces(lines, counts_before):
+    """
+    Данная функция векторно разбирает строки многоугольников и разбивает их на треугольники веером.
+    :param lines: строки многоугольников без префикса 'f '
+    :param counts_before: (f, 3) количество v, vt, vn в куске до каждой строки (для относительных индексов)
+    :return: (индексы (t, 3, 3): треугольник, вершина, [v, vt, vn]; маска относительных индексов или None)
+    """
+    if not lines:
+        return np.zeros((0, 3, 3), dtype=np.int64), None
+    text = b'\n'.join(lines)
+    polygon_sizes, slashes = _split_tokens(text, len(lines))
+    # пустые индексы (v//vn, v/vt/) заменяем нулем, который после перевода к нумерации с нуля станет -1
+    text = (text + b' ').replace(b'//', b'/0/').replace(b'/ ', b'/0 ').replace(b'/\r', b'/0\r') \
+        .replace(b'/\n', b'/0\n').replace(b'/', b' ')
+    numbers = np.fromstring(text, dtype=np.int64, sep=' ')
+    if len(numbers) != (slashes + 1).sum():
+        raise ValueError('Некорректная строка многоугольника в obj-файле')
+    raw = _to_table(numbers, slashes + 1, 3, np.int64)
+
+    # перевод к нумерации с нуля, отрицательные индексы отсчитываются от уже прочитанных элементов
+    relative = raw < 0
+    indexes = raw - 1
+    indexes[raw == 0] = -1
+    if relative.any():
+        before = np.repeat(counts_before, polygon_sizes, axis=0)
+        indexes[relative] = before[relative] + raw[relative]
+    else:
+        relative = None
+
+    # разбиение многоугольников на треугольники (0, j, j + 1)
+    triangles = np.maximum(polygon_sizes - 2, 0)
+    first = np.cumsum(polygon_sizes) - polygon_sizes
+    polygon = np.repeat(np.arange(len(lines)), triangles)
+    j = np.arange(triangles.sum()) - np.repeat(np.cumsum(triangles) - triangles, triangles) + 1
+    corners = np.stack([first[polygon], first[polygon] + j, first[polygon] + j + 1], axis=1)
+    return indexes[corners], None if relative is None else relative[corners]
+
+
+def _split_tokens(text, count_lines):
+    """
+    Данная функция векторно находит слова (числа или вершины многоугольника) в тексте из count_lines строк
+    :return: количество слов в каждой строке, количество символов '/' в каждом слове
+    """
+    buf = np.frombuffer(text, dtype=np.uint8)
+    space = (buf == ord(' ')) | (buf == ord('\t')) | (buf == ord('\r')) | (buf == ord('\n'))
+    # начало слова - непробельный символ после пробельного или в начале текста
+    start = ~space
+    start[1:] &= space[:-1]
+    start = np.flatnonzero(start)
+    line = np.searchsorted(np.flatnonzero(buf == ord('\n')), start)
+    per_line = np.bincount(line, minlength=count_lines)
+    token = np.searchsorted(start, np.flatnonzero(buf == ord('/')), side='right') - 1
+    slashes = np.bincount(token, minlength=len(start))
+    return per_line, slashes
+
+
+def _to_table(numbers, per_row, size, dtype):
+    """
+    Данная функция раскладывает подряд идущие числа по строкам таблицы (n, size) по количеству чисел в каждой строке
+    """
+    if np.all(per_row == size):
+        return numbers.reshape(-1, size)
+    row = np.repeat(np.arange(len(per_row)), per_row)
+    column = np.arange(len(numbers)) - np.repeat(np.cumsum(per_row) - per_row, per_row)
+    keep = column < size
+    table = np.zeros((len(per_row), size), dtype=dtype)
+    table[row[keep], column[keep]] = numbers[keep]
+    return table
+
+
+def _merge_chunks(chunks):
+    """
+    Данная функция объединяет разобранные куски файла в итоговые массивы
+    """
+    offsets = np.cumsum([np.zeros(3, dtype=np.int64)] + [chunk['counts'] for chunk in chunks], axis=0)
+    faces = []
+    for chunk, offset in zip(chunks, offsets):
+        indexes, relative = chunk['faces']
+        if relative is not None:
+            # относительные индексы ссылаются на элементы из предыдущих кусков
+            indexes = indexes + relative * offset
+        faces.append(indexes)
+    faces = np.concatenate(faces) if faces else np.zeros((0, 3, 3), dtype=np.int64)
+    # индексы должны ссылаться на прочитанные элементы (для vt и vn допускается -1 - индекс отсутствует)
+    total = offsets[-1]
+    for column, name in enumerate(('вершин', 'текстурных координат', 'нормалей')):
+        lowest = 0 if column == 0 else -1
+        wrong = (faces[:, :, column] < lowest) | (faces[:, :, column] >= total[column])
+        if wrong.any():
+            index = faces[:, :, column][wrong][0]
+            raise ValueError('Индекс %s %d в многоугольнике выходит за пределы прочитанных %d'
+                             % (name, index + 1 if index >= 0 else index, total[column]))
+    return np.concatenate([chunk['vertexes'] for chunk in chunks] or [np.zeros((0, 3))]), \
+        np.concatenate([chunk['textures'] for chunk in chunks] or [np.zeros((0, 2))]), \
+        np.concatenate([chunk['normals'] for chunk in chunks] or [np.zeros((0, 3))]), \
+        faces[:, :, 0].copy(), faces[:, :, 1].copy(), faces[:, :, 2].copy()
@@ -1,100 +1,101 @@
 from geometric_functions import affine_transformation as at
-from reader import extract
+from spaces.mesh import Mesh
 import numpy as np
 
 
 class LocalSpace:
-    def __init__(self, name_file, size, position, rot_x=0, rot_y=0, rot_z=0):
+    def __init__(self, name_file, size=1, position=(0, 0, 0), rot_x=0, rot_y=0, rot_z=0, cache=None, transform=None,
+                 texture=None):
         """
         Класс который хранит всю информацию об объекте. А также он имеет методы для перемещения объекта, поворота
          и увелечения.
-        :param name_file: путь до файла
+        :param name_file: путь до файла или уже загруженный объект Mesh, буферы которого будут общими для всех его
+        экземпляров
         :param size: число или тройка чисел, которые говорят во сколько раз увеличить
         :param position: тройка чисел, в которую нужно переместить объект
         :param rot_x: количество градусов для поворота относитель оси X
         :param rot_y: количество градусов для поворота относитель оси Y
         :param rot_z: количество градусов для поворота относитель оси Z
+        :param cache: объект MeshCache, если передан, то данные берутся из бинарного кэша
+        :param transform: объект Transform, если передан, то используется вместо size, position и rot_*
+        :param texture: текстура экземпляра (изображение PIL или Texture), используется если в Visualization
+        не переданы color_maps
         """
         # создания словаря для хранения все информации об объекте
         self.data = {'size': size if type(size) == list else [size, size, size], 'position': position,
                      'rot_x': rot_x*np.pi/180, 'rot_y': rot_y*np.pi/180, 'rot_z': rot_z*np.pi/180}
-        # считывание данных из файла
-        self.__read_data_from_file(name_file)
-        # преобразование к проективным координатам
-        self.data['vertexes'] = at.vertexes_to_projective(self.data['vertexes'])
-        self.data['normals'] = at.vertexes_to_projective(self.data['normals'])
+        # считывание данных из файла (вершины и нормали уже в проективных координатах)
+        self.mesh = name_file if isinstance(name_file, Mesh) else Mesh.from_file(name_file, cache)
+        self.data.update(self.mesh.data)
+        self.texture = texture
+        # масштаб и поворот выполняются относительно середины объекта, которая затем переносится в position
+        if transform is None:
+            transform = at.Transform(position, [self.data['rot_x'], self.data['rot_y'], self.data['rot_z']],
+                                     self.data['size'], pivot=self.mesh.centroid)
+        else:
+            self.data['size'] = list(transform.scale)
+            self.data['position'] = list(transform.position)
+            self.data['rot_x'], self.data['rot_y'], self.data['rot_z'] = transform.rotation
+        self.transform = transform
 
-        self.origin_data = self.data.copy()
+        # массивы объекта только для чтения и не изменяются при отрисовке, копируются только параметры
+        self.origin_data = {key: list(value) if isinstance(value, (list, tuple)) else value
+                            for key, value in self.data.items()}
 
-    def __read_data_from_file(self, name_file):
+    def bounding_sphere(self):
         """
-        Данная функция считывает из файла информацию об объекте
-        :param name_file: путь до файла
+        Данная функция возвращает ограничивающую сферу объекта в мировых координатах
+        :return: центр (3 числа) и радиус
         """
-        self.data['vertexes'] = extract.get_something(name_file, 'v')
-        self.data['edges'] = extract.get_faces(name_file)[0]
-        self.data['textures'] = extract.get_something(name_file, 'vt')
-        self.data['edges_textures'] = extract.get_faces(name_file)[1]
-        self.data['normals'] = extract.get_something(name_file, 'vn')
-        self.data['edges_normals'] = extract.get_faces(name_file)[2]
+        model = self.transform.model_matrix()
+        center = np.dot(model, np.append(self.mesh.sphere_center, 1))[:3]
+        # радиус растягивается на наибольший коэффициент растяжения матрицы модели
+        return center, self.mesh.sphere_radius * np.linalg.norm(model[:3, :3], 2)
 
     def rotate_y(self, alpha, with_normals=False):
         """
-        Данная функция выполняет поворот на угол alpha относительно оси Y. Поворот осуществеляется с помощью матрицы
-        аффиного преобразования
+        Данная функция выполняет поворот на угол alpha относительно оси Y мировой системы координат. Поворот
+        добавляется к матрице модели после предыдущих преобразований, исходные вершины объекта не изменяются
         :param alpha: угол поворота в радианах
         :param with_normals: True - значит подобную операцию нужно провести также для нормалей объекта
         """
-        self.data['vertexes'] = at.rotate_y(alpha, self.data['vertexes'])
-        if with_normals:
-            self.data['normals'] = at.rotate_y(alpha, self.data['normals'], True)
+        self.transform.compose(at.rotation_y_matrix(alpha), with_normals)
 
     def rotate_x(self, alpha, with_normals=False):
         """
-        Данная функция выполняет поворот на угол alpha относительно оси X. Поворот осуществеляется с помощью матрицы
-        аффиного преобразования
+        Данная функция выполняет поворот на угол alpha относительно оси X мировой системы координат. Поворот
+        добавляется к матрице модели после предыдущих преобразований, исходные вершины объекта не изменяются
         :param alpha: угол поворота в радианах
         :param with_normals: True - значит подобную операцию нужно провести также для нормалей объекта
         """
-        self.data['vertexes'] = at.rotate_z(alpha, self.data['vertexes'])
-        if with_normals:
-            self.data['normals'] = at.rotate_z(alpha, self.data['normals'], True)
+        self.transform.compose(at.rotation_x_matrix(alpha), with_normals)
 
     def rotate_z(self, alpha, with_normals=False):
         """
-        Данная функция выполняет поворот на угол alpha относительно оси Z. Поворот осуществеляется с помощью матрицы
-        аффиного преобразования
+        Данная функция выполняет поворот на угол alpha относительно оси Z мировой системы координат. Поворот
+        добавляется к матрице модели после предыдущих преобразований, исходные вершины объекта не изменяются
         :param alpha: угол поворота в радианах
         :param with_normals: True - значит подобную операцию нужно провести также для нормалей объекта
         """
-        self.data['vertexes'] = at.rotate_z(alpha, self.data['vertexes'])
-        if with_normals:
-            self.data['normals'] = at.rotate_z(alpha, self.data['normals'], True)
+        self.transform.compose(at.rotation_z_matrix(alpha), with_normals)
 
     def scale(self, size, with_normals=False):
         """
-        Данная функция выполняет увелечение в переденное количество раз. Увелечение осуществеляется с помощью матрицы
-        аффиного преобразования
-        :param size: тройка чисел, которые говорят во сколько раз увеличить
+        Данная функция выполняет увелечение в переденное количество раз относительно начала координат.
+        Увелечение добавляется к матрице модели после предыдущих преобразований, исходные вершины не изменяются
+        :param size: число или тройка чисел, которые говорят во сколько раз увеличить
         :param with_normals: True - значит подобную операцию нужно провести также для нормалей объекта
         """
-        self.data['vertexes'] = at.scaling(self.data['vertexes'], size)
-        if with_normals:
-            self.data['normals'] = at.scaling(self.data['normals'], size, True)
+        self.transform.compose(at.scaling_matrix(size if np.ndim(size) else [size, size, size]), with_normals)
 
     def transfer(self, new_coords, with_normals=False):
         """
-        Данная функция выполняет параллельный перенос. Перенос осуществеляется с помощью матрицы
-        аффиного преобразования.
+        Данная функция переносит середину объекта в точку new_coords. Перенос добавляется к матрице модели после
+        предыдущих преобразований, исходные вершины объекта не изменяются
         :param new_coords: координаты точки куда нужно перенести объект
         :param with_normals: True - значит подобную операцию нужно провести также для нормалей объекта
         """
-        # вычисляеются коэфициенты смещение для того, чтобы середина объекта находилась в точке new_coords
-        k = [
-            new_coords[0] - self.data['vertexes'][:, 0].mean(),
-            new_coords[1] - self.data['vertexes'][:, 1].mean(),
-            new_coords[2] - self.data['vertexes'][:, 2].mean()
-        ]
-        self.data['vertexes'] = at.parallel_translation(self.data['vertexes'], k)
-        if with_normals:
-            self.data['normals'] = at.parallel_translation(self.data['normals'], k, True)
+        # середина вершин в мировых координатах
+        center = self.transform.apply(np.append(self.mesh.centroid, 1)[None])[0, :3]
+        self.transform.compose(at.translation_matrix(np.asarray(new_coords) - center), with_normals)
+        self.data['position'] = list(new_coords)
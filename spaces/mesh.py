@@ -0,0 +1,79 @@
+import numpy as np
+from geometric_functions import affine_transformation as at
+from geometric_functions.bvh import BVH
+from geometric_functions.geometry_calculations import unique_edges
+from reader import extract
+from stats import profiler
+
+
+class Mesh:
+    def __init__(self, vertexes, textures, normals, edges, edges_textures, edges_normals):
+        """
+        Данный класс хранит неизменяемые буферы одной модели: вершины и нормали в проективных координатах, текстурные
+        координаты и индексы треугольников. Один объект Mesh может использоваться сразу многими экземплярами LocalSpace,
+        каждый из которых хранит только свое преобразование и текстуру.
+        :param vertexes: массив (n, 3) вершин или (n, 4) в проективных координатах
+        :param textures: массив (k, 2) текстурных координат
+        :param normals: массив (m, 3) нормалей или (m, 4) в проективных координатах (массивы (n, 4) float64,
+        например memory-map из MeshCache, используются без копирования)
+        :param edges: массив (f, 3) индексов вершин треугольников
+        :param edges_textures: массив (f, 3) индексов текстурных координат треугольников
+        :param edges_normals: массив (f, 3) индексов нормалей треугольников
+        """
+        self.data = {
+            'vertexes': _projective(vertexes),
+            'textures': np.asarray(textures),
+            'normals': _projective(normals),
+            'edges': np.asarray(edges),
+            'edges_textures': np.asarray(edges_textures),
+            'edges_normals': np.asarray(edges_normals)
+        }
+        for array in self.data.values():
+            array.setflags(write=False)
+        # середина объекта, относительно которой экземпляры масштабируются и поворачиваются
+        self.centroid = self.data['vertexes'][:, :3].mean(axis=0)
+        # ограничивающая сфера в локальных координатах для отсечения целых объектов
+        points = self.data['vertexes'][:, :3]
+        self.sphere_center = (points.min(axis=0) + points.max(axis=0)) / 2 if len(points) else np.zeros(3)
+        self.sphere_radius = np.linalg.norm(points - self.sphere_center, axis=1).max() if len(points) else 0.
+        self.__bvh = None
+        self.__wireframe = None
+
+    def bvh(self):
+        """
+        Данная функция возвращает BVH треугольников модели в локальных координатах. Дерево строится при первом
+        обращении и используется всеми экземплярами модели во всех кадрах.
+        """
+        if self.__bvh is None:
+            self.__bvh = BVH(self.data['vertexes'], self.data['edges'])
+        return self.__bvh
+
+    def wireframe(self):
+        """
+        Данная функция возвращает ребра модели без повторов (массив (e, 2) индексов вершин) и номера ребер каждого
+        треугольника (массив (f, 3)). Ребра находятся при первом обращении.
+        """
+        if self.__wireframe is None:
+            self.__wireframe = unique_edges(self.data['edges'])
+        return self.__wireframe
+
+    @classmethod
+    def from_file(cls, name_file, cache=None):
+        """
+        Данная функция считывает модель из obj-файла
+        :param name_file: путь до файла
+        :param cache: объект MeshCache, если передан, то данные берутся из бинарного кэша
+        """
+        load = extract.load_obj if cache is None else cache.load
+        with profiler.stage('load'):
+            return cls(*load(name_file))
+
+
+def _projective(points):
+    """
+    Данная функция переводит точки в проективные координаты; массив, который уже в них, возвращается как есть
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim == 2 and points.shape[1] == 4:
+        return points
+    return at.vertexes_to_projective(points.reshape(-1, 3))
@@ -1,5 +1,6 @@
 import numpy as np
-from geometric_functions import affine_transformation as at
+from geometric_functions import clipping
+from stats import profiler
 
 
 class Camera:
@@ -30,45 +31,103 @@ class Camera:
         return self.width_view[0], self.width_view[1], self.height_view[0], self.height_view[1], self.depth_view[0],\
                self.depth_view[1]
 
+    def key(self):
+        """
+        Данная функция возвращает ключ состояния камеры, по которому WorldSpace понимает, что вид изменился
+        """
+        return tuple(self.camera_position.tolist()), tuple(self.observation_point.tolist()), self.type_camera, \
+            self.get_edges()
+
 
 class WorldSpace:
-    def __init__(self, objs, camera, size=(512, 512)):
+    def __init__(self, objs, camera, size=(512, 512), clipping=True, far_clipping=False):
         """
         Данный класс используется хранения объектов в мировой системе координат.
         В этом классе содержутся функции для полного пайплайна от локальных координат к экранным.
+        Данные объектов в локальных координатах не изменяются и общие для всех экземпляров модели: для каждого
+        объекта хранятся только матрицы модели и нормалей (пересчитываются при изменении его преобразования),
+        а на вершинном этапе экземпляры одной модели переводятся в мировые координаты вместе, во временный массив.
+        Результаты вершинного этапа кэшируются и пересчитываются при изменении объекта или камеры.
         :param objs: набор объектов
         :param camera: объект камера
         :param size: размеры экрана вывода
+        :param clipping: True - отбрасывать объекты и треугольники вне пирамиды видимости и разрезать треугольники
+        ближней плоскостью камеры
+        :param far_clipping: True - отбрасывать также то, что дальше дальней плоскости камеры (depth_view[1])
         """
         self.objs = objs
         self.camera = camera
-        self.observation_point = camera.observation_point  # точка куда смотрит камера
         self.control_vec = np.array([0, 1, 0])
         self.width, self.height = size[0], size[1]
-        self.__init_objects()  # перенос объектов из локальных координат в глобальные
+        self.clipping = clipping
+        self.far_clipping = far_clipping
+        self.__world = {}  # id объекта -> (версия преобразования, матрица модели, матрица нормалей)
+        self.__stages = {}  # id объекта -> (ключ, результат вершинного этапа)
+        self.__init_objects()  # матрицы перехода объектов из локальных координат в глобальные
+
+    def __getstate__(self):
+        """
+        При передаче в другой процесс id объектов меняются, поэтому матрицы объектов передаются по их номерам,
+        а результаты вершинного этапа не передаются
+        """
+        state = self.__dict__.copy()
+        index = {id(obj): i for i, obj in enumerate(self.objs)}
+        state['_WorldSpace__world'] = {index[key]: value for key, value in self.__world.items() if key in index}
+        state['_WorldSpace__stages'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__world = {id(self.objs[i]): value for i, value in self.__world.items()}
+
+    @property
+    def observation_point(self):
+        """
+        Точка куда смотрит камера
+        """
+        return self.camera.observation_point
+
+    def set_camera(self, camera):
+        """
+        Данная функция меняет камеру; мировые координаты объектов при этом не пересчитываются
+        """
+        self.camera = camera
 
     def pipeline_for_obj(self):
         """
         Данная функция реализует пайплайн перехода от мироквых координат к экранным для всех объектов.
+        Результат вершинного этапа записывается в obj.stage, данные объекта не изменяются.
         """
-        self.__init_camera()
-        if self.camera.type_camera == 0:
-            self.__orthographic_view()
-        else:
-            self.__perspective_view()
-        self.__screen_space()
+        for obj, stage in zip(self.objs, self.vertex_stages()):  # цикл по всем объектам
+            obj.stage = stage
 
     def __init_objects(self):
         """
-        Переход от локальных к мировым координатам
+        Данная функция обновляет матрицы модели и нормалей объектов, преобразование которых изменилось
         """
-        for obj in self.objs:  # цикл по всем объектам
-            obj.scale(obj.data['size'], with_normals=True)  # увеличиваем объект
-            obj.rotate_x(obj.data['rot_x'], with_normals=True)  # поворачиваем по оси X
-            obj.rotate_y(obj.data['rot_y'], with_normals=True)  # поворачиваем по оси Y
-            obj.rotate_z(obj.data['rot_z'], with_normals=True)  # поворачиваем по оси Z
-            # делаем паралльные перенос
-            obj.transfer([obj.data['position'][0], obj.data['position'][1], obj.data['position'][2]], with_normals=True)
+        with profiler.stage('world'):
+            for obj in self.objs:  # цикл по всем объектам
+                cached = self.__world.get(id(obj))
+                if cached is None or cached[0] != obj.transform.version:
+                    self.__world[id(obj)] = (obj.transform.version, obj.transform.model_matrix(),
+                                             obj.transform.normal_matrix())
+
+    def world_data(self, obj):
+        """
+        Данная функция возвращает матрицы перехода объекта к мировым координатам (из кэша, если объект не двигался).
+        Вершины в мировых координатах не хранятся: экземпляры модели используют общий буфер вершин.
+        :return: матрицы (4, 4) модели (для вершин) и нормалей
+        """
+        cached = self.__world.get(id(obj))
+        if cached is None or cached[0] != obj.transform.version:
+            self.__init_objects()
+            if id(obj) not in self.__world or self.__world[id(obj)][0] != obj.transform.version:
+                # объект не из этой сцены
+                with profiler.stage('world'):
+                    self.__world[id(obj)] = (obj.transform.version, obj.transform.model_matrix(),
+                                             obj.transform.normal_matrix())
+            cached = self.__world[id(obj)]
+        return cached[1], cached[2]
 
     def model_matrix(self):
         """
@@ -120,71 +179,222 @@ class WorldSpace:
                                    [0, 0, -1, 0]])
         return perspect_matrix
 
-    def __init_camera(self):
+    def projection_matrix(self):
         """
-        Данная функция делает переход к lookAt системе наблюдения.
+        Данная функция возвращает матрицу проекции камеры (ортографической или перспективной).
         """
-        model_view = self.model_matrix()
-        for obj in self.objs:  # цикл по всем объектам
-            # умножаем каждый вектор на model_matrix
-            obj.data['vertexes'] = np.dot(model_view, obj.data['vertexes'].T).T
-            # умножаем каждую нормаль на обратную и транспонированную model_matrix
-            obj.data['normals'] = np.dot(np.linalg.inv(model_view).T, obj.data['normals'].T).T
-
-    def __orthographic_view(self):
-        """
-        Данная функция делаем переход к NDC координатам через орфтографическую проекцию.
-        """
-        ortho_matrix = self.orthographic_matrix()
-        for obj in self.objs:  # цикл по всем объектам
-            obj.data['old_vertexes'] = obj.data['vertexes'].copy()  # сохраняем вектора до NDC координат
-            obj.data['vertexes'] = np.dot(ortho_matrix, obj.data['vertexes'].T).T  # переходим к NDC координатам
-
-    def __perspective_view(self):
-        """
-         Данная функция делаем переход к NDC координатам через перспективную проекцию.
-         """
-        perspect_matrix = self.perspective_matrix()
-        for obj in self.objs:  # цикл по всем объектам
-            obj.data['old_vertexes'] = obj.data['vertexes'].copy()  # сохраняем вектора до NDC координат
-            # переходим к NDC координатам
-            obj.data['vertexes'] = np.dot(perspect_matrix, obj.data['vertexes'].T).T
-            obj.data['vertexes'][:, 0] /= -obj.data['vertexes'][:, 3]
-            obj.data['vertexes'][:, 1] /= -obj.data['vertexes'][:, 3]
-            obj.data['vertexes'][:, 2] /= obj.data['vertexes'][:, 3]
-
-    def __to_center(self, obj):
-        """
-        Данная функция центрирует изображения в экранных координатах с помощью параллельного переноса.
-        :param obj: объект который надо центрировать
-        :return:
+        if self.camera.type_camera == 0:
+            return self.orthographic_matrix()
+        return self.perspective_matrix()
+
+    @property
+    def buffer_size(self):
         """
-        k = [
-            self.width/2 - obj.data['vertexes'][:,0].mean(),
-            self.height/2 - obj.data['vertexes'][:,1].mean(),
-            0
-        ]
-        obj.data['vertexes'] = at.parallel_translation(obj.data['vertexes'], k)
+        Размеры матрицы отображения и z-buffer (количество x, количество y): экранные координаты лежат от 0 до
+        width и от 0 до height включительно
+        """
+        return self.width + 1, self.height + 1
 
-    def __screen_space(self):
+    def __viewport(self, vertexes, size=None):
         """
-        Данная функция реализует переход от NDC координат к экранным.
+        Данная функция делает переход от координат отсечения к экранным: деление на w (для перспективной проекции),
+        растяжение по размеру экрана и возвращение пропорций.
+        :param vertexes: массив (n, 4) координат отсечения
+        :param size: размеры экрана (по умолчанию (width, height))
+        :return: массив (n, 4) целых экранных координат
         """
-        for obj in self.objs:  # цикл по всем объектам
-            # растяжение объекта по оси X и Y
-            obj.data['vertexes'][:, 0] = self.width / 2 * obj.data['vertexes'][:, 0] + self.width / 2
-            obj.data['vertexes'][:, 1] = self.height / 2 * obj.data['vertexes'][:, 1] + self.height / 2
-            # возращение пропроций объекту
-            if self.dis_x > self.dis_y:
-                obj.data['vertexes'][:, 1] = obj.data['vertexes'][:, 1] * self.dis_y / self.dis_x
+        width, height = (self.width, self.height) if size is None else size
+        vertexes = vertexes.copy()
+        if self.camera.type_camera == 1:
+            vertexes[:, 0] /= -vertexes[:, 3]
+            vertexes[:, 1] /= -vertexes[:, 3]
+            vertexes[:, 2] /= vertexes[:, 3]
+        vertexes[:, 0] = width / 2 * vertexes[:, 0] + width / 2
+        vertexes[:, 1] = height / 2 * vertexes[:, 1] + height / 2
+        if self.dis_x > self.dis_y:
+            vertexes[:, 1] = vertexes[:, 1] * self.dis_y / self.dis_x
+        else:
+            vertexes[:, 0] = vertexes[:, 0] * self.dis_x / self.dis_y
+        return np.rint(vertexes).astype(int)
+
+    def frustum_planes(self, camera_matrix=None, size=None):
+        """
+        Данная функция возвращает плоскости пирамиды видимости камеры в lookAt системе
+        :param size: размеры экрана (по умолчанию (width, height))
+        """
+        camera_matrix = self.projection_matrix() if camera_matrix is None else camera_matrix
+        # экранные x или y умножаются на отношение сторон в __viewport
+        scale = (1, self.dis_y / self.dis_x) if self.dis_x > self.dis_y else (self.dis_x / self.dis_y, 1)
+        far = self.camera.depth_view[1] if self.far_clipping else None
+        return clipping.frustum_planes(camera_matrix, self.camera.type_camera,
+                                       (self.width, self.height) if size is None else size, scale,
+                                       self.camera.depth_view[0], far)
+
+    def vertex_stage(self, obj, model_view=None, camera_matrix=None, size=None):
+        """
+        Вершинный этап для всего объекта: все вершины и нормали преобразуются один раз за кадр, после чего
+        растеризатор берет нужные ему значения по индексам треугольника.
+        Если включено отсечение, то объект, ограничивающая сфера которого лежит вне пирамиды видимости, отбрасывается
+        до преобразования вершин, треугольники вне пирамиды отбрасываются (сначала целыми поддеревьями BVH модели),
+        а пересекающие ближнюю плоскость разрезаются на новые треугольники.
+        :param obj: объект в мировых координатах
+        :param model_view: матрица перехода к lookAt системе (по умолчанию model_matrix())
+        :param camera_matrix: матрица проекции камеры (по умолчанию projection_matrix())
+        :param size: размеры экрана (по умолчанию (width, height)), например увеличенные для суперсэмплинга
+        :return: словарь с массивами
+            view - (n, 4) вершины в lookAt системе (до перехода к NDC),
+            clip - (n, 4) вершины после умножения на матрицу проекции,
+            screen - (n, 4) целые экранные координаты (четвертая координата - w),
+            normals - (m, 4) нормали в lookAt системе,
+            textures, edges, edges_textures, edges_normals - текстурные координаты и индексы треугольников,
+            face_normals - (f, 3) единичные нормали треугольников в lookAt системе,
+            front - (f,) маска треугольников, которые не отбрасываются back-face culling,
+            face_ids - (f,) номер исходного треугольника объекта для каждого треугольника
+            или None, если объект целиком вне пирамиды видимости
+        """
+        return self.vertex_stages([obj], model_view, camera_matrix, size)[0]
+
+    def vertex_stages(self, objs=None, model_view=None, camera_matrix=None, size=None):
+        """
+        Вершинный этап для нескольких объектов (как vertex_stage). Видимые экземпляры одной модели, результат
+        которых нужно пересчитать, переводятся в мировые координаты вместе: общий буфер вершин умножается на стопку
+        их матриц моделей за одно умножение. Мировые координаты - временный массив группы, они не кэшируются.
+        :param objs: список объектов (по умолчанию все объекты сцены)
+        :return: список результатов вершинного этапа (или None) в порядке objs
+        """
+        objs = self.objs if objs is None else objs
+        size = (self.width, self.height) if size is None else tuple(size)
+        stages = [None] * len(objs)
+        keys = {}
+        groups = {}  # id модели -> номера экземпляров в objs, которые нужно пересчитать
+        for i, obj in enumerate(objs):
+            key = None
+            if model_view is None and camera_matrix is None:
+                # результат зависит только от преобразования объекта, камеры и настроек экрана
+                key = (obj.transform.version, self.camera.key(), size, self.clipping, self.far_clipping)
+                cached = self.__stages.get(id(obj))
+                if cached is not None and cached[0] == key:
+                    stages[i] = cached[1]
+                    continue
+            keys[i] = key
+            groups.setdefault(id(obj.mesh), []).append(i)
+        if not groups:
+            return stages
+        with profiler.stage('vertex'):
+            model_view = self.model_matrix() if model_view is None else model_view
+            camera_matrix = self.projection_matrix() if camera_matrix is None else camera_matrix
+            planes = None
+            if self.clipping:
+                with profiler.stage('clipping'):
+                    planes = self.frustum_planes(camera_matrix, size)
+            for group in groups.values():
+                if planes is not None:
+                    with profiler.stage('clipping'):
+                        group = [i for i in group if not self.__outside(objs[i], model_view, planes)]
+                for i, stage in zip(group, self.__vertex_stage([objs[i] for i in group], model_view,
+                                                               camera_matrix, size, planes)):
+                    stages[i] = stage
+        for i, key in keys.items():
+            if key is not None:
+                self.__stages[id(objs[i])] = (key, stages[i])
+        return stages
+
+    @staticmethod
+    def __outside(obj, model_view, planes):
+        """
+        Данная функция проверяет, лежит ли ограничивающая сфера объекта вне пирамиды видимости
+        """
+        center, radius = obj.bounding_sphere()
+        return clipping.sphere_outside(np.dot(model_view, np.append(center, 1))[:3], radius, planes)
+
+    def __vertex_stage(self, objs, model_view, camera_matrix, size, planes):
+        """
+        Данная функция выполняет вершинный этап для экземпляров одной модели
+        :param objs: экземпляры LocalSpace с одним и тем же mesh
+        :param planes: плоскости пирамиды видимости или None, если отсечение выключено
+        :return: список результатов вершинного этапа в порядке objs
+        """
+        if not objs:
+            return []
+        mesh = objs[0].mesh
+        matrices = [self.world_data(obj) for obj in objs]
+        # общие буферы модели переводятся в мировые координаты сразу для всех экземпляров
+        vertexes = np.einsum('kij,nj->kni', np.stack([model for model, _ in matrices]), mesh.data['vertexes'])
+        normals = np.einsum('kij,nj->kni', np.stack([normal for _, normal in matrices]), mesh.data['normals'])
+        inverse = np.linalg.inv(model_view).T
+        stages = []
+        for obj, (model, _), world, world_normals in zip(objs, matrices, vertexes, normals):
+            view = np.dot(model_view, world.T).T
+            view_normals = np.dot(inverse, world_normals.T).T
+            textures, edges = obj.data['textures'], obj.data['edges']
+            edges_textures, edges_normals = obj.data['edges_textures'], obj.data['edges_normals']
+            if planes is not None:
+                with profiler.stage('clipping'):
+                    # плоскости переводятся в локальные координаты модели, и BVH пропускает поддеревья вне пирамиды
+                    local_planes = np.dot(planes, np.dot(model_view, model))
+                    faces = mesh.bvh().query_planes(local_planes)
+                    view, view_normals, textures, edges, edges_normals, edges_textures, face_ids = \
+                        clipping.clip_triangles(view, view_normals, textures, edges[faces], edges_normals[faces],
+                                                edges_textures[faces], planes)
+                    face_ids = faces[face_ids]
             else:
-                obj.data['vertexes'][:, 0] = obj.data['vertexes'][:, 0] * self.dis_x / self.dis_y
-            # центрирование объекта
-            # temp = obj.data['vertexes'][:, 3].copy()
-            # obj.data['vertexes'][:, 3] = 1
-            # self.__to_center(obj)
-            # obj.data['vertexes'][:, 3] = temp
-            obj.data['vertexes'] = np.rint(obj.data['vertexes']).astype(int)
+                face_ids = np.arange(len(edges))
+            clip = np.dot(camera_matrix, view.T).T
+            stage = {'view': view, 'clip': clip, 'screen': self.__viewport(clip, size), 'normals': view_normals,
+                     'textures': textures, 'edges': edges, 'edges_textures': edges_textures,
+                     'edges_normals': edges_normals, 'face_ids': face_ids}
+            self.__face_normals(stage)
+            stages.append(stage)
+        return stages
+
+    def pick(self, x, y):
+        """
+        Данная функция находит объект и треугольник, который виден в пикселе (x, y), пуская луч из камеры через
+        пиксель и проверяя пересечения с помощью BVH моделей
+        :param x: экранная координата x
+        :param y: экранная координата y
+        :return: (объект, номер треугольника, точка пересечения в мировых координатах) или None
+        """
+        model_view = self.model_matrix()
+        camera_matrix = self.projection_matrix()
+        # отмена растяжения по размеру экрана и сохранения пропорций из __viewport
+        scale = (1, self.dis_y / self.dis_x) if self.dis_x > self.dis_y else (self.dis_x / self.dis_y, 1)
+        ndc_x = x / scale[0] / (self.width / 2) - 1
+        ndc_y = y / scale[1] / (self.height / 2) - 1
+        if self.camera.type_camera == 1:
+            # x_ndc = -x_clip / w, где w = -z, поэтому x_ndc = (P00 * x + P02 * z) / z
+            origin = np.array([0, 0, 0, 1.])
+            direction = np.array([-(ndc_x - camera_matrix[0, 2]) / camera_matrix[0, 0],
+                                  -(ndc_y - camera_matrix[1, 2]) / camera_matrix[1, 1], -1, 0])
+        else:
+            origin = np.array([(ndc_x - camera_matrix[0, 3]) / camera_matrix[0, 0],
+                               (ndc_y - camera_matrix[1, 3]) / camera_matrix[1, 1], 0, 1])
+            direction = np.array([0, 0, -1, 0.])
+        best = None
+        for obj in self.objs:
+            model = obj.transform.model_matrix()
+            to_local = np.linalg.inv(np.dot(model_view, model))
+            hit = obj.mesh.bvh().ray(np.dot(to_local, origin), np.dot(to_local, direction))
+            # параметр t одинаков во всех системах координат, так как преобразования аффинные
+            if hit is not None and (best is None or hit[1] < best[2]):
+                best = (obj, hit[0], hit[1])
+        if best is None:
+            return None
+        obj, face, t = best
+        point = np.dot(np.linalg.inv(model_view), origin + t * direction)[:3]
+        return obj, face, point
+
+    @staticmethod
+    def __face_normals(stage):
+        """
+        Данная функция считает нормали всех треугольников и маску back-face culling одной векторной операцией
+        """
+        triangles = stage['view'][stage['edges'], :3]
+        face_normals = np.cross(triangles[:, 2] - triangles[:, 0], triangles[:, 2] - triangles[:, 1])
+        # треугольник отображается, если его нормаль направлена к камере (как в Visualization.fill_triangle)
+        stage['front'] = np.dot(face_normals, np.array([0, 0, -1])) < 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stage['face_normals'] = face_normals / np.linalg.norm(face_normals, axis=1, keepdims=True)
 
     def vertex_shader(self, obj, model_view, camera_matrix, index):
         """
@@ -198,22 +408,13 @@ class WorldSpace:
         vertexes_before_ndc: вершины до перехода к NDC
         """
         # переход к lookAt системе
-        temp_vertexes = np.dot(model_view, obj.data['vertexes'][obj.data['edges'][index]].T).T
-        temp_normals = np.dot(np.linalg.inv(model_view).T, obj.data['normals'][obj.data['edges_normals'][index]].T).T
+        model, normal_matrix = self.world_data(obj)
+        vertexes = np.dot(model, obj.mesh.data['vertexes'][obj.data['edges'][index]].T)
+        normals = np.dot(normal_matrix, obj.mesh.data['normals'][obj.data['edges_normals'][index]].T)
+        temp_vertexes = np.dot(model_view, vertexes).T
+        temp_normals = np.dot(np.linalg.inv(model_view).T, normals).T
 
-        # переход к NDC координатам
+        # переход к NDC и экранным координатам
         vertexes_before_ndc = temp_vertexes.copy()
         temp_vertexes = np.dot(camera_matrix, temp_vertexes.T).T
-        if self.camera.type_camera == 1:
-            temp_vertexes[:, 0] /= -temp_vertexes[:, 3]
-            temp_vertexes[:, 1] /= -temp_vertexes[:, 3]
-            temp_vertexes[:, 2] /=  temp_vertexes[:, 3]
-
-        # переход к экранным координатам
-        temp_vertexes[:, 0] = self.width / 2 * temp_vertexes[:, 0] + self.width / 2
-        temp_vertexes[:, 1] = self.height / 2 * temp_vertexes[:, 1] + self.height / 2
-        if self.dis_x > self.dis_y:
-            temp_vertexes[:, 1] = temp_vertexes[:, 1] * self.dis_y / self.dis_x
-        else:
-            temp_vertexes[:, 0] = temp_vertexes[:, 0] * self.dis_x / self.dis_y
-        return np.rint(temp_vertexes).astype(int), temp_normals, vertexes_before_ndc
+        return self.__viewport(temp_vertexes), temp_normals, vertexes_before_ndc
@@ -0,0 +1,170 @@
+import json
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+# этапы конвейера в порядке выполнения
+STAGES = ('load', 'world', 'vertex', 'clipping', 'raster', 'shading', 'resample')
+# пустой контекст, который возвращается при выключенном профилировании
+_NULL = nullcontext()
+
+
+class Profiler:
+    def __init__(self, history=1000):
+        """
+        Данный класс собирает время этапов конвейера и счетчики по кадрам. При выключенном профилировании
+        stage возвращает пустой контекст, а count ничего не делает, поэтому замеры почти ничего не стоят.
+        Время этапов исключающее: время вложенного этапа не входит во время внешнего.
+        :param history: количество последних кадров, которые хранятся
+        """
+        self.enabled = False
+        self.frames = deque(maxlen=history)
+        self.timers = {}
+        self.counters = {}
+        self.__stack = []  # этапы, которые сейчас выполняются, и время их последнего возобновления
+
+    def stage(self, name):
+        """
+        Данная функция возвращает контекст, время выполнения которого добавляется к этапу name
+        """
+        if not self.enabled:
+            return _NULL
+        return self.__timer(name)
+
+    @contextmanager
+    def __timer(self, name):
+        """
+        Данная функция замеряет время этапа name, приостанавливая замер внешнего этапа
+        """
+        now = perf_counter()
+        if self.__stack:  # внешний этап приостанавливается
+            outer, resumed = self.__stack[-1]
+            self.timers[outer] = self.timers.get(outer, 0.) + now - resumed
+        self.__stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = perf_counter()
+            _, resumed = self.__stack.pop()
+            self.timers[name] = self.timers.get(name, 0.) + now - resumed
+            if self.__stack:
+                self.__stack[-1][1] = now
+
+    def count(self, name, value=1):
+        """
+        Данная функция прибавляет value к счетчику name текущего кадра
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def end_frame(self):
+        """
+        Данная функция завершает кадр: замеры сохраняются в историю и обнуляются
+        :return: словарь с замерами кадра (None при выключенном профилировании)
+        """
+        if not self.enabled:
+            return None
+        counters = dict(self.counters)
+        covered = counters.get('pixels_covered', 0)
+        frame = {'times': {name: self.timers[name] for name in sorted(self.timers, key=_stage_order)},
+                 'counters': counters,
+                 'overdraw': counters.get('fragments_written', 0) / covered if covered else 0.}
+        frame['total_time'] = sum(frame['times'].values())
+        self.frames.append(frame)
+        self.timers, self.counters = {}, {}
+        return frame
+
+    def report(self):
+        """
+        Данная функция возвращает сводку по сохраненным кадрам: суммы и средние времен этапов и счетчиков
+        """
+        count = len(self.frames)
+        times, counters = {}, {}
+        for frame in self.frames:
+            for name, value in frame['times'].items():
+                times[name] = times.get(name, 0.) + value
+            for name, value in frame['counters'].items():
+                counters[name] = counters.get(name, 0) + value
+        return {'frames': count,
+                'times': {name: {'total': value, 'mean': value / count}
+                          for name, value in sorted(times.items(), key=lambda item: _stage_order(item[0]))},
+                'counters': {name: {'total': value, 'mean': value / count} for name, value in counters.items()},
+                'overdraw': sum(frame['overdraw'] for frame in self.frames) / count if count else 0.}
+
+    def to_json(self, frame=None, path=None):
+        """
+        Данная функция переводит замеры в JSON
+        :param frame: словарь кадра (по умолчанию - сводка report)
+        :param path: если передан, то JSON записывается в файл
+        :return: строка JSON
+        """
+        text = json.dumps(self.report() if frame is None else frame, indent=2)
+        if path is not None:
+            with open(path, 'w') as file:
+                file.write(text)
+        return text
+
+
+def _stage_order(name):
+    """
+    Данная функция задает порядок этапов в отчете: сначала этапы конвейера по порядку, затем остальные
+    """
+    return (STAGES.index(name), name) if name in STAGES else (len(STAGES), name)
+
+
+# общий профилировщик конвейера
+PROFILER = Profiler()
+
+
+def enable(history=None):
+    """
+    Данная функция включает профилирование и очищает историю кадров
+    :param history: количество последних кадров, которые хранятся
+    """
+    if history is not None:
+        PROFILER.frames = deque(maxlen=history)
+    PROFILER.frames.clear()
+    PROFILER.timers, PROFILER.counters = {}, {}
+    PROFILER.enabled = True
+
+
+def disable():
+    """
+    Данная функция выключает профилирование (история кадров сохраняется)
+    """
+    PROFILER.enabled = False
+
+
+def enabled():
+    """
+    Данная функция возвращает True, если профилирование включено (для замеров, которые дорого считать)
+    """
+    return PROFILER.enabled
+
+
+def stage(name):
+    """
+    Данная функция возвращает контекст замера времени этапа name общего профилировщика
+    """
+    return PROFILER.stage(name)
+
+
+def count(name, value=1):
+    """
+    Данная функция прибавляет value к счетчику name общего профилировщика
+    """
+    PROFILER.count(name, value)
+
+
+def end_frame():
+    """
+    Данная функция завершает кадр общего профилировщика
+    """
+    return PROFILER.end_frame()
+
+
+def report():
+    """
+    Данная функция возвращает сводку общего профилировщика по сохраненным кадрам
+    """
+    return PROFILER.report()